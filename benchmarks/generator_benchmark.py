@@ -0,0 +1,134 @@
+"""
+Performance benchmark of the stub generator on synthetic IDLs.
+
+Every case times lexing, parsing, building and emitting (header and code in one pass) separately
+and records the peak memory allocated in each phase. The results are written as JSON so they can be compared across commits:
+
+    PYTHONPATH=src python benchmarks/generator_benchmark.py --output benchmark.json
+    PYTHONPATH=src python benchmarks/generator_benchmark.py --functions 1 100 --parameters 10 --arrays 4096
+"""
+import io
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from argparse import ArgumentParser, Namespace
+from sys import argv
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from elasticai.stubgen.lexer import Lexer
+from elasticai.stubgen.parser import Parser
+from elasticai.stubgen.stubbuilder import StubBuilder
+
+PHASES = ('lex', 'parse', 'build', 'emit')
+SCALAR_TYPES = ('int8', 'int16', 'int32', 'int64', 'bool')
+
+
+class Case(NamedTuple):
+    functions: int
+    parameters: int
+    array_elements: int
+
+
+def synthetic_idl(case: Case) -> str:
+    # every fourth parameter is an array if arrays are requested, the others cycle through the scalar types
+    lines = ['stub bench']
+    for f in range(case.functions):
+        parameters = []
+        for p in range(case.parameters):
+            if case.array_elements > 1 and p % 4 == 0:
+                parameters.append(f'int8[{case.array_elements}] p{p}')
+            else:
+                parameters.append(f'{SCALAR_TYPES[p % len(SCALAR_TYPES)]} p{p}')
+        lines.append(f'sync fn{f} ( {", ".join(parameters)} ) : int32')
+    return '\n'.join(lines) + '\n'
+
+
+def default_cases() -> List[Case]:
+    cases = [Case(functions, 4, 1) for functions in (1, 10, 100, 1000, 10000)]
+    cases += [Case(10, parameters, 1) for parameters in (1, 10, 100, 1000)]
+    cases += [Case(10, 4, elements) for elements in (64, 4096, 65536)]
+    return cases
+
+
+def _run_phases(idl_text: str, lexer, parser, measure: Callable[[Callable], Tuple[object, float]]) \
+        -> Dict[str, float]:
+    tokens, lex = measure(lambda: list(lexer.lex(idl_text)))
+    builder = StubBuilder()
+    _, parse = measure(lambda: parser.parse(iter(tokens), state=builder))
+    stub, build = measure(builder.generate)
+    _, emit = measure(lambda: stub.compile().write(io.StringIO(), io.StringIO()))
+    return dict(zip(PHASES, (lex, parse, build, emit)))
+
+
+def _timed(action: Callable) -> Tuple[object, float]:
+    start = time.perf_counter()
+    result = action()
+    return result, time.perf_counter() - start
+
+
+def _memory_peak(action: Callable) -> Tuple[object, float]:
+    tracemalloc.start()
+    try:
+        result = action()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(case: Case, lexer, parser, repeat: int) -> Dict:
+    idl_text = synthetic_idl(case)
+    # the fastest of several runs is the least disturbed one, memory is traced in a separate run
+    # because tracing slows down every allocation
+    runs = [_run_phases(idl_text, lexer, parser, _timed) for _ in range(repeat)]
+    seconds = {phase: min(run[phase] for run in runs) for phase in PHASES}
+    peak_bytes = {phase: int(peak) for phase, peak in _run_phases(idl_text, lexer, parser, _memory_peak).items()}
+    return {**case._asdict(), 'idl_bytes': len(idl_text), 'seconds': seconds, 'peak_bytes': peak_bytes}
+
+
+def _current_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _parse_arguments(args: List[str]) -> Namespace:
+    parser = ArgumentParser(description='Benchmark the stub generator on synthetic IDLs.')
+    parser.add_argument('--functions', nargs='+', type=int, metavar='N',
+                        help='numbers of functions, combined with every number of parameters')
+    parser.add_argument('--parameters', nargs='+', type=int, default=[4], metavar='N',
+                        help='numbers of parameters per function (default: 4)')
+    parser.add_argument('--arrays', nargs='+', type=int, default=[1], metavar='ELEMENTS',
+                        help='elements of every fourth parameter, 1 means no arrays (default: 1)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (default: 3)')
+    parser.add_argument('--output', metavar='FILE', help='write the results as JSON to FILE')
+    return parser.parse_args(args)
+
+
+def _main(args: List[str]) -> None:
+    arguments = _parse_arguments(args)
+    if arguments.functions:
+        cases = [Case(functions, parameters, elements) for functions in arguments.functions
+                 for parameters in arguments.parameters for elements in arguments.arrays]
+    else:
+        cases = default_cases()
+    lexer = Lexer().get_lexer()
+    parser = Parser().get_parser()
+    results = []
+    for case in cases:
+        result = run_case(case, lexer, parser, arguments.repeat)
+        results.append(result)
+        timings = ' '.join(f'{phase} {result["seconds"][phase] * 1000:9.1f} ms' for phase in PHASES)
+        print(f'{case.functions:6} functions {case.parameters:5} parameters {case.array_elements:6} elements: '
+              f'{timings}  peak {max(result["peak_bytes"].values()) / 2 ** 20:8.1f} MiB', flush=True)
+    if arguments.output:
+        report = {'commit': _current_commit(), 'python': platform.python_version(), 'cases': results}
+        with open(arguments.output, 'w') as writer:
+            json.dump(report, writer, indent=2)
+
+
+if __name__ == '__main__':
+    _main(argv[1:])
@@ -0,0 +1,154 @@
+"""
+Memory used by the intermediate representation of large machine-generated stubs.
+
+Builds stubs with many parameters and reports the bytes retained per parameter after the stub was
+generated, i.e. the footprint of the Variable, Function and Stub objects. The same functions are also
+built with a copy of the dict-based classes the IR used before it was slotted, so every case reports
+the reduction against that baseline:
+
+    PYTHONPATH=src python benchmarks/ir_memory_benchmark.py --output ir_memory.json
+"""
+import gc
+import json
+import tracemalloc
+from argparse import ArgumentParser, Namespace
+from sys import argv
+from typing import Callable, Dict, List
+
+from elasticai.stubgen.lexer import Lexer
+from elasticai.stubgen.parser import Parser
+from elasticai.stubgen.stubbuilder import StubBuilder
+from elasticai.stubgen.variable import Variable
+
+SCALAR_TYPES = ('int8', 'int16', 'int32', 'int64', 'bool')
+
+
+def synthetic_idl(functions: int, parameters: int) -> str:
+    lines = ['stub bench']
+    for f in range(functions):
+        declarations = ', '.join(f'{SCALAR_TYPES[p % len(SCALAR_TYPES)]} p{p}' for p in range(parameters))
+        lines.append(f'sync fn{f} ( {declarations} ) : int32')
+    return '\n'.join(lines) + '\n'
+
+
+class _DictVariable:
+    """Variable before the slotted IR, its attributes live in a per-instance __dict__."""
+
+    def __init__(self, v_type: Variable.Type, name: str, elements: int = 1, scope=Variable.Scope.STUB,
+                 value=None) -> None:
+        self.type = v_type
+        self.identifier = name
+        self.elements = elements
+        self.scope = scope
+        self.value = value
+
+
+class _DictSyncFunction:
+    """SyncFunction before the slotted IR, with its parameters in a list and its offsets in a tuple."""
+
+    def __init__(self, identifier: str, return_type: Variable.Type, arguments: List[_DictVariable]) -> None:
+        self._identifier = identifier
+        self._result_var = _DictVariable(return_type, '_result', scope=Variable.Scope.RETURN)
+        self._input_variables = arguments
+        self.is_private = False
+        offsets = []
+        offset = 0
+        for argument in arguments:
+            offsets.append(offset)
+            offset += argument.elements * argument.type.get_length_in_byte()
+        # the layout was a NamedTuple of the offsets and the input length
+        self._layout = (tuple(offsets), offset)
+        self._signatures = None
+        self._transfer_mode = None
+        self._read_mode = None
+        self._read_width = 1
+        self._session_var = None
+        self._batch_size = None
+        self._pipeline_banks_var = None
+        self._wait = None
+        self._staging_buffer = _DictVariable(Variable.Type.UINT8, '_inputs', offset, scope=Variable.Scope.LOCAL)
+
+
+class _DictStub:
+    """Stub before the slotted IR, reduced to the containers that hold the functions."""
+
+    def __init__(self, name: str, functions: List[_DictSyncFunction]) -> None:
+        self._name = name
+        self._body_comment = ''
+        self._relative_path_to_middleware_header = ''
+        self.functions = functions
+        self._helper_functions = []
+        self._system_functions = []
+        self._hook_functions = []
+        self.variables = dict()
+
+
+def _retained_bytes(build: Callable[[], object]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    ir = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del ir
+    return retained
+
+
+def _generate(tokens: List, parser) -> object:
+    builder = StubBuilder()
+    parser.parse(iter(tokens), state=builder)
+    # the builder is temporary, only the generated stub is kept while the code is emitted
+    return builder.generate()
+
+
+def _generate_baseline(builder: StubBuilder) -> _DictStub:
+    functions = []
+    for function in builder.functions:
+        arguments = [_DictVariable(parameter.type, parameter.identifier, parameter.elements, parameter.scope)
+                     for parameter in function.parameters]
+        functions.append(_DictSyncFunction(function.name, function.returnType, arguments))
+    return _DictStub('bench', functions)
+
+
+def measure(functions: int, parameters: int, lexer, parser) -> Dict:
+    tokens = list(lexer.lex(synthetic_idl(functions, parameters)))
+    retained = _retained_bytes(lambda: _generate(tokens, parser))
+    # the baseline is built from parsed functions, only the copies in the old shape are traced
+    builder = StubBuilder()
+    parser.parse(iter(tokens), state=builder)
+    baseline_retained = _retained_bytes(lambda: _generate_baseline(builder))
+    return {'functions': functions, 'parameters': parameters, 'retained_bytes': retained,
+            'bytes_per_parameter': retained / (functions * parameters),
+            'baseline_retained_bytes': baseline_retained,
+            'baseline_bytes_per_parameter': baseline_retained / (functions * parameters),
+            'reduction': 1 - retained / baseline_retained}
+
+
+def _parse_arguments(args: List[str]) -> Namespace:
+    parser = ArgumentParser(description='Measure the memory retained by generated stubs.')
+    parser.add_argument('--functions', type=int, default=10, help='functions per stub (default: 10)')
+    parser.add_argument('--parameters', nargs='+', type=int, default=[100, 1000, 10000], metavar='N',
+                        help='parameters per function (default: 100 1000 10000)')
+    parser.add_argument('--output', metavar='FILE', help='write the results as JSON to FILE')
+    return parser.parse_args(args)
+
+
+def _main(args: List[str]) -> None:
+    arguments = _parse_arguments(args)
+    lexer = Lexer().get_lexer()
+    parser = Parser().get_parser()
+    results = []
+    for parameters in arguments.parameters:
+        result = measure(arguments.functions, parameters, lexer, parser)
+        results.append(result)
+        print(f'{arguments.functions:6} functions {parameters:6} parameters: '
+              f'{result["retained_bytes"] / 2 ** 20:8.2f} MiB retained, '
+              f'{result["bytes_per_parameter"]:6.1f} bytes per parameter '
+              f'(baseline {result["baseline_bytes_per_parameter"]:6.1f}, {result["reduction"]:4.0%} less)', flush=True)
+    if arguments.output:
+        with open(arguments.output, 'w') as writer:
+            json.dump({'cases': results}, writer, indent=2)
+
+
+if __name__ == '__main__':
+    _main(argv[1:])
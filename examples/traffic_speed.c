@@ -29,7 +29,7 @@ bool traffic_speed_deploy(void)
    return is_deployed_successfully;
 }
 
-int8_t traffic_speed_predict(int8_t *inputs, bool more_inputs)
+int8_t traffic_speed_predict(const int8_t *inputs, bool more_inputs)
 {
    int8_t _result;
 
@@ -41,10 +41,7 @@ int8_t traffic_speed_predict(int8_t *inputs, bool more_inputs)
 
    while( middlewareUserlogicGetBusyStatus() );
    modelCompute(false);
-   for(int i = 0; i < 1; i++){
-     middlewareReadBlocking(ADDR_SKELETON_INPUTS+0+i, (uint8_t *)(&_result)+i, 1);
-     middlewareReadBlocking(ADDR_SKELETON_INPUTS+0+i, (uint8_t *)(&_result)+i, 1);
-   }
+   middlewareReadBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(&_result)+0, 1);
    modelCompute(false);
    middlewareUserlogicDisable();
    middlewareDeinit();
@@ -5,6 +5,6 @@
 #include <stdint.h>
 
 bool traffic_speed_deploy(void);
-int8_t traffic_speed_predict(int8_t *inputs, bool more_inputs);
+int8_t traffic_speed_predict(const int8_t *inputs, bool more_inputs);
 
 #endif
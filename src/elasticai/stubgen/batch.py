@@ -0,0 +1,120 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from elasticai.stubgen.incremental import HashManifest, file_hash
+from elasticai.stubgen.lexer import get_shared_lexer
+from elasticai.stubgen.parser import get_shared_parser
+
+
+# generates the stub files of an IDL file and returns the content hash of each written output
+Generator = Callable[[str], Dict[str, str]]
+
+
+class BatchResult(NamedTuple):
+    idl_file: str
+    seconds: float
+    error: Optional[str] = None
+    skipped: bool = False
+    output_hashes: Optional[Dict[str, str]] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+def collect_idl_files(sources: Iterable[str], manifest: Optional[str] = None) -> List[str]:
+    idl_files: List[str] = []
+    for source in sources:
+        idl_files.extend(_expand_source(source))
+    if manifest is not None:
+        idl_files.extend(_read_manifest(manifest))
+    return _without_duplicates(idl_files)
+
+
+def _expand_source(source: str) -> List[str]:
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, '**', '*.idl'), recursive=True))
+    elif os.path.isfile(source):
+        return [source]
+    else:
+        return sorted(glob.glob(source, recursive=True))
+
+
+def _read_manifest(manifest: str) -> List[str]:
+    # one directory, glob or file per line, relative to the manifest, '#' starts a comment
+    base_dir = os.path.dirname(manifest)
+    idl_files: List[str] = []
+    with open(manifest, 'r') as reader:
+        for line in reader:
+            entry = line.split('#', 1)[0].strip()
+            if entry:
+                idl_files.extend(_expand_source(os.path.join(base_dir, entry)))
+    return idl_files
+
+
+def _without_duplicates(idl_files: List[str]) -> List[str]:
+    seen = set()
+    result: List[str] = []
+    for idl_file in idl_files:
+        key = os.path.normpath(idl_file)
+        if key not in seen:
+            seen.add(key)
+            result.append(idl_file)
+    return result
+
+
+def generate_batch(idl_files: List[str], generate: Generator, jobs: int = 1,
+                   manifest: Optional[HashManifest] = None) -> List[BatchResult]:
+    idl_hashes = {idl_file: file_hash(idl_file) for idl_file in idl_files} if manifest else {}
+    results: Dict[str, BatchResult] = {}
+    pending: List[str] = []
+    for idl_file in idl_files:
+        if manifest is not None and manifest.is_up_to_date(idl_file, idl_hashes[idl_file]):
+            results[idl_file] = BatchResult(idl_file, 0.0, skipped=True)
+        else:
+            pending.append(idl_file)
+    for result in _generate_all(pending, generate, jobs):
+        results[result.idl_file] = result
+        if manifest is not None and result.succeeded:
+            manifest.record(result.idl_file, idl_hashes[result.idl_file], result.output_hashes)
+    if manifest is not None:
+        manifest.save()
+    return [results[idl_file] for idl_file in idl_files]
+
+
+def _generate_all(idl_files: List[str], generate: Generator, jobs: int) -> List[BatchResult]:
+    # build lexer and parser before forking, so that the workers inherit them
+    get_shared_lexer()
+    get_shared_parser()
+    if jobs <= 1 or len(idl_files) <= 1:
+        return [_timed_generation(generate, idl_file) for idl_file in idl_files]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_timed_generation, [generate] * len(idl_files), idl_files))
+
+
+def _timed_generation(generate: Generator, idl_file: str) -> BatchResult:
+    start = time.perf_counter()
+    try:
+        output_hashes = generate(idl_file)
+    except Exception as error:
+        return BatchResult(idl_file, time.perf_counter() - start, f'{type(error).__name__}: {error}')
+    return BatchResult(idl_file, time.perf_counter() - start, output_hashes=output_hashes)
+
+
+def print_report(results: List[BatchResult], wall_clock_seconds: float, jobs: int) -> None:
+    for result in results:
+        if result.skipped:
+            print(f'  unchanged    {result.idl_file}')
+        elif result.succeeded:
+            print(f'{result.seconds * 1000:9.2f} ms  {result.idl_file}')
+        else:
+            print(f'   FAILED     {result.idl_file}: {result.error}')
+    generated = [result for result in results if result.succeeded and not result.skipped]
+    skipped = [result for result in results if result.skipped]
+    cpu_seconds = sum(result.seconds for result in generated)
+    average_ms = cpu_seconds * 1000 / len(generated) if generated else 0.0
+    print(f'Generated {len(generated)} of {len(results)} stubs, skipped {len(skipped)} unchanged, '
+          f'in {wall_clock_seconds:.3f} s ({jobs} worker(s), {average_ms:.2f} ms per stub on average)')
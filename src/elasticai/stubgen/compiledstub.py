@@ -0,0 +1,51 @@
+from typing import NamedTuple, TextIO, Tuple
+
+from elasticai.stubgen.function import Function, WriterC
+
+
+class CompiledFunction(NamedTuple):
+    prototype: str
+    function: Function
+
+
+class CompiledStub:
+    """
+    A stub whose includes, variables and prototypes are rendered once. The header and the code
+    are written from it in a single walk over the functions.
+    """
+
+    def __init__(self, header_opening: str, header_closing: str, code_opening: str,
+                 exported: Tuple[CompiledFunction, ...], helpers: Tuple[Function, ...]) -> None:
+        self._header_opening = header_opening
+        self._header_closing = header_closing
+        self._code_opening = code_opening
+        self._exported = exported
+        self._helpers = helpers
+
+    def write(self, header_sink: TextIO, code_sink: TextIO) -> None:
+        header, code = WriterC(header_sink), WriterC(code_sink)
+        header.write(self._header_opening)
+        code.write(self._code_opening)
+        for compiled in self._exported:
+            header.write(compiled.prototype)
+            compiled.function.write_c_code(code)
+        header.write(self._header_closing)
+        self._write_helpers(code)
+
+    def write_c_header(self, sink: TextIO) -> None:
+        header = WriterC(sink)
+        header.write(self._header_opening)
+        for compiled in self._exported:
+            header.write(compiled.prototype)
+        header.write(self._header_closing)
+
+    def write_c_code(self, sink: TextIO) -> None:
+        code = WriterC(sink)
+        code.write(self._code_opening)
+        for compiled in self._exported:
+            compiled.function.write_c_code(code)
+        self._write_helpers(code)
+
+    def _write_helpers(self, code: WriterC) -> None:
+        for function in self._helpers:
+            function.write_c_code(code)
@@ -0,0 +1,51 @@
+from typing import List, NamedTuple, Optional, Sequence
+
+
+class Diagnostic(NamedTuple):
+    """An error found in an IDL file, line and column count from 1 like the positions of the lexer."""
+    message: str
+    line: Optional[int] = None
+    column: Optional[int] = None
+    length: int = 1
+
+    @staticmethod
+    def at(position, message: str, length: int = 1) -> 'Diagnostic':
+        # position is the source position of a token, None if the error belongs to the whole stub
+        if position is None:
+            return Diagnostic(message)
+        return Diagnostic(message, position.lineno, position.colno, max(length, 1))
+
+    def format(self, file_name: str = '<idl>', source: Optional[str] = None) -> str:
+        if self.line is None:
+            return f'{file_name}: error: {self.message}'
+        result = f'{file_name}:{self.line}:{self.column}: error: {self.message}'
+        source_lines = source.splitlines() if source is not None else []
+        if self.line <= len(source_lines):
+            source_line = source_lines[self.line - 1]
+            result += f'\n    {source_line}\n    {" " * (self.column - 1)}^{"~" * (self.length - 1)}'
+        return result
+
+
+def unexpected_character(index: int, source: str) -> Diagnostic:
+    # the lexer reports the column of the last token, the position is recomputed from the index
+    line, column = source.count('\n', 0, index) + 1, index - source.rfind('\n', 0, index)
+    return Diagnostic(f"Unexpected character '{source[index]}'.", line, column)
+
+
+class IdlError(ValueError):
+    """All errors of an IDL file, reported together instead of stopping at the first one."""
+
+    def __init__(self, diagnostics: Sequence[Diagnostic], file_name: str = '<idl>',
+                 source: Optional[str] = None) -> None:
+        self.diagnostics: List[Diagnostic] = sorted(diagnostics, key=_source_order)
+        self.file_name = file_name
+        self.source = source
+        super().__init__(str(self))
+
+    def __str__(self) -> str:
+        return '\n'.join(diagnostic.format(self.file_name, self.source) for diagnostic in self.diagnostics)
+
+
+def _source_order(diagnostic: Diagnostic):
+    # errors without a position concern the whole stub and come last
+    return diagnostic.line is None, diagnostic.line or 0, diagnostic.column or 0
@@ -1,4 +1,7 @@
-from typing import List
+import io
+from array import array
+from enum import Enum
+from typing import Dict, List, NamedTuple, Optional, TextIO, Tuple
 
 from elasticai.stubgen.variable import Variable
 
@@ -7,63 +10,239 @@ def _formatted_body_line(line: str) -> str:
     return f'   {line};\n'
 
 
+def _indented(body: str) -> str:
+    return ''.join(f'   {line}' for line in body.splitlines(keepends=True))
+
+
 class WriterC:
+    """Passes the generated code on to a file-like sink, one fragment at a time."""
+    __slots__ = ('_sink',)
 
-    def signature(self, static: bool, identifier: str, result_var: Variable, parameters: List[Variable]) -> None:
-        result: str = ''
-        if static:
-            result += 'static '
-        result += f'{result_var.type.as_c_code()} {identifier}'
-        result += f'({self._parameter_list_as_c(parameters)})'
-        print(result)
+    def __init__(self, sink: TextIO) -> None:
+        self._sink = sink
 
-    @staticmethod
-    def _parameter_list_as_c(parameters: List[Variable]) -> str:
-        if not parameters:
-            return Variable.Type.VOID.as_c_code()
-        else:
-            result: str = ''
-            for param in parameters:
-                result += param.as_parameter_in_signature() + ', '
-            result = result[:-2]
-            return result
+    def write(self, text: str) -> None:
+        self._sink.write(text)
 
-    @staticmethod
-    def open_block():
-        print('{\n')
+    def function(self, signature: str, body: str) -> None:
+        self.write(f'{signature}\n')
+        self.open_block()
+        self.write(body)
+        self.close_block()
+
+    def open_block(self) -> None:
+        self.write('{\n')
+
+    def close_block(self) -> None:
+        self.write('}\n\n')
+
+
+# passed as timeout to the wait helpers and the <stub>_wait_for_completion() hook to wait without timeout
+WAIT_FOREVER = 'STUB_WAIT_FOREVER'
+
+
+class WaitStrategy:
+    __slots__ = ('kind', 'interval_ms', 'timeout_ms')
+
+    class Kind(Enum):
+        SPIN = 'spin'  # poll the busy status as fast as possible
+        POLL = 'poll'  # sleep for a fixed interval between two polls
+        BACKOFF = 'backoff'  # double the sleep interval after every poll, up to a maximum
+        YIELD = 'yield'  # call the application's <stub>_yield() hook between two polls
+        INTERRUPT = 'interrupt'  # block in the application's <stub>_wait_for_completion() hook
+
+    def __init__(self, kind: Kind = Kind.SPIN, interval_ms: Optional[int] = None,
+                 timeout_ms: Optional[int] = None) -> None:
+        needs_interval = kind in (WaitStrategy.Kind.POLL, WaitStrategy.Kind.BACKOFF)
+        if needs_interval and (interval_ms is None or interval_ms < 1):
+            raise ValueError(f"Waiting with {kind.value} needs an interval of at least 1 ms.")
+        if not needs_interval and interval_ms is not None:
+            raise ValueError(f"Waiting with {kind.value} does not take an interval.")
+        if timeout_ms is not None and timeout_ms < 1:
+            raise ValueError(f"Timeout must be at least 1 ms, got {timeout_ms}.")
+        self.kind = kind
+        self.interval_ms = interval_ms
+        self.timeout_ms = timeout_ms
+
+    def has_timeout(self) -> bool:
+        return self.timeout_ms is not None
+
+    def needs_clock(self) -> bool:
+        return self.has_timeout() and self.kind in (WaitStrategy.Kind.SPIN, WaitStrategy.Kind.YIELD)
+
+    def get_helper_identifier(self) -> Optional[str]:
+        if self.kind == WaitStrategy.Kind.SPIN and not self.has_timeout():
+            return None
+        identifier = f'wait{self.kind.value.capitalize()}'
+        if self.kind == WaitStrategy.Kind.YIELD and self.has_timeout():
+            identifier += 'Timeout'
+        return identifier
+
+    def as_c_call(self) -> str:
+        arguments = []
+        if self.interval_ms is not None:
+            arguments.append(str(self.interval_ms))
+        if self.kind != WaitStrategy.Kind.YIELD or self.has_timeout():
+            arguments.append(str(self.timeout_ms) if self.has_timeout() else WAIT_FOREVER)
+        return f'{self.get_helper_identifier()}({", ".join(arguments)})'
+
+
+class BusFormat:
+    """How the skeleton expects data on the bus: the width of a bus word and the byte order of its values."""
+    __slots__ = ('word_width', 'byte_order')
+
+    class ByteOrder(Enum):
+        LITTLE = 'little'
+        BIG = 'big'
+
+    def __init__(self, word_width: int = 8, byte_order: Optional[ByteOrder] = None) -> None:
+        if word_width not in (8, 16, 32):
+            raise ValueError(f"Bus word width must be 8, 16 or 32 bits, got {word_width}.")
+        self.word_width = word_width
+        # without a byte order the values are transferred in the byte order of the host
+        self.byte_order = byte_order
+
+    def get_word_length_in_byte(self) -> int:
+        return self.word_width // 8
+
+    def swaps(self, variable: Variable) -> bool:
+        # single bytes look the same in both byte orders
+        return self.byte_order is not None and variable.type.get_length_in_byte() > 1
+
+
+class MemoryMap:
+    """
+    The regions of the skeleton: parameters are written to the inputs, results are read from the outputs
+    and writing to the control address starts the computation. Without an output region, the skeleton
+    overwrites the inputs with its outputs.
+    """
+    __slots__ = ('inputs', 'outputs', 'control')
+
+    class Region(NamedTuple):
+        address: int
+        size: int
+
+        def contains(self, address: int) -> bool:
+            return self.address <= address < self.address + self.size
+
+        def overlaps(self, other: 'MemoryMap.Region') -> bool:
+            return self.address < other.address + other.size and other.address < self.address + self.size
+
+    def __init__(self, inputs: Region = Region(0, 100), control: int = 100, outputs: Optional[Region] = None) -> None:
+        for name, region in (('input', inputs), ('output', outputs)):
+            if region is None:
+                continue
+            if region.size < 1:
+                raise ValueError(f"The {name} region must be at least 1 byte, got {region.size}.")
+            if region.contains(control):
+                raise ValueError(f"The {name} region {region.address}..{region.address + region.size - 1} "
+                                 f"contains the control address {control}.")
+        if outputs is not None and outputs.overlaps(inputs):
+            raise ValueError("The input and output regions overlap.")
+        self.inputs = inputs
+        self.outputs = outputs
+        self.control = control
+
+    def has_output_region(self) -> bool:
+        return self.outputs is not None
+
+    def get_output_region(self) -> Region:
+        return self.outputs if self.outputs is not None else self.inputs
+
+
+class ParameterLayout(NamedTuple):
+    """Where the parameters of a function are placed in the skeleton, computed once per function."""
+    offsets: array  # unsigned machine words instead of one int object per parameter
+    input_length: int
+    # the outputs start with the result, followed by the output parameters
+    output_offsets: array
+    output_length: int
 
     @staticmethod
-    def close_block():
-        print('}\n\n')
+    def of(parameters: List[Variable], result_length: int = 0, max_alignment: int = 1) -> 'ParameterLayout':
+        # every parameter starts at a multiple of its natural alignment, but at most of max_alignment
+        offsets, output_offsets = array('L'), array('L')
+        input_length, output_length = 0, result_length
+        for parameter in parameters:
+            alignment = min(parameter.type.get_alignment_in_byte(), max_alignment)
+            if parameter.is_input():
+                input_length = _aligned(input_length, alignment)
+            if parameter.is_output():
+                output_length = _aligned(output_length, alignment)
+            offsets.append(input_length)
+            output_offsets.append(output_length)
+            if parameter.is_input():
+                input_length += parameter.get_length_in_byte()
+            if parameter.is_output():
+                output_length += parameter.get_length_in_byte()
+        return ParameterLayout(offsets, input_length, output_offsets, output_length)
+
+
+def _aligned(offset: int, alignment: int) -> int:
+    return (offset + alignment - 1) // alignment * alignment
 
 
 class Function:
+    # a stub can have thousands of functions, none of them needs a per-instance __dict__
+    __slots__ = ('_identifier', '_result_var', '_input_variables', 'is_private', '_layout', '_signatures')
 
-    def __init__(self, identifier: str, return_type: Variable.Type, arguments=None, is_private=False) -> None:
+    def __init__(self, identifier: str, return_type: Variable.Type, arguments=None, is_private=False,
+                 return_elements: int = 1, max_alignment: int = 1) -> None:
         if arguments is None:
             arguments = []
         self._identifier = identifier
-        self._result_var = Variable(return_type, '_result', scope=Variable.Scope.RETURN)
-        self._input_variables: List[Variable] = arguments
+        self._result_var = Variable(return_type, '_result', return_elements, scope=Variable.Scope.RETURN)
+        self._input_variables: Tuple[Variable, ...] = tuple(arguments)
         self.is_private = is_private
+        self._layout = ParameterLayout.of(arguments, self._result_var.get_length_in_byte(), max_alignment)
+        self._signatures: Optional[Dict[str, str]] = None
 
     def as_c_code(self) -> str:
-        result: str = f'{self._signature_as_c()}\n' \
-                      f'{{\n' \
-                      f'{self._body_as_c()}' \
-                      f'}}\n\n'
-        # self.as_c_code_()
-        return result
+        buffer = io.StringIO()
+        self.write_c_code(WriterC(buffer))
+        return buffer.getvalue()
 
-    def as_c_code_(self) -> None:
-        writer = WriterC()
-        writer.signature(self.is_private, self._identifier, self._result_var, self._input_variables)
-        # self._write_body(writer)
-        writer.open_block()
-        writer.close_block()
+    def write_c_code(self, writer: WriterC) -> None:
+        writer.function(self.get_signature(), self._body_as_c())
 
     def as_c_prototype(self) -> str:
-        return f'{self._signature_as_c()};\n'
+        return f'{self.get_signature()};\n'
+
+    def get_signature(self, variant: str = '') -> str:
+        # rendered on first use only, prototype and definition share the same text
+        if self._signatures is None:
+            self._signatures = self._signatures_as_c()
+        return self._signatures[variant]
+
+    def get_layout(self) -> ParameterLayout:
+        return self._layout
+
+    def get_identifier(self) -> str:
+        return self._identifier
+
+    def get_required_system_headers(self) -> List[str]:
+        return []
+
+    def get_required_interface_headers(self) -> List[str]:
+        return []
+
+    def get_wait_strategy(self) -> Optional[WaitStrategy]:
+        return None
+
+    def get_profile_id(self) -> Optional[str]:
+        return None
+
+    def swaps_inputs(self) -> bool:
+        return False
+
+    def uses_dma(self) -> bool:
+        return False
+
+    def swaps_outputs(self) -> bool:
+        return False
+
+    def _signatures_as_c(self) -> Dict[str, str]:
+        return {'': self._signature_as_c()}
 
     def _signature_as_c(self) -> str:
         result: str = ''
@@ -77,107 +256,506 @@ class Function:
         if not self._input_variables:
             return Variable.Type.VOID.as_c_code()
         else:
-            result: str = ''
-            for param in self._input_variables:
-                result += param.as_parameter_in_signature() + ', '
-            result = result[:-2]
-            return result
+            return ', '.join(param.as_parameter_in_signature() for param in self._input_variables)
 
     def _body_as_c(self) -> str:
         raise NotImplementedError
 
 
 class SyncFunction(Function):
+    __slots__ = ('_transfer_mode', '_read_mode', '_read_width', '_session_var', '_batch_size',
+                 '_pipeline_banks_var', '_wait', '_staging_buffer', '_profile_prefix', '_bus', '_dma_threshold',
+                 '_memory')
+
+    class TransferMode(Enum):
+        SEPARATE = 'separate'  # one write transaction per parameter
+        PACKED = 'packed'  # all parameters are staged in one buffer and written at once
+
+    class ReadMode(Enum):
+        BULK = 'bulk'  # the whole result is read with one transaction
+        ALIGNED = 'aligned'  # the result is read in chunks that do not cross a word boundary
+
+    def __init__(self, identifier: str, return_type: Variable.Type, arguments=None,
+                 transfer_mode: TransferMode = TransferMode.SEPARATE,
+                 read_mode: ReadMode = ReadMode.BULK, read_width: int = 1,
+                 session_var: Optional[Variable] = None, batch_size: Optional[int] = None,
+                 pipeline_banks_var: Optional[Variable] = None,
+                 wait_strategy: Optional[WaitStrategy] = None, return_elements: int = 1,
+                 profile_prefix: Optional[str] = None, bus_format: Optional[BusFormat] = None,
+                 dma_threshold: Optional[int] = None, memory_map: Optional[MemoryMap] = None) -> None:
+        bus_format = bus_format if bus_format is not None else BusFormat()
+        super().__init__(identifier, return_type, arguments, return_elements=return_elements,
+                         max_alignment=bus_format.get_word_length_in_byte())
+        self._bus = bus_format
+        self._transfer_mode = transfer_mode
+        self._read_mode = read_mode
+        self._read_width = read_width
+        # in a session the middleware is initialized by <stub>_open() instead of by every call
+        self._session_var = session_var
+        # with a batch size, an additional <function>_batch variant processes up to this many samples per call
+        self._batch_size = batch_size
+        # with input banks, an additional <function>_pipelined variant transfers the next sample while
+        # the current one is computed
+        self._pipeline_banks_var = pipeline_banks_var
+        # with a timeout, the function returns whether it succeeded and passes its result by pointer
+        self._wait = wait_strategy if wait_strategy is not None else WaitStrategy()
+        self._staging_buffer = Variable(Variable.Type.UINT8, '_inputs', self._layout.input_length,
+                                        scope=Variable.Scope.LOCAL)
+        # with a profile prefix, every phase of a call is wrapped in the STUB_PROF_BEGIN/END macros
+        self._profile_prefix = profile_prefix
+        # writes of at least this many bytes are started as DMA transfers and overlap the other writes
+        self._dma_threshold = dma_threshold
+        self._memory = memory_map if memory_map is not None else MemoryMap()
+
+    def get_required_system_headers(self) -> List[str]:
+        headers = []
+        if self._is_packing_inputs():
+            headers.append('string.h')
+        if self._is_in_session() or self._has_batch_variant():
+            headers.append('assert.h')
+        return headers
+
+    def get_required_interface_headers(self) -> List[str]:
+        if self._has_batch_variant() or self._has_pipelined_variant():
+            return ['stddef.h']
+        else:
+            return []
+
+    def get_wait_strategy(self) -> WaitStrategy:
+        return self._wait
+
+    def get_profile_id(self) -> Optional[str]:
+        return self._identifier.upper() if self._profile_prefix is not None else None
+
+    def get_bus_format(self) -> BusFormat:
+        return self._bus
+
+    def swaps_inputs(self) -> bool:
+        return any(self._bus.swaps(param) for param in self._input_variables if param.is_input())
+
+    def uses_dma(self) -> bool:
+        if self._is_packing_inputs():
+            return self._is_dma_transfer(self._layout.input_length)
+        return any(self._is_dma_transfer(param.get_length_in_byte())
+                   for param in self._input_variables if param.is_input())
+
+    def _is_dma_transfer(self, length: int) -> bool:
+        return self._dma_threshold is not None and length >= self._dma_threshold
+
+    def swaps_outputs(self) -> bool:
+        swaps_result = self._is_returning_result() and self._bus.swaps(self._result_var)
+        return swaps_result or any(self._bus.swaps(param) for param in self._input_variables if param.is_output())
+
+    def as_c_prototype(self) -> str:
+        result = super().as_c_prototype()
+        if self._has_batch_variant():
+            result += f'#define {self._max_batch_define()} {self._batch_size}\n' \
+                      f'{self.get_signature("batch")};\n'
+        if self._has_pipelined_variant():
+            result += f'{self.get_signature("pipelined")};\n'
+        return result
+
+    def write_c_code(self, writer: WriterC) -> None:
+        super().write_c_code(writer)
+        if self._has_batch_variant():
+            writer.function(self.get_signature('batch'), self._batch_body_as_c())
+        if self._has_pipelined_variant():
+            writer.function(self.get_signature('pipelined'), self._pipelined_body_as_c())
+
+    def _signatures_as_c(self) -> Dict[str, str]:
+        signatures = super()._signatures_as_c()
+        if self._has_batch_variant():
+            signatures['batch'] = self._batch_signature_as_c('batch')
+        if self._has_pipelined_variant():
+            signatures['pipelined'] = self._batch_signature_as_c('pipelined')
+        return signatures
+
+    def _has_batch_variant(self) -> bool:
+        return self._batch_size is not None
+
+    def _max_batch_define(self) -> str:
+        return f'{self._identifier.upper()}_MAX_BATCH'
+
+    def _has_pipelined_variant(self) -> bool:
+        return self._pipeline_banks_var is not None
+
+    def _batch_signature_as_c(self, suffix: str) -> str:
+        parameters = [param.as_batch_parameter_in_signature() for param in self._input_variables]
+        parameters.append('size_t n')
+        if self._is_returning_result():
+            parameters.append(f'{self._result_var.type.as_c_code()} *results')
+        return_type = 'bool' if self._wait.has_timeout() else 'void'
+        return f'{return_type} {self._identifier}_{suffix}({", ".join(parameters)})'
+
+    def _batch_body_as_c(self) -> str:
+        sample_body = self._send_data_to_fpga('i') + \
+            self._start_computation() + \
+            self._block_until_ready()
+        if self._is_receiving_outputs():
+            sample_body += self._retrieve_result('i')
+        else:
+            sample_body += _formatted_body_line('modelCompute(false)')
+        result = ''
+        if self._is_staging_inputs():
+            result += self._staging_buffer.as_definition() + '\n'
+        result += _formatted_body_line(f'assert(n <= {self._max_batch_define()})')
+        result += self._enable_fpga()
+        result += '   for(size_t i = 0; i < n; i++){\n'
+        result += _indented(sample_body)
+        result += '   }\n'
+        return result + self._stop_fpga_after_samples()
+
+    def _stop_fpga_after_samples(self) -> str:
+        result = ''
+        if not self._is_in_session():
+            result += _formatted_body_line('middlewareUserlogicDisable()') + \
+                _formatted_body_line('middlewareDeinit()')
+        if self._wait.has_timeout():
+            result += _formatted_body_line('return true')
+        return result
+
+    def _pipelined_body_as_c(self) -> str:
+        banks = self._pipeline_banks_var.identifier
+        depth = self._pipeline_banks_var.elements
+        sample_body = _formatted_body_line('size_t next = i + 1') + \
+            '   if(next < n){\n' + \
+            _indented(self._send_data_to_fpga('next', f'{banks}[next%{depth}]')) + \
+            '   }\n' + \
+            self._block_until_ready()
+        if self._is_receiving_outputs():
+            sample_body += self._retrieve_result('i', f'{banks}[i%{depth}]')
+        else:
+            sample_body += _formatted_body_line('modelCompute(false)')
+        sample_body += '   if(next < n)\n' + \
+            _indented(_formatted_body_line(f'modelComputeBank(next%{depth})'))
+        result = ''
+        if self._is_staging_inputs():
+            result += self._staging_buffer.as_definition() + '\n'
+        result += self._enable_fpga()
+        result += '   if(n > 0){\n'
+        result += _indented(self._send_data_to_fpga('0', f'{banks}[0]'))
+        result += _indented(_formatted_body_line('modelComputeBank(0)'))
+        result += '   }\n'
+        result += '   for(size_t i = 0; i < n; i++){\n'
+        result += _indented(sample_body)
+        result += '   }\n'
+        return result + self._stop_fpga_after_samples()
+
+    def _signature_as_c(self) -> str:
+        if not self._returns_through_pointer():
+            return super()._signature_as_c()
+        parameters = [param.as_parameter_in_signature() for param in self._input_variables]
+        if self._is_returning_result():
+            parameters.append(f'{self._result_var.type.as_c_code()} *result')
+        return_type = 'bool' if self._wait.has_timeout() else 'void'
+        return f'{return_type} {self._identifier}({", ".join(parameters) or Variable.Type.VOID.as_c_code()})'
+
+    def _returns_through_pointer(self) -> bool:
+        # C cannot return arrays, and with a timeout the return value reports success instead
+        return self._wait.has_timeout() or self._result_var.elements > 1
+
+    def _is_in_session(self) -> bool:
+        return self._session_var is not None
 
     def _body_as_c(self) -> str:
-        target_address = 0
         return self._define_local_vars() + \
-            self._enable_fpga() + \
-            self._run_accelerator() + \
-            self._block_until_ready() + \
-            self._retrieve_result(target_address) + \
+            self._profiled('INIT', self._enable_fpga()) + \
+            self._profiled('TRANSFER', self._send_data_to_fpga()) + \
+            self._profiled('START', self._start_computation()) + \
+            '\n' + \
+            self._profiled('WAIT', self._block_until_ready()) + \
+            self._profiled('READ', self._retrieve_result()) + \
+            self._stop_fpga() + \
             self._return_result()
 
+    def _profiled(self, phase: str, code: str) -> str:
+        if self._profile_prefix is None or not code:
+            return code
+        arguments = f'{self.get_profile_id()}, {self._profile_prefix}_PHASE_{phase}'
+        return _formatted_body_line(f'STUB_PROF_BEGIN({arguments})') + \
+            code + \
+            _formatted_body_line(f'STUB_PROF_END({arguments})')
+
     def _define_local_vars(self):
-        if self._is_returning_result():
-            return f'{self._result_var.as_definition()}\n'
-        else:
-            return ''
+        result = ''
+        if self._is_returning_result() and not self._returns_through_pointer():
+            result += self._result_var.as_definition()
+        if self._is_staging_inputs():
+            result += self._staging_buffer.as_definition()
+        if result:
+            result += '\n'
+        return result
 
-    def _run_accelerator(self) -> str:
-        return self._send_data_to_fpga() + \
-               self._start_computation() + \
-               '\n'
+    def _is_staging_inputs(self) -> bool:
+        # values in the wrong byte order are swapped into the staging buffer before they are sent
+        return self._is_packing_inputs() or self.swaps_inputs()
 
-    @staticmethod
-    def _enable_fpga() -> str:
+    def _is_packing_inputs(self) -> bool:
+        # a single parameter is already contiguous and is written directly
+        sent_parameters = [param for param in self._input_variables if param.is_input()]
+        return self._transfer_mode == SyncFunction.TransferMode.PACKED and len(sent_parameters) > 1
+
+    def _enable_fpga(self) -> str:
+        if self._is_in_session():
+            return _formatted_body_line(f'assert({self._session_var.identifier})')
         return _formatted_body_line('middlewareInit()') + _formatted_body_line('middlewareUserlogicEnable()')
 
-    def _send_data_to_fpga(self) -> str:
-        result = ''
-        target_address = 0
-        for parameter in self._input_variables:
-            identifier = parameter.as_pass_by_reference()
+    def _send_data_to_fpga(self, sample_index: Optional[str] = None, base: str = 'ADDR_SKELETON_INPUTS') -> str:
+        if self._is_packing_inputs():
+            return self._send_packed_data_to_fpga(sample_index, base)
+        # DMA transfers are started first, so that the blocking writes overlap them
+        started, blocking = [], []
+        for parameter, target_address in zip(self._input_variables, self._layout.offsets):
+            if not parameter.is_input():
+                continue
             length = parameter.get_length_in_byte()
-            result += f'{self._pass_parameter(target_address, f"{identifier}", length)}'
-            target_address += length
-        return result
+            lines = started if self._is_dma_transfer(length) else blocking
+            identifier = self._reference_to(parameter, sample_index)
+            if self._bus.swaps(parameter):
+                lines.append(self._to_skeleton_order(target_address, identifier, parameter))
+                identifier = f'{self._staging_buffer.identifier}+{target_address}'
+            lines.append(self._pass_parameter(target_address, identifier, length, base, self._is_dma_transfer(length)))
+        return ''.join(started + blocking) + self._wait_for_dma(bool(started))
+
+    def _send_packed_data_to_fpga(self, sample_index: Optional[str], base: str) -> str:
+        lines = []
+        buffer = self._staging_buffer.identifier
+        for parameter, offset in zip(self._input_variables, self._layout.offsets):
+            if not parameter.is_input():
+                continue
+            if self._bus.swaps(parameter):
+                lines.append(self._to_skeleton_order(offset, self._reference_to(parameter, sample_index), parameter))
+            else:
+                lines.append(_formatted_body_line(f'memcpy({buffer}+{offset}, '
+                                                  f'{self._reference_to(parameter, sample_index)}, '
+                                                  f'{parameter.get_length_in_byte()})'))
+        is_dma = self._is_dma_transfer(self._layout.input_length)
+        lines.append(self._pass_parameter(0, buffer, self._layout.input_length, base, is_dma))
+        return ''.join(lines) + self._wait_for_dma(is_dma)
+
+    def _to_skeleton_order(self, offset: int, source: str, parameter: Variable) -> str:
+        return _formatted_body_line(f'toSkeletonOrder({self._staging_buffer.identifier}+{offset}, {source}, '
+                                    f'{parameter.type.get_length_in_byte()}, {parameter.elements})')
+
+    @staticmethod
+    def _reference_to(parameter: Variable, sample_index: Optional[str]) -> str:
+        if sample_index is None:
+            return parameter.as_pass_by_reference()
+        else:
+            return parameter.as_sample_reference(sample_index)
 
     @staticmethod
     def _start_computation() -> str:
         return _formatted_body_line('modelCompute(true)')
 
     @staticmethod
-    def _pass_parameter(target_addr: int, name: str, length: int) -> str:
-        return _formatted_body_line(f'middlewareWriteBlocking('
-                                    f'ADDR_SKELETON_INPUTS+{target_addr}, (uint8_t*)({name}), {length})')
-
-    def _get_input_length(self) -> int:
-        input_length = 0
-        for param in self._input_variables:
-            input_length += param.get_length_in_byte()
-        return input_length
+    def _pass_parameter(target_addr: int, name: str, length: int, base: str = 'ADDR_SKELETON_INPUTS',
+                        is_dma: bool = False) -> str:
+        write = 'STUB_DMA_WRITE' if is_dma else 'middlewareWriteBlocking'
+        return _formatted_body_line(f'{write}({base}+{target_addr}, (uint8_t*)({name}), {length})')
 
     @staticmethod
-    def _block_until_ready() -> str:
-        return _formatted_body_line(f'while( middlewareUserlogicGetBusyStatus() )')
+    def _wait_for_dma(is_started: bool) -> str:
+        # the HWA must not start before all of its inputs arrived
+        return _formatted_body_line('STUB_DMA_WAIT()') if is_started else ''
+
+    def _block_until_ready(self) -> str:
+        if self._wait.get_helper_identifier() is None:
+            return _formatted_body_line(f'while( middlewareUserlogicGetBusyStatus() )')
+        if not self._wait.has_timeout():
+            return _formatted_body_line(self._wait.as_c_call())
+        abort = _formatted_body_line('modelCompute(false)')
+        if not self._is_in_session():
+            abort += _formatted_body_line('middlewareUserlogicDisable()') + \
+                _formatted_body_line('middlewareDeinit()')
+        abort += _formatted_body_line('return false')
+        return f'   if( !{self._wait.as_c_call()} ){{\n' + \
+            _indented(abort) + \
+            '   }\n'
 
     def _is_returning_result(self) -> bool:
         return self._result_var.type.get_length_in_byte() > 0
 
-    def _retrieve_result(self, target_addr: int) -> str:
+    def _is_receiving_outputs(self) -> bool:
+        return self._layout.output_length > 0
+
+    def _retrieve_result(self, sample_index: Optional[str] = None, base: str = 'ADDR_SKELETON_INPUTS') -> str:
+        if not self._is_receiving_outputs():
+            return ''
+        if self._memory.has_output_region():
+            # the outputs do not overwrite the inputs, also not those of the bank written meanwhile
+            base = 'ADDR_SKELETON_OUTPUTS'
+        lines = [_formatted_body_line('modelCompute(false)')]
         if self._is_returning_result():
-            res = self._result_var.identifier
-            length = self._result_var.type.get_length_in_byte()
-            return f'   modelCompute(false);\n' + \
-                    f'   for(int i = 0; i < {length}; i++)''{\n' + \
-                    _formatted_body_line(f'  middlewareReadBlocking('
-                                        f'ADDR_SKELETON_INPUTS+{target_addr}+i, (uint8_t *)(&{res})+i, 1)') + '   }' + '\n'
+            lines += self._read_output(0, self._result_destination(sample_index), self._result_var, base)
+        for parameter, target_addr in zip(self._input_variables, self._layout.output_offsets):
+            if parameter.is_output():
+                lines += self._read_output(target_addr, self._reference_to(parameter, sample_index), parameter, base)
+        return ''.join(lines)
+
+    def _result_destination(self, sample_index: Optional[str]) -> str:
+        if sample_index is not None:
+            results = Variable(self._result_var.type, 'results', self._result_var.elements)
+            return results.as_sample_reference(sample_index)
+        elif self._returns_through_pointer():
+            return 'result'
         else:
-            return ''
+            return f'&{self._result_var.identifier}'
+
+    def _read_output(self, target_addr: int, destination: str, output: Variable, base: str) -> List[str]:
+        lines = [_formatted_body_line(f'middlewareReadBlocking({base}+{target_addr + offset}, '
+                                      f'(uint8_t*)({destination})+{offset}, {chunk_length})')
+                 for offset, chunk_length in self._read_chunks(target_addr, output.get_length_in_byte())]
+        if self._bus.swaps(output):
+            lines.append(_formatted_body_line(f'toHostOrder({destination}, {output.type.get_length_in_byte()}, '
+                                              f'{output.elements})'))
+        return lines
+
+    def _read_chunks(self, target_addr: int, length: int) -> List[Tuple[int, int]]:
+        if self._read_mode == SyncFunction.ReadMode.BULK:
+            return [(0, length)]
+        chunks = []
+        offset = 0
+        while offset < length:
+            distance_to_boundary = self._read_width - (target_addr + offset) % self._read_width
+            chunk_length = min(distance_to_boundary, length - offset)
+            chunks.append((offset, chunk_length))
+            offset += chunk_length
+        return chunks
 
     def _return_result(self) -> str:
-        if self._is_returning_result():
+        if self._wait.has_timeout():
+            return _formatted_body_line('return true')
+        elif self._is_returning_result() and not self._returns_through_pointer():
             return _formatted_body_line(f'return {self._result_var.identifier}')
         else:
             return ''
 
-    @staticmethod
-    def _stop_fpga() -> str:
+    def _stop_fpga(self) -> str:
+        if self._is_in_session():
+            # the result retrieval already stopped the computation
+            return '' if self._is_receiving_outputs() else _formatted_body_line('modelCompute(false)')
         return  f'   modelCompute(false);\n' \
                 f'   middlewareUserlogicDisable();\n' \
                 f'   middlewareDeinit();\n'
 
 
+class AsyncFunction(SyncFunction):
+    __slots__ = ('_running_var', '_callback_type', '_callback_name')
+
+    def __init__(self, identifier: str, return_type: Variable.Type, arguments=None,
+                 transfer_mode: SyncFunction.TransferMode = SyncFunction.TransferMode.SEPARATE,
+                 read_mode: SyncFunction.ReadMode = SyncFunction.ReadMode.BULK, read_width: int = 1,
+                 session_var: Optional[Variable] = None, bus_format: Optional[BusFormat] = None,
+                 dma_threshold: Optional[int] = None, memory_map: Optional[MemoryMap] = None) -> None:
+        super().__init__(identifier, return_type, arguments, transfer_mode, read_mode, read_width, session_var,
+                         bus_format=bus_format, dma_threshold=dma_threshold, memory_map=memory_map)
+        # the result outlives the call that started the computation
+        self._result_var = Variable(return_type, f'{identifier}_value', scope=Variable.Scope.STUB)
+        self._running_var = Variable(Variable.Type.BOOL, f'{identifier}_is_running', value='false')
+        self._callback_type = f'{identifier}_callback_t'
+        self._callback_name = f'{identifier}_callback'
+
+    def get_required_system_headers(self) -> List[str]:
+        return super().get_required_system_headers() + ['stddef.h']
+
+    def as_c_prototype(self) -> str:
+        result = f'typedef void (*{self._callback_type})({self._callback_parameter_as_c()});\n'
+        result += f'{self.get_signature("start")};\n'
+        result += f'{self.get_signature("poll")};\n'
+        if self._is_returning_result():
+            result += f'{self.get_signature("result")};\n'
+        return result
+
+    def write_c_code(self, writer: WriterC) -> None:
+        writer.write(self._define_state_vars() + '\n')
+        writer.function(self.get_signature('start'), self._start_body_as_c())
+        writer.function(self.get_signature('poll'), self._poll_body_as_c())
+        if self._is_returning_result():
+            writer.function(self.get_signature('result'), self._return_result())
+
+    def _signatures_as_c(self) -> Dict[str, str]:
+        signatures = {'start': self._start_signature_as_c(), 'poll': self._poll_signature_as_c()}
+        if self._is_returning_result():
+            signatures['result'] = self._result_signature_as_c()
+        return signatures
+
+    def _callback_parameter_as_c(self) -> str:
+        if self._is_returning_result():
+            return f'{self._result_var.type.as_c_code()} result'
+        else:
+            return Variable.Type.VOID.as_c_code()
+
+    def _start_signature_as_c(self) -> str:
+        parameters = [param.as_parameter_in_signature() for param in self._input_variables]
+        parameters.append(f'{self._callback_type} callback')
+        return f'bool {self._identifier}_start({", ".join(parameters)})'
+
+    def _poll_signature_as_c(self) -> str:
+        return f'bool {self._identifier}_poll(void)'
+
+    def _result_signature_as_c(self) -> str:
+        return f'{self._result_var.type.as_c_code()} {self._identifier}_result(void)'
+
+    def _define_state_vars(self) -> str:
+        result = self._running_var.as_initialization()
+        if self._is_returning_result():
+            result += self._result_var.as_definition()
+        result += f'static {self._callback_type} {self._callback_name} = NULL;\n'
+        return result
+
+    def _start_body_as_c(self) -> str:
+        result = ''
+        if self._is_staging_inputs():
+            result += self._staging_buffer.as_definition() + '\n'
+        return result + \
+            f'   if ({self._running_var.identifier})\n' \
+            f'      return false;\n' + \
+            self._enable_fpga() + \
+            self._send_data_to_fpga() + \
+            _formatted_body_line(f'{self._callback_name} = callback') + \
+            _formatted_body_line(f'{self._running_var.identifier} = true') + \
+            self._start_computation() + \
+            _formatted_body_line('return true')
+
+    def _poll_body_as_c(self) -> str:
+        if self._is_returning_result():
+            call_callback = f'{self._callback_name}({self._result_var.identifier})'
+        else:
+            call_callback = f'{self._callback_name}()'
+        return f'   if (!{self._running_var.identifier})\n' \
+               f'      return true;\n' \
+               f'   if (middlewareUserlogicGetBusyStatus())\n' \
+               f'      return false;\n' + \
+            self._retrieve_result() + \
+            self._stop_fpga() + \
+            _formatted_body_line(f'{self._running_var.identifier} = false') + \
+            f'   if ({self._callback_name} != NULL)\n' \
+            f'      {call_callback};\n' + \
+            _formatted_body_line('return true')
+
+
+def _assert_no_open_session(session_var: Optional[Variable]) -> str:
+    # deploying initializes and deinitializes the middleware itself and would tear down an open session
+    return _formatted_body_line(f'assert(!{session_var.identifier})') if session_var is not None else ''
+
+
 class DeployFunction(Function):
+    __slots__ = ('address_var_name', 'id_var', '_session_var')
 
-    def __init__(self, identifier: str, address_var: Variable, id_var: Variable) -> None:
+    def __init__(self, identifier: str, address_var: Variable, id_var: Variable,
+                 session_var: Optional[Variable] = None) -> None:
         super().__init__(identifier, Variable.Type.BOOL)
         self.address_var_name: str = address_var.identifier
         self.id_var = id_var
+        self._session_var = session_var
+
+    def get_required_system_headers(self) -> List[str]:
+        return ['assert.h'] if self._session_var is not None else []
 
     def _body_as_c(self) -> str:
-        return f'   middlewareInit();\n' \
+        return _assert_no_open_session(self._session_var) + \
+               f'   middlewareInit();\n' \
                f'   middlewareConfigureFpga({self.address_var_name});\n' \
                f'   sleep_for_ms(200);\n' \
                f'   bool is_deployed_successfully = (get_id() == accelerator_id);\n' \
@@ -185,7 +763,34 @@ class DeployFunction(Function):
                f'   return is_deployed_successfully;\n'
 
 
+class OpenSessionFunction(Function):
+    __slots__ = ('session_var_name',)
+
+    def __init__(self, identifier: str, session_var: Variable) -> None:
+        super().__init__(identifier, Variable.Type.VOID)
+        self.session_var_name: str = session_var.identifier
+
+    def _body_as_c(self) -> str:
+        return f'   middlewareInit();\n' \
+               f'   middlewareUserlogicEnable();\n' \
+               f'   {self.session_var_name} = true;\n'
+
+
+class CloseSessionFunction(Function):
+    __slots__ = ('session_var_name',)
+
+    def __init__(self, identifier: str, session_var: Variable) -> None:
+        super().__init__(identifier, Variable.Type.VOID)
+        self.session_var_name: str = session_var.identifier
+
+    def _body_as_c(self) -> str:
+        return f'   {self.session_var_name} = false;\n' \
+               f'   middlewareUserlogicDisable();\n' \
+               f'   middlewareDeinit();\n'
+
+
 class ModelComputeFunction(Function):
+    __slots__ = ()
 
     def __init__(self) -> None:
         arg = Variable(Variable.Type.BOOL, 'enable', scope=Variable.Scope.LOCAL)
@@ -209,7 +814,70 @@ class ModelComputeFunction(Function):
                '   middlewareWriteBlocking(ADDR_COMPUTATION_ENABLE, &cmd, 1);\n'
 
 
+class ModelComputeBankFunction(Function):
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        arg = Variable(Variable.Type.UINT8, 'bank', scope=Variable.Scope.LOCAL)
+        super().__init__('modelComputeBank', Variable.Type.VOID, [arg], is_private=True)
+
+    def _body_as_c(self) -> str:
+        # the skeleton computes on the input bank selected by the command value
+        return '   uint8_t cmd = 1 + bank;\n' \
+               '   middlewareWriteBlocking(ADDR_COMPUTATION_ENABLE, &cmd, 1);\n'
+
+
+class WaitFunction(Function):
+    __slots__ = ('_strategy', '_stub_name')
+
+    def __init__(self, strategy: WaitStrategy, stub_name: str) -> None:
+        arguments = []
+        if strategy.interval_ms is not None:
+            arguments.append(Variable(Variable.Type.UINT32, 'interval_ms', scope=Variable.Scope.LOCAL))
+        if strategy.kind != WaitStrategy.Kind.YIELD or strategy.has_timeout():
+            arguments.append(Variable(Variable.Type.UINT32, 'timeout_ms', scope=Variable.Scope.LOCAL))
+        super().__init__(strategy.get_helper_identifier(), Variable.Type.BOOL, arguments, is_private=True)
+        self._strategy = strategy
+        self._stub_name = stub_name
+
+    def _body_as_c(self) -> str:
+        kind = self._strategy.kind
+        if kind == WaitStrategy.Kind.INTERRUPT:
+            # without timeout, the hook may still return early, e.g. on a spurious wake-up
+            return f'   while( !{self._stub_name}_wait_for_completion(timeout_ms) ){{\n' \
+                   f'      if( timeout_ms != {WAIT_FOREVER} )\n' \
+                   f'         return false;\n' \
+                   f'   }}\n' \
+                   f'   return true;\n'
+        result = ''
+        timed_out = 'waited_ms >= timeout_ms'
+        if self._strategy.needs_clock():
+            result += f'   uint32_t start_ms = {self._stub_name}_millis();\n'
+            timed_out = f'{self._stub_name}_millis() - start_ms >= timeout_ms'
+        elif kind != WaitStrategy.Kind.YIELD:
+            result += '   uint32_t waited_ms = 0;\n'
+        if kind == WaitStrategy.Kind.BACKOFF:
+            result += '   uint32_t sleep_ms = 1;\n'
+        result += '   while( middlewareUserlogicGetBusyStatus() ){\n'
+        if kind != WaitStrategy.Kind.YIELD or self._strategy.has_timeout():
+            result += f'      if( timeout_ms != {WAIT_FOREVER} && {timed_out} )\n' \
+                      f'         return false;\n'
+        if kind == WaitStrategy.Kind.POLL:
+            result += '      sleep_for_ms(interval_ms);\n' \
+                      '      waited_ms += interval_ms;\n'
+        elif kind == WaitStrategy.Kind.BACKOFF:
+            result += '      sleep_for_ms(sleep_ms);\n' \
+                      '      waited_ms += sleep_ms;\n' \
+                      '      sleep_ms = (2 * sleep_ms < interval_ms) ? 2 * sleep_ms : interval_ms;\n'
+        elif kind == WaitStrategy.Kind.YIELD:
+            result += f'      {self._stub_name}_yield();\n'
+        result += '   }\n' \
+                  '   return true;\n'
+        return result
+
+
 class GetIdFunction(Function):
+    __slots__ = ()
 
     def __init__(self) -> None:
         super().__init__('get_id', Variable.Type.UINT8, is_private=True)
@@ -219,3 +887,163 @@ class GetIdFunction(Function):
                '   uint8_t id = middlewareGetDesignId();\n' \
                '   middlewareUserlogicDisable();\n' \
                '   return id;\n'
+
+
+class SelectAcceleratorFunction(Function):
+    """
+    Makes one of several HWAs resident. The FPGA is only reconfigured if the design id read from
+    the FPGA differs, afterwards the id is polled until the new design answers or the deploy timeout passes.
+    """
+    __slots__ = ('_ids_var_name', '_addresses_var_name', '_resident_var_name', '_session_var')
+
+    def __init__(self, identifier: str, ids_var: Variable, addresses_var: Variable, resident_var: Variable,
+                 session_var: Optional[Variable] = None) -> None:
+        accelerator_id = Variable(Variable.Type('id'), 'accelerator_id', scope=Variable.Scope.LOCAL)
+        super().__init__(identifier, Variable.Type.BOOL, [accelerator_id])
+        self._ids_var_name: str = ids_var.identifier
+        self._addresses_var_name: str = addresses_var.identifier
+        self._resident_var_name: str = resident_var.identifier
+        self._session_var = session_var
+
+    def get_required_system_headers(self) -> List[str]:
+        return ['assert.h'] if self._session_var is not None else []
+
+    def _body_as_c(self) -> str:
+        return _assert_no_open_session(self._session_var) + \
+               f'   int16_t index = findAccelerator(accelerator_id);\n' \
+               f'   if( index < 0 )\n' \
+               f'      return false;\n' \
+               f'   middlewareInit();\n' \
+               f'   bool is_resident = (get_id() == accelerator_id);\n' \
+               f'   if( !is_resident ){{\n' \
+               f'      middlewareConfigureFpga({self._addresses_var_name}[index]);\n' \
+               f'      is_resident = waitForDesign(accelerator_id);\n' \
+               f'   }}\n' \
+               f'   middlewareDeinit();\n' \
+               f'   {self._resident_var_name} = is_resident ? index : -1;\n' \
+               f'   return is_resident;\n'
+
+
+class IsResidentFunction(Function):
+    """
+    Tells whether this stub deployed the HWA last. Reconfigurations by other stubs are not tracked,
+    only SelectAcceleratorFunction asks the FPGA for its design id.
+    """
+    __slots__ = ('_ids_var_name', '_resident_var_name')
+
+    def __init__(self, identifier: str, ids_var: Variable, resident_var: Variable) -> None:
+        accelerator_id = Variable(Variable.Type('id'), 'accelerator_id', scope=Variable.Scope.LOCAL)
+        super().__init__(identifier, Variable.Type.BOOL, [accelerator_id])
+        self._ids_var_name: str = ids_var.identifier
+        self._resident_var_name: str = resident_var.identifier
+
+    def _body_as_c(self) -> str:
+        # only the tracker is consulted, the scheduler can ask without touching the bus
+        resident = self._resident_var_name
+        return f'   return {resident} >= 0 && {self._ids_var_name}[{resident}] == accelerator_id;\n'
+
+
+class FindAcceleratorFunction(Function):
+    __slots__ = ('_ids_var_name', '_count')
+
+    def __init__(self, ids_var: Variable) -> None:
+        accelerator_id = Variable(Variable.Type('id'), 'accelerator_id', scope=Variable.Scope.LOCAL)
+        super().__init__('findAccelerator', Variable.Type.INT16, [accelerator_id], is_private=True)
+        self._ids_var_name: str = ids_var.identifier
+        self._count: int = ids_var.elements
+
+    def _body_as_c(self) -> str:
+        return f'   for(int16_t index = 0; index < {self._count}; index++)\n' \
+               f'      if( {self._ids_var_name}[index] == accelerator_id )\n' \
+               f'         return index;\n' \
+               f'   return -1;\n'
+
+
+class WaitForDesignFunction(Function):
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        accelerator_id = Variable(Variable.Type('id'), 'accelerator_id', scope=Variable.Scope.LOCAL)
+        super().__init__('waitForDesign', Variable.Type.BOOL, [accelerator_id], is_private=True)
+
+    def _body_as_c(self) -> str:
+        return '   uint32_t waited_ms = 0;\n' \
+               '   while( get_id() != accelerator_id ){\n' \
+               '      if( waited_ms >= DEPLOY_TIMEOUT_MS )\n' \
+               '         return false;\n' \
+               '      sleep_for_ms(DEPLOY_POLL_MS);\n' \
+               '      waited_ms += DEPLOY_POLL_MS;\n' \
+               '   }\n' \
+               '   return true;\n'
+
+
+class ProfileFunction(Function):
+    __slots__ = ('_stub_name',)
+
+    def __init__(self, stub_name: str) -> None:
+        super().__init__(f'{stub_name}_profile', Variable.Type.VOID)
+        self._stub_name = stub_name
+
+    def _signature_as_c(self) -> str:
+        name = self._stub_name
+        return f'const {name}_phase_stats_t *{self._identifier}({name}_function_t function, {name}_phase_t phase)'
+
+    def _body_as_c(self) -> str:
+        return '   return &profile_stats[function][phase];\n'
+
+
+class ResetProfileFunction(Function):
+    __slots__ = ()
+
+    def __init__(self, stub_name: str) -> None:
+        super().__init__(f'{stub_name}_profile_reset', Variable.Type.VOID)
+
+    def get_required_system_headers(self) -> List[str]:
+        return ['string.h']
+
+    def _body_as_c(self) -> str:
+        return '   memset(profile_stats, 0, sizeof(profile_stats));\n'
+
+
+class ToSkeletonOrderFunction(Function):
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        super().__init__('toSkeletonOrder', Variable.Type.VOID, is_private=True)
+
+    def get_required_system_headers(self) -> List[str]:
+        return ['stddef.h']
+
+    def _parameter_list_as_c(self) -> str:
+        return 'uint8_t *destination, const void *source, size_t element_size, size_t elements'
+
+    def _body_as_c(self) -> str:
+        return '   const uint8_t *bytes = (const uint8_t*)source;\n' \
+               '   for(size_t i = 0; i < element_size*elements; i++){\n' \
+               '      size_t j = SKELETON_SWAPS_BYTES ? i - i%element_size + element_size-1 - i%element_size : i;\n' \
+               '      destination[i] = bytes[j];\n' \
+               '   }\n'
+
+
+class ToHostOrderFunction(Function):
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        super().__init__('toHostOrder', Variable.Type.VOID, is_private=True)
+
+    def get_required_system_headers(self) -> List[str]:
+        return ['stddef.h']
+
+    def _parameter_list_as_c(self) -> str:
+        return 'void *data, size_t element_size, size_t elements'
+
+    def _body_as_c(self) -> str:
+        return '   uint8_t *bytes = (uint8_t*)data;\n' \
+               '   if( !SKELETON_SWAPS_BYTES )\n' \
+               '      return;\n' \
+               '   for(size_t i = 0; i < element_size*elements; i += element_size)\n' \
+               '      for(size_t j = 0; j < element_size/2; j++){\n' \
+               '         uint8_t swapped = bytes[i+j];\n' \
+               '         bytes[i+j] = bytes[i+element_size-1-j];\n' \
+               '         bytes[i+element_size-1-j] = swapped;\n' \
+               '      }\n'
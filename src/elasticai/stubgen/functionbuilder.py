@@ -1,8 +1,8 @@
 from enum import Enum
-from typing import List
+from typing import List, Optional, Tuple
 
-from elasticai.stubgen.function import Function, SyncFunction
-from elasticai.stubgen.variable import Variable
+from elasticai.stubgen.function import AsyncFunction, BusFormat, Function, MemoryMap, SyncFunction, WaitStrategy
+from elasticai.stubgen.variable import ShapedVariable, Variable
 
 
 class FunctionBuilder:
@@ -13,40 +13,133 @@ class FunctionBuilder:
 
     def __init__(self) -> None:
         self.name: str = ''
+        # source positions of the name and the parameters, to report errors where they were declared
+        self.position = None
+        self.parameter_positions: List = []
         self.prefix: str = ''
         self.pattern = FunctionBuilder.CallPattern.SYNC  # sync call pattern is standard value
         self.parameters: List[Variable] = []
         self.returnType = Variable.Type('void')
+        self.return_elements = 1
+        self.transfer_mode = SyncFunction.TransferMode.SEPARATE
+        self.read_mode = SyncFunction.ReadMode.BULK
+        self.read_width = 1
+        self.session_var: Optional[Variable] = None
+        self.batch_size: Optional[int] = None
+        self.pipeline_banks_var: Optional[Variable] = None
+        self.wait_kind: Optional[WaitStrategy.Kind] = None
+        self.wait_interval: Optional[int] = None
+        self.timeout: Optional[int] = None
+        self._default_wait_kind = WaitStrategy.Kind.SPIN
+        self._default_wait_interval: Optional[int] = None
+        self._default_timeout: Optional[int] = None
+        self.profile_prefix: Optional[str] = None
+        self.bus_format = BusFormat()
+        self.dma_threshold: Optional[int] = None
+        self.memory_map = MemoryMap()
 
     def set_call_pattern(self, pattern: CallPattern) -> None:
-        if pattern != FunctionBuilder.CallPattern.SYNC:
-            raise ValueError("Currently, we can generate only synchronous (i.e. blocking) functions.")
-        else:
-            self.pattern = pattern
+        self.pattern = pattern
 
-    def set_name(self, name: str) -> None:
+    def set_name(self, name: str, position=None) -> None:
         if name is None:
             raise ValueError("Function name must be given.")
         else:
             self.name = name
+            self.position = position
 
     def set_name_prefix(self, prefix: str) -> None:
         self.prefix = prefix
 
-    def set_return_type(self, ret_type: Variable.Type) -> None:
+    def set_transfer_mode(self, mode: SyncFunction.TransferMode) -> None:
+        self.transfer_mode = mode
+
+    def set_read_mode(self, mode: SyncFunction.ReadMode, width: int = 1) -> None:
+        self.read_mode = mode
+        self.read_width = width
+
+    def set_session(self, session_var: Optional[Variable]) -> None:
+        self.session_var = session_var
+
+    def set_batch_size(self, batch_size: int) -> None:
+        if batch_size < 1:
+            raise ValueError(f"Batch size must be at least 1, got {batch_size}.")
+        self.batch_size = batch_size
+
+    def set_pipeline_banks(self, banks_var: Optional[Variable]) -> None:
+        self.pipeline_banks_var = banks_var
+
+    def set_wait_strategy(self, kind: WaitStrategy.Kind, interval: Optional[int] = None) -> None:
+        self.wait_kind = kind
+        self.wait_interval = interval
+
+    def set_timeout(self, timeout: int) -> None:
+        self.timeout = timeout
+
+    def set_default_wait_strategy(self, kind: WaitStrategy.Kind, interval: Optional[int],
+                                  timeout: Optional[int]) -> None:
+        # used for everything the function itself does not specify
+        self._default_wait_kind = kind
+        self._default_wait_interval = interval
+        self._default_timeout = timeout
+
+    def set_bus_format(self, bus_format: BusFormat) -> None:
+        self.bus_format = bus_format
+
+    def set_dma_threshold(self, threshold: Optional[int]) -> None:
+        self.dma_threshold = threshold
+
+    def set_memory_map(self, memory_map: MemoryMap) -> None:
+        self.memory_map = memory_map
+
+    def set_profiling(self, profile_prefix: Optional[str]) -> None:
+        self.profile_prefix = profile_prefix
+
+    def set_return_type(self, ret_type: Variable.Type, elements: int = 1) -> None:
         self.returnType = ret_type
+        self.return_elements = elements
 
     def add_input_parameter(self, param_type: Variable.Type, param_name: str, param_elements: int = 1) -> None:
-        parameter = Variable(param_type, param_name, param_elements, Variable.Scope.INPUT)
+        self.add_parameter(param_type, param_name, param_elements, Variable.Scope.INPUT)
+
+    def add_parameter(self, param_type: Variable.Type, param_name: str, param_elements: int = 1,
+                      scope: Variable.Scope = Variable.Scope.INPUT, shape: Optional[Tuple[int, ...]] = None,
+                      position=None) -> None:
+        if shape is not None and len(shape) > 1:
+            parameter = ShapedVariable(param_type, param_name, shape, scope)
+        else:
+            parameter = Variable(param_type, param_name, param_elements, scope)
         # parameter = Parameter(param_type, param_name, is_input_arg=True)
         # if param_elements > 1:
         #     parameter.set_as_array(param_elements)
         self.parameters.append(parameter)
+        self.parameter_positions.append(position)
 
     def generate(self) -> Function:
         name: str = self._generate_prefixed_name()
         if self.pattern == FunctionBuilder.CallPattern.SYNC:
-            return SyncFunction(name, self.returnType, self.parameters)
+            return SyncFunction(name, self.returnType, self.parameters, self.transfer_mode,
+                                self.read_mode, self.read_width, self.session_var, self.batch_size,
+                                self.pipeline_banks_var, self._generate_wait_strategy(), self.return_elements,
+                                self.profile_prefix, self.bus_format, self.dma_threshold, self.memory_map)
+        elif self.batch_size is not None:
+            raise ValueError("Batch variants can only be generated for synchronous functions.")
+        elif self.wait_kind is not None or self.timeout is not None:
+            raise ValueError("Asynchronous functions do not wait, they cannot have a wait strategy or timeout.")
+        elif self.return_elements > 1 or any(parameter.is_output() for parameter in self.parameters):
+            raise ValueError("Asynchronous functions can neither return arrays nor have output parameters.")
+        else:
+            return AsyncFunction(name, self.returnType, self.parameters, self.transfer_mode,
+                                 self.read_mode, self.read_width, self.session_var, self.bus_format,
+                                 self.dma_threshold, self.memory_map)
+
+    def _generate_wait_strategy(self) -> WaitStrategy:
+        if self.wait_kind is not None:
+            kind, interval = self.wait_kind, self.wait_interval
+        else:
+            kind, interval = self._default_wait_kind, self._default_wait_interval
+        timeout = self.timeout if self.timeout is not None else self._default_timeout
+        return WaitStrategy(kind, interval, timeout)
 
     def _generate_prefixed_name(self) -> str:
         return f'{self.prefix}_{self.name}'
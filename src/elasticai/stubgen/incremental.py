@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import tempfile
+from functools import lru_cache
+from typing import BinaryIO, Callable, Dict, List, TextIO
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(file_name: str) -> str:
+    hasher = hashlib.sha256()
+    with open(file_name, 'rb') as reader:
+        for chunk in iter(lambda: reader.read(1 << 16), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def generator_fingerprint() -> str:
+    # any change to the generator sources may change the generated code
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    hasher = hashlib.sha256()
+    for source in sorted(os.listdir(package_dir)):
+        if source.endswith('.py'):
+            hasher.update(source.encode())
+            with open(os.path.join(package_dir, source), 'rb') as reader:
+                hasher.update(reader.read())
+    return hasher.hexdigest()
+
+
+def write_if_changed(file_name: str, text: str) -> str:
+    # keeps the mtime of unchanged files, so make/CMake do not recompile them
+    data = text.encode('utf-8')
+    new_hash = content_hash(data)
+    if os.path.isfile(file_name) and file_hash(file_name) == new_hash:
+        return new_hash
+    _atomic_write(file_name, data)
+    return new_hash
+
+
+def stream_if_changed(file_name: str, emit: Callable[[TextIO], None]) -> str:
+    # like write_if_changed, but emit() writes the text piece by piece, so it is never held in memory
+    return stream_files_if_changed([file_name], emit)[0]
+
+
+def stream_files_if_changed(file_names: List[str], emit: Callable[..., None]) -> List[str]:
+    # emit() gets one sink per file, in the same order, and may write to all of them at once
+    temp_names = []
+    try:
+        writers = []
+        for file_name in file_names:
+            directory = os.path.dirname(os.path.abspath(file_name))
+            handle, temp_name = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+            temp_names.append(temp_name)
+            writers.append(os.fdopen(handle, 'wb'))
+        sinks = [_HashingSink(writer) for writer in writers]
+        try:
+            emit(*sinks)
+        finally:
+            for writer in writers:
+                writer.close()
+        new_hashes = [sink.hexdigest() for sink in sinks]
+        for file_name, temp_name, new_hash in zip(file_names, temp_names, new_hashes):
+            if os.path.isfile(file_name) and file_hash(file_name) == new_hash:
+                os.unlink(temp_name)
+            else:
+                _replace(temp_name, file_name)
+        return new_hashes
+    except BaseException:
+        for temp_name in temp_names:
+            if os.path.exists(temp_name):
+                os.unlink(temp_name)
+        raise
+
+
+class _HashingSink:
+
+    def __init__(self, writer: BinaryIO) -> None:
+        self._writer = writer
+        self._hasher = hashlib.sha256()
+
+    def write(self, text: str) -> int:
+        data = text.encode('utf-8')
+        self._hasher.update(data)
+        self._writer.write(data)
+        return len(text)
+
+    def hexdigest(self) -> str:
+        return self._hasher.hexdigest()
+
+
+def _atomic_write(file_name: str, data: bytes) -> None:
+    directory = os.path.dirname(os.path.abspath(file_name))
+    handle, temp_name = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as writer:
+            writer.write(data)
+        _replace(temp_name, file_name)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+
+def _replace(temp_name: str, file_name: str) -> None:
+    os.chmod(temp_name, 0o666 & ~_current_umask())
+    os.replace(temp_name, file_name)
+
+
+@lru_cache(maxsize=None)
+def _current_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+class HashManifest:
+
+    def __init__(self, file_name: str) -> None:
+        self.file_name = file_name
+        self._base_dir = os.path.dirname(os.path.abspath(file_name))
+        self._entries: Dict[str, dict] = {}
+        if os.path.isfile(file_name):
+            with open(file_name, 'r') as reader:
+                self._entries = json.load(reader).get('stubs', {})
+
+    def is_up_to_date(self, idl_file: str, idl_hash: str) -> bool:
+        entry = self._entries.get(self._key(idl_file))
+        if entry is None or entry['idl'] != idl_hash or entry['generator'] != generator_fingerprint():
+            return False
+        for output, output_hash in entry['outputs'].items():
+            output_file = os.path.join(self._base_dir, output)
+            if not os.path.isfile(output_file) or file_hash(output_file) != output_hash:
+                return False
+        return True
+
+    def record(self, idl_file: str, idl_hash: str, output_hashes: Dict[str, str]) -> None:
+        self._entries[self._key(idl_file)] = {
+            'idl': idl_hash,
+            'generator': generator_fingerprint(),
+            'outputs': {self._key(output): output_hash for output, output_hash in output_hashes.items()}
+        }
+
+    def save(self) -> None:
+        text = json.dumps({'stubs': self._entries}, indent=2, sort_keys=True) + '\n'
+        write_if_changed(self.file_name, text)
+
+    def _key(self, file_name: str) -> str:
+        return os.path.relpath(os.path.abspath(file_name), self._base_dir)
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from rply import LexerGenerator
 
 
@@ -7,19 +9,39 @@ class Lexer:
         self.lexer = LexerGenerator()
 
     def _add_tokens(self):
-        self.lexer.add('STUB', r'stub')
-        self.lexer.add('SYNC', r'sync')
-        self.lexer.add('ASYNC', r'async')
-        self.lexer.add('ASYNC', r'async')
-        self.lexer.add('PATH', r'path')
-        self.lexer.add('ADDRESS', r'address')
-        self.lexer.add('DEPLOY', r'deploy')
-        self.lexer.add('BOOL', r'bool')
-        self.lexer.add('INT8', r'int8')
-        self.lexer.add('INT16', r'int16')
-        self.lexer.add('INT32', r'int32')
-        self.lexer.add('INT64', r'int64')
-        self.lexer.add('VOID', r'void')
+        self.lexer.add('STUB', r'stub\b')
+        self.lexer.add('SYNC', r'sync\b')
+        self.lexer.add('ASYNC', r'async\b')
+        self.lexer.add('ASYNC', r'async\b')
+        self.lexer.add('PATH', r'path\b')
+        self.lexer.add('ADDRESS', r'address\b')
+        self.lexer.add('DEPLOY', r'deploy\b')
+        self.lexer.add('TRANSFER', r'transfer\b')
+        self.lexer.add('READ', r'read\b')
+        self.lexer.add('SESSION', r'session\b')
+        self.lexer.add('BATCH', r'batch\b')
+        self.lexer.add('PIPELINE', r'pipeline\b')
+        self.lexer.add('WAIT', r'wait\b')
+        self.lexer.add('TIMEOUT', r'timeout\b')
+        self.lexer.add('PROFILE', r'profile\b')
+        self.lexer.add('BUS', r'bus\b')
+        self.lexer.add('DMA', r'dma\b')
+        self.lexer.add('MEMORY', r'memory\b')
+        self.lexer.add('INOUT', r'inout\b')
+        self.lexer.add('OUT', r'out\b')
+        self.lexer.add('BOOL', r'bool\b')
+        self.lexer.add('INT8', r'int8\b')
+        self.lexer.add('INT16', r'int16\b')
+        self.lexer.add('INT32', r'int32\b')
+        self.lexer.add('INT64', r'int64\b')
+        self.lexer.add('UINT8', r'uint8\b')
+        self.lexer.add('UINT16', r'uint16\b')
+        self.lexer.add('UINT32', r'uint32\b')
+        self.lexer.add('UINT64', r'uint64\b')
+        self.lexer.add('Q7', r'q7\b')
+        self.lexer.add('Q15', r'q15\b')
+        self.lexer.add('Q31', r'q31\b')
+        self.lexer.add('VOID', r'void\b')
         self.lexer.add('OPEN_SQUARE_BRACKET', r'\[')
         self.lexer.add('CLOSE_SQUARE_BRACKET', r'\]')
         self.lexer.add('OPEN_PAREN', r'\(')
@@ -35,3 +57,8 @@ class Lexer:
     def get_lexer(self):
         self._add_tokens()
         return self.lexer.build()
+
+
+@lru_cache(maxsize=None)
+def get_shared_lexer():
+    return Lexer().get_lexer()
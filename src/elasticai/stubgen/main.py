@@ -1,9 +1,21 @@
+import cProfile
+import os
+import time
+from argparse import ArgumentParser, Namespace
 from sys import argv
+from typing import Dict, List, Optional
 
+from rply import LexingError
+
+from elasticai.stubgen.batch import collect_idl_files, generate_batch, print_report
+from elasticai.stubgen.diagnostics import IdlError, unexpected_character
+from elasticai.stubgen.incremental import HashManifest, stream_files_if_changed, stream_if_changed
+from elasticai.stubgen.timings import print_timings, time_stub_generation, write_timings_json
+from elasticai.stubgen.watch import StubWatcher, create_watcher
 from elasticai.stubgen.stub import Stub
 from elasticai.stubgen.stubbuilder import StubBuilder
-from elasticai.stubgen.lexer import Lexer
-from elasticai.stubgen.parser import Parser
+from elasticai.stubgen.lexer import get_shared_lexer
+from elasticai.stubgen.parser import get_shared_parser
 
 
 #    sync predict_traffic_speed :
@@ -16,46 +28,155 @@ from elasticai.stubgen.parser import Parser
 #    sync predict_traffic_speed(inputs : int8[6], more_inputs : bool) : int8
 
 
-def _build_stub_from_text(input_text: str) -> Stub:
-    lexer = Lexer().get_lexer()
-    tokens = lexer.lex(input_text)
+def _build_stub_from_text(input_text: str, file_name: str = '<idl>') -> Stub:
+    tokens = get_shared_lexer().lex(input_text)
     # for token in tokens:
     #     print(token)
     stub_builder = StubBuilder()
-    parser = Parser(stub_builder).get_parser()
-    parser.parse(tokens)
-    return stub_builder.generate()
+    try:
+        get_shared_parser().parse(tokens, state=stub_builder)
+        stub_builder.validate()
+        return stub_builder.generate()
+    except LexingError as error:
+        stub_builder.diagnostics.append(unexpected_character(error.getsourcepos().idx, input_text))
+        raise IdlError(stub_builder.diagnostics, file_name, input_text) from None
+    except IdlError as error:
+        # the builder does not know the file, the errors are shown with their source lines
+        raise IdlError(error.diagnostics, file_name, input_text) from None
 
 
 def _load_stub(reader) -> Stub:
     idl_text = reader.read()
-    return _build_stub_from_text(idl_text)
+    return _build_stub_from_text(idl_text, getattr(reader, 'name', '<idl>'))
 
 
-def _save_stub_header(stub: Stub, file_name: str):
-    with open(file_name, 'w') as writer:
-        writer.write(stub.as_c_header())
+def _save_stub_header(stub: Stub, file_name: str) -> str:
+    return stream_if_changed(file_name, stub.write_c_header)
 
 
-def _save_stub_code(stub: Stub, file_name: str):
-    with open(file_name, 'w') as writer:
-        writer.write(stub.as_c_code())
+def _save_stub_code(stub: Stub, file_name: str) -> str:
+    return stream_if_changed(file_name, stub.write_c_code)
 
 
-def _get_filename_from_commandline_or_abort() -> str:
-    if len(argv) < 2:
-        print('Error: no filename given, aborting')
+def _generate_stub_files(idl_file: str) -> Dict[str, str]:
+    base_name = os.path.splitext(idl_file)[0]
+    with open(idl_file, 'r') as reader:
+        stub = _load_stub(reader)
+    # header and code are rendered together in one walk over the functions
+    output_files = [f'{base_name}.h', f'{base_name}.c']
+    return dict(zip(output_files, stream_files_if_changed(output_files, stub.compile().write)))
+
+
+def _parse_arguments(args: List[str]) -> Namespace:
+    parser = ArgumentParser(description='Generate C stubs from IDL files.')
+    parser.add_argument('filename', nargs='?',
+                        help='base name of a single IDL file, <filename>.idl generates <filename>.h/.c')
+    parser.add_argument('--batch', nargs='+', metavar='SOURCE', default=[],
+                        help='directories, globs or IDL files to generate in one run')
+    parser.add_argument('--manifest', metavar='FILE',
+                        help='file listing one directory, glob or IDL file per line for batch generation')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes for batch generation')
+    parser.add_argument('--hash-manifest', metavar='FILE',
+                        help='skip IDL files that did not change since the last run recorded in FILE')
+    parser.add_argument('--watch', nargs='+', metavar='DIRECTORY', default=[],
+                        help='keep running and regenerate stubs whenever an IDL file in DIRECTORY changes')
+    parser.add_argument('--debounce', type=float, default=50, metavar='MS',
+                        help='time to wait for further changes before regenerating in watch mode')
+    parser.add_argument('--timings', action='store_true',
+                        help='report time and peak memory of every generation stage of a single IDL file')
+    parser.add_argument('--timings-json', metavar='FILE',
+                        help='write the stage timings of a single IDL file as JSON to FILE')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='run the generation under cProfile and dump the statistics to FILE for pstats')
+    arguments = parser.parse_args(args)
+    if (arguments.timings or arguments.timings_json) and (arguments.batch or arguments.manifest or arguments.watch):
+        parser.error('--timings and --timings-json only work for a single IDL file, not with --batch, '
+                     '--manifest or --watch')
+    return arguments
+
+
+def _load_hash_manifest(file_name: Optional[str]) -> Optional[HashManifest]:
+    return HashManifest(file_name) if file_name else None
+
+
+def _run_batch(arguments: Namespace) -> None:
+    idl_files = collect_idl_files(arguments.batch, arguments.manifest)
+    if not idl_files:
+        print('Error: no IDL files found, aborting')
+        exit(-1)
+    start = time.perf_counter()
+    results = generate_batch(idl_files, _generate_stub_files, arguments.jobs,
+                             _load_hash_manifest(arguments.hash_manifest))
+    print_report(results, time.perf_counter() - start, arguments.jobs)
+    if not all(result.succeeded for result in results):
+        exit(-1)
+
+
+def _run_watch(arguments: Namespace) -> None:
+    manifest = _load_hash_manifest(arguments.hash_manifest)
+    idl_files = collect_idl_files(arguments.watch)
+    start = time.perf_counter()
+    results = generate_batch(idl_files, _generate_stub_files, arguments.jobs, manifest)
+    print_report(results, time.perf_counter() - start, arguments.jobs)
+    watcher = create_watcher(arguments.watch)
+    print(f'Watching {", ".join(arguments.watch)} for changes ({type(watcher).__name__}), press Ctrl+C to stop',
+          flush=True)
+    StubWatcher(watcher, _generate_stub_files, arguments.debounce / 1000, manifest).run_forever()
+
+
+def _run_timings(arguments: Namespace, idl_file: str) -> None:
+    try:
+        timings = time_stub_generation(idl_file)
+    except IdlError as error:
+        print(error)
         exit(-1)
-    return argv[1]
+    if arguments.timings:
+        print_timings(timings)
+    if arguments.timings_json:
+        write_timings_json(timings, idl_file, arguments.timings_json)
 
 
 def _main() -> None:
-    filename = _get_filename_from_commandline_or_abort()
-    with open(f'{filename}.idl', 'r') as reader:
-        stub = _load_stub(reader)
-        _save_stub_header(stub, f'{filename}.h')
-        _save_stub_code(stub, f'{filename}.c')
-        print('Success: stub files generated successfully')
+    arguments = _parse_arguments(argv[1:])
+    if arguments.profile is None:
+        _run(arguments)
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(_run, arguments)
+    finally:
+        profiler.dump_stats(arguments.profile)
+
+
+def _run(arguments: Namespace) -> None:
+    if arguments.watch:
+        _run_watch(arguments)
+        return
+    if arguments.batch or arguments.manifest:
+        _run_batch(arguments)
+        return
+    if arguments.filename is None:
+        print('Error: no filename given, aborting')
+        exit(-1)
+    idl_file = f'{arguments.filename}.idl'
+    if arguments.timings or arguments.timings_json:
+        _run_timings(arguments, idl_file)
+    elif arguments.hash_manifest is None:
+        try:
+            _generate_stub_files(idl_file)
+        except IdlError as error:
+            print(error)
+            exit(-1)
+    else:
+        result = generate_batch([idl_file], _generate_stub_files, manifest=HashManifest(arguments.hash_manifest))[0]
+        if not result.succeeded:
+            print(f'Error: {result.error}')
+            exit(-1)
+        if result.skipped:
+            print('Success: stub files are up to date')
+            return
+    print('Success: stub files generated successfully')
 
 
 if __name__ == "__main__":
@@ -1,109 +1,289 @@
-from rply import ParserGenerator
+from functools import lru_cache
+from typing import Optional
+
+from rply import ParserGenerator, Token
+from elasticai.stubgen.diagnostics import IdlError
 from elasticai.stubgen.stubbuilder import StubBuilder
 
 
 class Parser:
 
-    def __init__(self, builder: StubBuilder):
+    # rply keeps the generated LALR tables in the user cache directory under this id.
+    # The cache file name contains a hash of the grammar, so changing a production
+    # rule invalidates the cached tables automatically.
+    CACHE_ID = 'elasticai.stubgen'
+
+    def __init__(self, cache_id: Optional[str] = CACHE_ID):
         self.pg = ParserGenerator(
             # A list of all token names accepted by the parser.
             ['STUB', 'OPEN_PAREN', 'CLOSE_PAREN', 'COLON', 'NUMBER',
              'SYNC', 'ASYNC', 'OPEN_SQUARE_BRACKET', 'CLOSE_SQUARE_BRACKET',
              'STRING', 'COMMA', 'VOID', 'BOOL', 'INT8', 'INT16', 'INT32',
-             'INT64', 'PATH', 'PATH_STRING', 'ADDRESS', 'DEPLOY']
+             'INT64', 'PATH', 'PATH_STRING', 'ADDRESS', 'DEPLOY', 'TRANSFER',
+             'READ', 'SESSION', 'BATCH', 'PIPELINE', 'WAIT', 'TIMEOUT', 'OUT', 'INOUT',
+             'PROFILE', 'BUS', 'DMA', 'UINT8', 'UINT16', 'UINT32', 'UINT64', 'Q7', 'Q15', 'Q31',
+             'MEMORY'],
+            cache_id=cache_id
         )
-        self.builder = builder
         self.add_production_rules()
 
+    def production(self, rule: str):
+        # the builder raises ValueError for declarations it rejects, the error is recorded at the first token
+        # of the declaration and parsing goes on, so that all errors of a file are reported in one run
+        def register(callback):
+            def reporting_errors(builder: StubBuilder, p):
+                try:
+                    return callback(builder, p)
+                except ValueError as error:
+                    token = _first_token(p)
+                    if token is None:
+                        builder.report_error(str(error))
+                    else:
+                        builder.report_error(str(error), token.getsourcepos(), len(token.value))
+            self.pg.production(rule)(reporting_errors)
+            return callback
+        return register
+
     def add_production_rules(self) -> None:
 
-        @self.pg.production('stub : STUB STRING metadata function')
-        @self.pg.production('stub : STUB STRING function')
-        def stub(p):
+        @self.production('stub : STUB STRING metadata function')
+        @self.production('stub : STUB STRING function')
+        def stub(builder: StubBuilder, p):
             name: str = p[1].value
-            self.builder.set_name(name)
+            builder.set_name(name, p[1].getsourcepos())
 
-        @self.pg.production('id : NUMBER')
-        def accel_id(p):
+        @self.production('id : NUMBER')
+        def accel_id(builder: StubBuilder, p):
             the_id = int(p[0].value)
-            self.builder.set_accelerator_id(the_id)
+            builder.set_accelerator_id(the_id)
+            return the_id
 
-        @self.pg.production('address : NUMBER')
-        def accel_addr(p):
+        @self.production('address : NUMBER')
+        def accel_addr(builder: StubBuilder, p):
             address = int(p[0].value)
-            self.builder.set_accelerator_address(address)
+            builder.set_accelerator_address(address)
+            return address
 
-        @self.pg.production('metadata : metadata2')
-        @self.pg.production('metadata : metadata metadata2')
-        def attributes(p):
+        @self.production('metadata : metadata2')
+        @self.production('metadata : metadata metadata2')
+        def attributes(builder: StubBuilder, p):
             pass
 
-        @self.pg.production('metadata2 : PATH PATH_STRING')
-        def path_attr(p):
+        @self.production('metadata2 : PATH PATH_STRING')
+        def path_attr(builder: StubBuilder, p):
             path = p[1].value
-            self.builder.set_middleware_path(path)
+            builder.set_middleware_path(path)
 
-        @self.pg.production('metadata2 : ADDRESS address')
-        def address_attr(p):
+        @self.production('metadata2 : ADDRESS address')
+        def address_attr(builder: StubBuilder, p):
             pass
 
-        @self.pg.production('metadata2 : DEPLOY id address')
-        def switch_attr(p):
-            pass
+        @self.production('metadata2 : DEPLOY id address')
+        def switch_attr(builder: StubBuilder, p):
+            builder.add_accelerator(p[1], p[2])
+
+        @self.production('metadata2 : TRANSFER STRING')
+        def transfer_attr(builder: StubBuilder, p):
+            mode: str = p[1].value
+            builder.set_transfer_mode(mode)
+
+        @self.production('metadata2 : READ STRING')
+        @self.production('metadata2 : READ STRING NUMBER')
+        def read_attr(builder: StubBuilder, p):
+            mode: str = p[1].value
+            if len(p) > 2:
+                builder.set_read_mode(mode, int(p[2].value))
+            else:
+                builder.set_read_mode(mode)
+
+        @self.production('metadata2 : SESSION')
+        def session_attr(builder: StubBuilder, p):
+            builder.enable_sessions()
+
+        @self.production('metadata2 : BUS NUMBER')
+        @self.production('metadata2 : BUS NUMBER STRING')
+        def bus_attr(builder: StubBuilder, p):
+            byte_order = p[2].value if len(p) > 2 else None
+            builder.set_bus_format(int(p[1].value), byte_order)
+
+        @self.production('metadata2 : DMA NUMBER')
+        def dma_attr(builder: StubBuilder, p):
+            builder.set_dma_threshold(int(p[1].value))
+
+        @self.production('metadata2 : MEMORY regions')
+        def memory_attr(builder: StubBuilder, p):
+            builder.set_memory_map(p[1])
+
+        @self.production('regions : region')
+        @self.production('regions : regions region')
+        def memory_regions(builder: StubBuilder, p):
+            regions = p[0] if len(p) > 1 else []
+            return regions + [p[-1]]
+
+        @self.production('region : STRING NUMBER')
+        @self.production('region : STRING NUMBER NUMBER')
+        def memory_region(builder: StubBuilder, p):
+            size = int(p[2].value) if len(p) > 2 else None
+            return p[0].value, int(p[1].value), size
+
+        @self.production('metadata2 : PROFILE')
+        def profile_attr(builder: StubBuilder, p):
+            builder.enable_profiling()
+
+        @self.production('metadata2 : PIPELINE banks')
+        def pipeline_attr(builder: StubBuilder, p):
+            builder.set_pipeline_banks(p[1])
+
+        @self.production('banks : NUMBER')
+        @self.production('banks : banks NUMBER')
+        def pipeline_banks(builder: StubBuilder, p):
+            banks = p[0] if len(p) > 1 else []
+            return banks + [int(p[-1].value)]
+
+        @self.production('metadata2 : WAIT STRING')
+        @self.production('metadata2 : WAIT STRING NUMBER')
+        def wait_attr(builder: StubBuilder, p):
+            kind: str = p[1].value
+            interval = int(p[2].value) if len(p) > 2 else None
+            builder.set_wait_strategy(kind, interval)
+
+        @self.production('metadata2 : TIMEOUT NUMBER')
+        def timeout_attr(builder: StubBuilder, p):
+            builder.set_timeout(int(p[1].value))
 
-        @self.pg.production('function : function2')
-        @self.pg.production('function : function function2')
-        def functions(p):
+        @self.production('function : function2')
+        @self.production('function : function function2')
+        def functions(builder: StubBuilder, p):
             pass
 
-        @self.pg.production('function2 : pattern STRING OPEN_PAREN parameter CLOSE_PAREN COLON return_type')
-        @self.pg.production('function2 : pattern STRING OPEN_PAREN CLOSE_PAREN COLON return_type')
-        def function(p):
+        @self.production('function2 : pattern STRING OPEN_PAREN parameter CLOSE_PAREN COLON return_type')
+        @self.production('function2 : pattern STRING OPEN_PAREN CLOSE_PAREN COLON return_type')
+        @self.production('function2 : pattern STRING OPEN_PAREN parameter CLOSE_PAREN COLON return_type modifier')
+        @self.production('function2 : pattern STRING OPEN_PAREN CLOSE_PAREN COLON return_type modifier')
+        def function(builder: StubBuilder, p):
             name = p[1]
-            self.builder.set_function_name(name.value)
+            builder.set_function_name(name.value, name.getsourcepos())
 
-        @self.pg.production('pattern : SYNC')
-        @self.pg.production('pattern : ASYNC')
-        def pattern(p):
+        @self.production('modifier : modifier2')
+        @self.production('modifier : modifier modifier2')
+        def modifiers(builder: StubBuilder, p):
+            pass
+
+        @self.production('modifier2 : BATCH NUMBER')
+        def batch_modifier(builder: StubBuilder, p):
+            builder.set_function_batch_size(int(p[1].value))
+
+        @self.production('modifier2 : WAIT STRING')
+        @self.production('modifier2 : WAIT STRING NUMBER')
+        def wait_modifier(builder: StubBuilder, p):
+            kind: str = p[1].value
+            interval = int(p[2].value) if len(p) > 2 else None
+            builder.set_function_wait_strategy(kind, interval)
+
+        @self.production('modifier2 : TIMEOUT NUMBER')
+        def timeout_modifier(builder: StubBuilder, p):
+            builder.set_function_timeout(int(p[1].value))
+
+        @self.production('pattern : SYNC')
+        @self.production('pattern : ASYNC')
+        def pattern(builder: StubBuilder, p):
             the_pattern = p[0]
             if the_pattern.gettokentype() == 'SYNC':
-                self.builder.add_synchronous_function()
+                builder.add_synchronous_function()
+            else:
+                builder.add_asynchronous_function()
+
+        @self.production('scalar_type : BOOL')
+        @self.production('scalar_type : INT8')
+        @self.production('scalar_type : INT16')
+        @self.production('scalar_type : INT32')
+        @self.production('scalar_type : INT64')
+        @self.production('scalar_type : UINT8')
+        @self.production('scalar_type : UINT16')
+        @self.production('scalar_type : UINT32')
+        @self.production('scalar_type : UINT64')
+        @self.production('scalar_type : Q7')
+        @self.production('scalar_type : Q15')
+        @self.production('scalar_type : Q31')
+        def scalar_type(builder: StubBuilder, p):
+            return p[0].value
+
+        @self.production('dimensions : OPEN_SQUARE_BRACKET NUMBER CLOSE_SQUARE_BRACKET')
+        @self.production('dimensions : dimensions OPEN_SQUARE_BRACKET NUMBER CLOSE_SQUARE_BRACKET')
+        def dimensions(builder: StubBuilder, p):
+            outer = p[0] if len(p) > 3 else ()
+            dimension = int(p[-2].value)
+            if dimension < 1:
+                # reported at the dimension itself, parsing goes on as if the array had one element
+                builder.report_error(f"Array dimensions must be at least 1, got {dimension}.",
+                                     p[-2].getsourcepos(), len(p[-2].value))
+                dimension = 1
+            return outer + (dimension,)
+
+        @self.production('return_type : scalar_type')
+        def return_type(builder: StubBuilder, p):
+            builder.set_function_return_type(p[0])
 
-        @self.pg.production('return_type : INT8')
-        @self.pg.production('return_type : VOID')
-        def return_type(p):
-            ret_type: str = p[0].value
-            self.builder.set_function_return_type(ret_type)
+        @self.production('return_type : VOID')
+        def void_return_type(builder: StubBuilder, p):
+            builder.set_function_return_type(p[0].value)
 
-        @self.pg.production('parameter : parameter2 COMMA parameter')
-        @self.pg.production('parameter : parameter2')
-        def parameters(p):
+        @self.production('return_type : scalar_type dimensions')
+        def array_return_type(builder: StubBuilder, p):
+            builder.set_function_return_type(p[0], p[1])
+
+        @self.production('parameter : parameter2 COMMA parameter')
+        @self.production('parameter : parameter2')
+        def parameters(builder: StubBuilder, p):
             pass
 
-        @self.pg.production('parameter2 : BOOL STRING')
-        @self.pg.production('parameter2 : INT8 STRING')
-        @self.pg.production('parameter2 : INT16 STRING')
-        @self.pg.production('parameter2 : INT32 STRING')
-        @self.pg.production('parameter2 : INT64 STRING')
-        def parameter(p):
-            name: str = p[1].value
-            p_type: str = p[0].value
-            self.builder.add_function_input_parameter(name, p_type, 1)
-
-        @self.pg.production('parameter2 : BOOL OPEN_SQUARE_BRACKET NUMBER CLOSE_SQUARE_BRACKET STRING')
-        @self.pg.production('parameter2 : INT8 OPEN_SQUARE_BRACKET NUMBER CLOSE_SQUARE_BRACKET STRING')
-        @self.pg.production('parameter2 : INT16 OPEN_SQUARE_BRACKET NUMBER CLOSE_SQUARE_BRACKET STRING')
-        @self.pg.production('parameter2 : INT32 OPEN_SQUARE_BRACKET NUMBER CLOSE_SQUARE_BRACKET STRING')
-        @self.pg.production('parameter2 : INT64 OPEN_SQUARE_BRACKET NUMBER CLOSE_SQUARE_BRACKET STRING')
-        def array_parameter(p):
-            p_type = p[0].value
-            length = int(p[2].value)
-            name = p[4].value
-            self.builder.add_function_input_parameter(name, p_type, length)
+        @self.production('parameter2 : parameter3')
+        @self.production('parameter2 : OUT parameter3')
+        @self.production('parameter2 : INOUT parameter3')
+        def parameter_direction(builder: StubBuilder, p):
+            name, p_type, dimensions = p[-1]
+            direction = p[0].value if len(p) > 1 else 'in'
+            builder.add_function_parameter(name.value, p_type, dimensions, direction, name.getsourcepos())
+
+        @self.production('parameter3 : scalar_type STRING')
+        def parameter(builder: StubBuilder, p):
+            return p[1], p[0], ()
+
+        @self.production('parameter3 : scalar_type dimensions STRING')
+        def array_parameter(builder: StubBuilder, p):
+            return p[2], p[0], p[1]
 
         @self.pg.error
-        def error_handle(token):
-            raise ValueError(token)
+        def error_handle(builder: StubBuilder, token):
+            # rply cannot recover from a syntax error, it is reported together with the errors found so far
+            if token.gettokentype() == '$end':
+                builder.report_error("Unexpected end of the IDL, the last declaration is incomplete.")
+            elif token.gettokentype() not in ('STRING', 'NUMBER', 'PATH_STRING') and token.value.isidentifier():
+                # most likely a name that happens to be a keyword, e.g. a parameter called wait
+                builder.report_error(f"Unexpected '{token.value}', which is a reserved IDL keyword.",
+                                     token.getsourcepos(), len(token.value))
+            else:
+                builder.report_error(f"Unexpected '{token.value}'.", token.getsourcepos(), len(token.value))
+            raise IdlError(builder.diagnostics)
 
     def get_parser(self):
+        # the built parser is independent of any builder, pass the builder to fill
+        # as parse state: parser.parse(tokens, state=builder)
         return self.pg.build()
+
+
+def _first_token(values) -> Optional[Token]:
+    # nonterminals such as parameters are tuples that hold the tokens they were parsed from
+    for value in values:
+        if isinstance(value, Token):
+            return value
+        if isinstance(value, (tuple, list)):
+            token = _first_token(value)
+            if token is not None:
+                return token
+    return None
+
+
+@lru_cache(maxsize=None)
+def get_shared_parser():
+    return Parser().get_parser()
@@ -1,9 +1,17 @@
-from typing import List
-from elasticai.stubgen.function import Function, DeployFunction, ModelComputeFunction, GetIdFunction
+import io
+from typing import Dict, List, Optional, Sequence, TextIO, Tuple
+from elasticai.stubgen.compiledstub import CompiledFunction, CompiledStub
+from elasticai.stubgen.function import Function, DeployFunction, ModelComputeFunction, GetIdFunction, \
+    OpenSessionFunction, CloseSessionFunction, ModelComputeBankFunction, WaitStrategy, WaitFunction, \
+    SelectAcceleratorFunction, IsResidentFunction, FindAcceleratorFunction, WaitForDesignFunction, ProfileFunction, \
+    ResetProfileFunction, BusFormat, ToSkeletonOrderFunction, ToHostOrderFunction, MemoryMap, WAIT_FOREVER
 from elasticai.stubgen.variable import Variable
 
 
 class Stub:
+    __slots__ = ('_name', '_body_comment', '_relative_path_to_middleware_header', 'functions', '_helper_functions',
+                 '_system_functions', '_hook_prototypes', 'variables', '_tunables',
+                 '_is_profiling', '_byte_order', '_uses_dma', '_memory_map')
 
     def __init__(self, name: str, description: str = '') -> None:
         self._name: str = name
@@ -12,7 +20,18 @@ class Stub:
         self.functions: List[Function] = []
         self._helper_functions: List[Function] = [ModelComputeFunction()]
         self._system_functions: List[Function] = []
+        # functions implemented by the application, the stub only declares them
+        self._hook_prototypes: Dict[str, str] = {}
         self.variables = dict()
+        # defines the application can override by defining them before compiling the stub
+        self._tunables: Dict[str, int] = dict()
+        self._is_profiling = False
+        self._byte_order: Optional[BusFormat.ByteOrder] = None
+        self._uses_dma = False
+        self._memory_map = MemoryMap()
+
+    def get_name(self) -> str:
+        return self._name
 
     def set_description(self, comment: str) -> None:
         self._body_comment = comment
@@ -20,28 +39,129 @@ class Stub:
     def set_relative_path_to_middleware_header(self, path: str):
         self._relative_path_to_middleware_header = path
 
-    def add_static_deploy_function(self, accel_addr: int, accel_id: int):
+    def set_memory_map(self, memory_map: MemoryMap) -> None:
+        self._memory_map = memory_map
+
+    def add_static_deploy_function(self, accel_addr: int, accel_id: int, session_var: Optional[Variable] = None):
         id_var = Variable(Variable.Type('id'), 'accelerator_id', value=accel_id)
         addr_var = Variable(Variable.Type('address'), 'accelerator_addr', value=accel_addr)
         self.variables['accelerator_id'] = id_var
         self.variables['accelerator_addr'] = addr_var
-        switch_function = DeployFunction(f'{self._name}_deploy', addr_var, id_var)
+        switch_function = DeployFunction(f'{self._name}_deploy', addr_var, id_var, session_var)
         self._system_functions.append(switch_function)
         self._helper_functions.append(GetIdFunction())
 
+    def add_accelerators(self, accelerators: List[Tuple[int, int]], session_var: Optional[Variable] = None) -> None:
+        ids_var = Variable(Variable.Type('id'), 'accelerator_ids', len(accelerators),
+                           value=[accel_id for accel_id, _ in accelerators])
+        addresses_var = Variable(Variable.Type('address'), 'accelerator_addrs', len(accelerators),
+                                 value=[accel_addr for _, accel_addr in accelerators])
+        # index of the HWA this stub deployed last, -1 if none is known to be resident;
+        # deployments of other stubs are not seen, the variable is static to this stub
+        resident_var = Variable(Variable.Type.INT16, 'resident_accelerator', value=-1)
+        for variable in (ids_var, addresses_var, resident_var):
+            self.variables[variable.identifier] = variable
+        self._tunables['DEPLOY_TIMEOUT_MS'] = 1000
+        self._tunables['DEPLOY_POLL_MS'] = 5
+        self._system_functions.append(
+            SelectAcceleratorFunction(f'{self._name}_select', ids_var, addresses_var, resident_var, session_var))
+        self._system_functions.append(IsResidentFunction(f'{self._name}_is_resident', ids_var, resident_var))
+        self._helper_functions.append(GetIdFunction())
+        self._helper_functions.append(FindAcceleratorFunction(ids_var))
+        self._helper_functions.append(WaitForDesignFunction())
+
+    def add_profiling(self) -> None:
+        self._is_profiling = True
+        self._system_functions.append(ProfileFunction(self._name))
+        self._system_functions.append(ResetProfileFunction(self._name))
+
+    def add_session_functions(self) -> Variable:
+        session_var = Variable(Variable.Type.BOOL, 'session_is_open', value='false')
+        self.variables['session_is_open'] = session_var
+        self._system_functions.append(OpenSessionFunction(f'{self._name}_open', session_var))
+        self._system_functions.append(CloseSessionFunction(f'{self._name}_close', session_var))
+        return session_var
+
+    def add_pipeline_banks(self, bank_addresses: List[int]) -> Variable:
+        banks_var = Variable(Variable.Type('address'), 'skeleton_banks', len(bank_addresses), value=bank_addresses)
+        self.variables['skeleton_banks'] = banks_var
+        self._helper_functions.append(ModelComputeBankFunction())
+        return banks_var
+
     def add_function(self, function: Function):
         self.functions.append(function)
+        wait_strategy = function.get_wait_strategy()
+        if wait_strategy is not None:
+            self._add_wait_support(wait_strategy)
+        if function.swaps_inputs():
+            self._add_byte_order_support(function.get_bus_format(), ToSkeletonOrderFunction())
+        if function.swaps_outputs():
+            self._add_byte_order_support(function.get_bus_format(), ToHostOrderFunction())
+        self._uses_dma = self._uses_dma or function.uses_dma()
+
+    def _add_byte_order_support(self, bus_format: BusFormat, helper: Function) -> None:
+        self._byte_order = bus_format.byte_order
+        if helper.get_identifier() not in [function.get_identifier() for function in self._helper_functions]:
+            self._helper_functions.append(helper)
+
+    def _add_wait_support(self, strategy: WaitStrategy) -> None:
+        helper_identifier = strategy.get_helper_identifier()
+        if helper_identifier is None:
+            return
+        if helper_identifier not in [function.get_identifier() for function in self._helper_functions]:
+            self._helper_functions.append(WaitFunction(strategy, self._name))
+        if strategy.needs_clock():
+            self._add_hook(f'{self._name}_millis', Variable.Type.UINT32)
+        if strategy.kind == WaitStrategy.Kind.YIELD:
+            self._add_hook(f'{self._name}_yield', Variable.Type.VOID)
+        if strategy.kind == WaitStrategy.Kind.INTERRUPT:
+            timeout = Variable(Variable.Type.UINT32, 'timeout_ms', scope=Variable.Scope.LOCAL)
+            self._add_hook(f'{self._name}_wait_for_completion', Variable.Type.BOOL, [timeout])
+
+    def _add_hook(self, identifier: str, return_type: Variable.Type, arguments: Sequence[Variable] = ()) -> None:
+        if identifier not in self._hook_prototypes:
+            parameters = ', '.join(argument.as_parameter_in_signature() for argument in arguments)
+            self._hook_prototypes[identifier] = \
+                f'{return_type.as_c_code()} {identifier}({parameters or Variable.Type.VOID.as_c_code()});\n'
 
     def as_c_code(self) -> str:
-        result: str = self._generate_starting_comment()
-        result += self._generate_includes()
-        result += self._generate_defines()
-        result += self._generate_helper_function_prototypes()
-        result += self._generate_variables()
-        result += self._generate_system_functions()
-        result += self._generate_stub_functions()
-        result += self._generate_helper_functions()
-        return result
+        buffer = io.StringIO()
+        self.write_c_code(buffer)
+        return buffer.getvalue()
+
+    def write_c_code(self, sink: TextIO) -> None:
+        self.compile().write_c_code(sink)
+
+    def compile(self) -> CompiledStub:
+        exported = tuple(CompiledFunction(function.as_c_prototype(), function)
+                         for function in self._system_functions + self.functions)
+        code_opening = self._generate_starting_comment() + \
+            self._generate_includes() + \
+            self._generate_defines() + \
+            self._generate_profile_macros() + \
+            self._generate_prototypes(self._helper_functions) + '\n' + \
+            self._generate_variables()
+        header_opening = f'#ifndef {self._name.upper()}_STUB_H\n' \
+                         f'#define {self._name.upper()}_STUB_H\n' \
+                         f'\n' \
+                         f'#include <stdbool.h>\n' \
+                         f'#include <stdint.h>\n' \
+                         f'{self._generate_additional_interface_includes()}' \
+                         f'\n' \
+                         f'{self._generate_wait_defines()}' \
+                         f'{self._generate_profile_types()}'
+        header_closing = ''
+        if self._hook_prototypes:
+            header_closing += '\n/* to be implemented by the application */\n' + \
+                ''.join(self._hook_prototypes.values())
+        header_closing += '\n' \
+                          '#endif\n'
+        return CompiledStub(header_opening, header_closing, code_opening, exported, tuple(self._helper_functions))
+
+    def _generate_wait_defines(self) -> str:
+        if not any(isinstance(function, WaitFunction) for function in self._helper_functions):
+            return ''
+        return f'#define {WAIT_FOREVER} UINT32_MAX\n\n'
 
     def _generate_starting_comment(self) -> str:
         text = self._body_comment.replace('\n', '\n * ')
@@ -57,68 +177,133 @@ class Stub:
                f'#include "Sleep.h"\n' \
                f'#include "{self._name.lower()}.h"\n\n' \
                f'#include <stdint.h>\n' \
-               f'#include <stdbool.h>\n\n' \
+               f'#include <stdbool.h>\n' \
+               f'{self._generate_additional_system_includes()}\n'
+
+    def _generate_additional_system_includes(self) -> str:
+        functions = self._system_functions + self.functions + self._helper_functions
+        return self._generate_system_includes([function.get_required_system_headers() for function in functions])
 
+    def _generate_additional_interface_includes(self) -> str:
+        functions = self._system_functions + self.functions
+        return self._generate_system_includes([function.get_required_interface_headers() for function in functions])
+
+    @staticmethod
+    def _generate_system_includes(required_headers: List[List[str]]) -> str:
+        headers: List[str] = []
+        for function_headers in required_headers:
+            for header in function_headers:
+                if header not in headers:
+                    headers.append(header)
+        return ''.join(f'#include <{header}>\n' for header in headers)
 
     def _generate_defines(self) -> str:
         path = self._relative_path_to_middleware_header
         if len(path) > 0 and path[-1] != '/':
             path += '/'
-        return f'#define ADDR_SKELETON_INPUTS 0\n' \
-               f'#define ADDR_COMPUTATION_ENABLE 100\n\n'
-
-    def _generate_helper_function_prototypes(self) -> str:
-        result = ''
-        for function in self._helper_functions:
-            result += f'{function.as_c_prototype()}'
-        return f'{result}\n'
-
-    def _generate_variables(self):
-        result = ''
-        for var in self.variables.values():
-            result += var.as_initialization()
-        if self.variables:
+        memory = self._memory_map
+        result = f'#define ADDR_SKELETON_INPUTS {memory.inputs.address}\n'
+        if memory.has_output_region():
+            result += f'#define ADDR_SKELETON_OUTPUTS {memory.outputs.address}\n'
+        result += f'#define ADDR_COMPUTATION_ENABLE {memory.control}\n\n'
+        if self._byte_order is not None:
+            result += self._generate_byte_order_defines()
+        if self._uses_dma:
+            result += self._generate_dma_defines()
+        for name, value in self._tunables.items():
+            result += f'#ifndef {name}\n' \
+                      f'#define {name} {value}\n' \
+                      f'#endif\n'
+        if self._tunables:
             result += '\n'
         return result
 
-    def _generate_system_functions(self) -> str:
-        result: str = ''
-        for function in self._system_functions:
-            result += f'{function.as_c_code()}'
-        return result
+    def _generate_byte_order_defines(self) -> str:
+        # the byte order of the host is only known to the compiler, hosts that do not tell are little endian
+        swaps_on_big_endian_host = int(self._byte_order == BusFormat.ByteOrder.LITTLE)
+        return f'#ifndef SKELETON_SWAPS_BYTES\n' \
+               f'#if defined(__BYTE_ORDER__) && __BYTE_ORDER__ == __ORDER_BIG_ENDIAN__\n' \
+               f'#define SKELETON_SWAPS_BYTES {swaps_on_big_endian_host}\n' \
+               f'#else\n' \
+               f'#define SKELETON_SWAPS_BYTES {1 - swaps_on_big_endian_host}\n' \
+               f'#endif\n' \
+               f'#endif\n\n'
 
-    def _generate_stub_functions(self) -> str:
-        result: str = ''
-        for function in self.functions:
-            result += function.as_c_code()
-        return result
+    @staticmethod
+    def _generate_dma_defines() -> str:
+        # the DMA API of the middleware can be replaced by the application
+        return '#ifndef STUB_DMA_WRITE\n' \
+               '#define STUB_DMA_WRITE(address, data, length) middlewareWriteDma(address, data, length)\n' \
+               '#endif\n' \
+               '#ifndef STUB_DMA_WAIT\n' \
+               '#define STUB_DMA_WAIT() middlewareWaitForDma()\n' \
+               '#endif\n\n'
 
-    def _generate_helper_functions(self) -> str:
-        result = ''
-        for function in self._helper_functions:
-            result += f'{function.as_c_code()}'
+    def _generate_variables(self) -> str:
+        result = ''.join(var.as_initialization() for var in self.variables.values())
+        if self._is_profiling:
+            result += f'static {self._name}_phase_stats_t profile_stats[{self._name.upper()}_PROFILED_FUNCTIONS]' \
+                      f'[{self._name.upper()}_PHASES];\n'
+        if self.variables or self._is_profiling:
+            result += '\n'
         return result
 
+    def _generate_profile_types(self) -> str:
+        if not self._is_profiling:
+            return ''
+        prefix = self._name.upper()
+        phases = [f'{prefix}_PHASE_{phase}' for phase in ('INIT', 'TRANSFER', 'START', 'WAIT', 'READ')]
+        profiled = [function.get_profile_id() for function in self.functions
+                    if function.get_profile_id() is not None]
+        return self._generate_enum(phases + [f'{prefix}_PHASES'], f'{self._name}_phase_t') + \
+            self._generate_enum(profiled + [f'{prefix}_PROFILED_FUNCTIONS'], f'{self._name}_function_t') + \
+            f'typedef struct {{\n' \
+            f'   uint32_t calls;\n' \
+            f'   uint64_t total_cycles;\n' \
+            f'   uint32_t max_cycles;\n' \
+            f'}} {self._name}_phase_stats_t;\n\n'
+
+    @staticmethod
+    def _generate_enum(constants: List[str], type_name: str) -> str:
+        return 'typedef enum {\n' + \
+            ',\n'.join(f'   {constant}' for constant in constants) + \
+            f'\n}} {type_name};\n\n'
+
+    def _generate_profile_macros(self) -> str:
+        # compiled out unless STUB_PROFILE is defined, or replaced by macros of the application
+        if not self._is_profiling:
+            return ''
+        return '#ifdef STUB_PROF_HEADER\n' \
+               '#include STUB_PROF_HEADER\n' \
+               '#endif\n' \
+               '#if defined(STUB_PROFILE) && !defined(STUB_PROF_BEGIN)\n' \
+               '#ifndef STUB_PROF_CYCLES\n' \
+               '#error "STUB_PROFILE needs STUB_PROF_CYCLES() to read a cycle counter"\n' \
+               '#endif\n' \
+               '#define STUB_PROF_BEGIN(fn, phase) uint32_t prof_start_##phase = STUB_PROF_CYCLES()\n' \
+               '#define STUB_PROF_END(fn, phase) do { \\\n' \
+               '   uint32_t prof_cycles = STUB_PROF_CYCLES() - prof_start_##phase; \\\n' \
+               '   profile_stats[fn][phase].calls++; \\\n' \
+               '   profile_stats[fn][phase].total_cycles += prof_cycles; \\\n' \
+               '   if( prof_cycles > profile_stats[fn][phase].max_cycles ) \\\n' \
+               '      profile_stats[fn][phase].max_cycles = prof_cycles; \\\n' \
+               '} while(0)\n' \
+               '#endif\n' \
+               '#ifndef STUB_PROF_BEGIN\n' \
+               '#define STUB_PROF_BEGIN(fn, phase)\n' \
+               '#endif\n' \
+               '#ifndef STUB_PROF_END\n' \
+               '#define STUB_PROF_END(fn, phase)\n' \
+               '#endif\n\n'
+
+    @staticmethod
+    def _generate_prototypes(functions: List[Function]) -> str:
+        return ''.join(function.as_c_prototype() for function in functions)
+
     def as_c_header(self) -> str:
-        return f'#ifndef {self._name.upper()}_STUB_H\n' \
-               f'#define {self._name.upper()}_STUB_H\n' \
-               f'\n' \
-               f'#include <stdbool.h>\n' \
-               f'#include <stdint.h>\n' \
-               f'\n' \
-               f'{self._generate_system_function_prototypes()}' \
-               f'{self._generate_stub_function_prototypes()}' \
-               f'\n' \
-               f'#endif\n'
-
-    def _generate_system_function_prototypes(self) -> str:
-        result: str = ''
-        for function in self._system_functions:
-            result += function.as_c_prototype()
-        return result
+        buffer = io.StringIO()
+        self.write_c_header(buffer)
+        return buffer.getvalue()
 
-    def _generate_stub_function_prototypes(self) -> str:
-        result: str = ''
-        for function in self.functions:
-            result += function.as_c_prototype()
-        return result
+    def write_c_header(self, sink: TextIO) -> None:
+        self.compile().write_c_header(sink)
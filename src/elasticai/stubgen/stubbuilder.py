@@ -1,21 +1,55 @@
-from typing import List
+import re
+from enum import Enum
+from typing import List, Optional, Set, Tuple, Type
 
+from elasticai.stubgen.diagnostics import Diagnostic, IdlError
+from elasticai.stubgen.function import BusFormat, MemoryMap, ParameterLayout, SyncFunction, WaitStrategy
 from elasticai.stubgen.functionbuilder import FunctionBuilder
-from elasticai.stubgen.variable import Variable
+from elasticai.stubgen.variable import Variable, element_count
 from elasticai.stubgen.stub import Stub
 
+# the keywords of C99 and the macros of stdbool.h and stddef.h, which every stub includes
+_C_KEYWORDS = frozenset((
+    'auto', 'break', 'case', 'char', 'const', 'continue', 'default', 'do', 'double', 'else', 'enum',
+    'extern', 'float', 'for', 'goto', 'if', 'inline', 'int', 'long', 'register', 'restrict', 'return',
+    'short', 'signed', 'sizeof', 'static', 'struct', 'switch', 'typedef', 'union', 'unsigned', 'void',
+    'volatile', 'while', '_Bool', '_Complex', '_Imaginary', 'true', 'false', 'NULL'))
+_C_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# middlewareGetDesignId() reports the id of the loaded design in a single byte
+_MAX_ACCELERATOR_ID = 0xFF
+_MAX_ADDRESS = 0xFFFFFFFF
+
 
 class StubBuilder:
 
     def __init__(self) -> None:
         self._middleware_path = None
         self.stub_name: str = ''
+        self._name_position = None
         self._accelerator_id = None
         self._accelerator_address = None
+        self._accelerators: List[Tuple[int, int]] = []
+        self._transfer_mode = SyncFunction.TransferMode.SEPARATE
+        self._read_mode = SyncFunction.ReadMode.BULK
+        self._read_width = 1
+        self._uses_sessions = False
+        self._is_profiling = False
+        self._bus_format = BusFormat()
+        self._dma_threshold: Optional[int] = None
+        self._memory_map = MemoryMap()
+        self._pipeline_bank_addresses: List[int] = []
+        self._wait_kind = WaitStrategy.Kind.SPIN
+        self._wait_interval: Optional[int] = None
+        self._timeout: Optional[int] = None
         self.functions: List[FunctionBuilder] = []
+        self.diagnostics: List[Diagnostic] = []
+
+    def report_error(self, message: str, position=None, length: int = 1) -> None:
+        self.diagnostics.append(Diagnostic.at(position, message, length))
 
-    def set_name(self, name: str) -> None:
+    def set_name(self, name: str, position=None) -> None:
         self.stub_name = name
+        self._name_position = position
 
     def set_accelerator_id(self, accel_id: int) -> None:
         self._accelerator_id = accel_id
@@ -23,34 +57,298 @@ class StubBuilder:
     def set_accelerator_address(self, address: int) -> None:
         self._accelerator_address = address
 
+    def add_accelerator(self, accel_id: int, address: int) -> None:
+        if accel_id in [known_id for known_id, _ in self._accelerators]:
+            raise ValueError(f"The accelerator {accel_id} is deployed more than once.")
+        if accel_id > _MAX_ACCELERATOR_ID:
+            raise ValueError(f"Accelerator id {accel_id} does not fit into the {_MAX_ACCELERATOR_ID.bit_length()} bit "
+                             f"design id reported by the middleware.")
+        if address > _MAX_ADDRESS:
+            raise ValueError(f"Accelerator address {address} does not fit into 32 bit.")
+        self._accelerators.append((accel_id, address))
+
+    def set_bus_format(self, word_width: int, byte_order: Optional[str] = None) -> None:
+        order = _enum_value(BusFormat.ByteOrder, byte_order, 'byte order') if byte_order is not None else None
+        self._bus_format = BusFormat(word_width, order)
+
+    def set_dma_threshold(self, threshold: int) -> None:
+        if threshold < 1:
+            raise ValueError(f"DMA threshold must be at least 1 byte, got {threshold}.")
+        self._dma_threshold = threshold
+
+    def set_memory_map(self, regions: List[Tuple[str, int, Optional[int]]]) -> None:
+        # regions that are not given keep their default place
+        given = {}
+        for name, address, size in regions:
+            if name not in ('inputs', 'outputs', 'control'):
+                raise ValueError(f"Unknown memory region '{name}', expected inputs, outputs or control.")
+            if name in given:
+                raise ValueError(f"The memory region '{name}' is given more than once.")
+            if (size is None) != (name == 'control'):
+                raise ValueError("The inputs and outputs regions need an address and a size, "
+                                 "the control register only an address.")
+            given[name] = MemoryMap.Region(address, size) if size is not None else address
+        default = MemoryMap()
+        self._memory_map = MemoryMap(given.get('inputs', default.inputs), given.get('control', default.control),
+                                     given.get('outputs'))
+
+    def set_transfer_mode(self, mode: str) -> None:
+        self._transfer_mode = _enum_value(SyncFunction.TransferMode, mode, 'transfer mode')
+
+    def set_read_mode(self, mode: str, width: Optional[int] = None) -> None:
+        read_mode = _enum_value(SyncFunction.ReadMode, mode, 'read mode')
+        if read_mode == SyncFunction.ReadMode.ALIGNED:
+            if width is None:
+                raise ValueError("Aligned reads need a word width, e.g., 'read aligned 4'.")
+            if width < 2:
+                raise ValueError(f"Aligned reads need a word width of at least two bytes, got {width}.")
+        elif width is not None:
+            raise ValueError(f"Bulk reads take no word width, got {width}.")
+        self._read_mode = read_mode
+        self._read_width = width if width is not None else 1
+
+    def enable_sessions(self) -> None:
+        self._uses_sessions = True
+
+    def enable_profiling(self) -> None:
+        self._is_profiling = True
+
+    def set_pipeline_banks(self, addresses: List[int]) -> None:
+        if len(addresses) < 2:
+            raise ValueError("A pipeline needs at least two input banks.")
+        self._pipeline_bank_addresses = list(addresses)
+
+    def set_wait_strategy(self, kind: str, interval: Optional[int] = None) -> None:
+        self._wait_kind = _enum_value(WaitStrategy.Kind, kind, 'wait strategy')
+        self._wait_interval = interval
+
+    def set_timeout(self, timeout: int) -> None:
+        self._timeout = timeout
+
     def add_synchronous_function(self) -> None:
         self.functions.append(FunctionBuilder())
         self.functions[-1].set_call_pattern(FunctionBuilder.CallPattern.SYNC)
 
-    def set_function_name(self, name: str) -> None:
-        self.functions[-1].set_name(name)
+    def add_asynchronous_function(self) -> None:
+        self.functions.append(FunctionBuilder())
+        self.functions[-1].set_call_pattern(FunctionBuilder.CallPattern.ASYNC)
+
+    def set_function_name(self, name: str, position=None) -> None:
+        self.functions[-1].set_name(name, position)
+
+    def set_function_batch_size(self, batch_size: int) -> None:
+        self.functions[-1].set_batch_size(batch_size)
+
+    def set_function_wait_strategy(self, kind: str, interval: Optional[int] = None) -> None:
+        self.functions[-1].set_wait_strategy(_enum_value(WaitStrategy.Kind, kind, 'wait strategy'), interval)
+
+    def set_function_timeout(self, timeout: int) -> None:
+        self.functions[-1].set_timeout(timeout)
 
-    def set_function_return_type(self, ret_type: str) -> None:
-        self.functions[-1].set_return_type(Variable.Type(ret_type))
+    def set_function_return_type(self, ret_type: str, dimensions: Tuple[int, ...] = ()) -> None:
+        # arrays are returned through a flat pointer, whatever their number of dimensions
+        self.functions[-1].set_return_type(Variable.Type(ret_type), element_count(dimensions))
 
-    def add_function_input_parameter(self, param_name: str, param_type: str, length: int) -> None:
-        self.functions[-1].add_input_parameter(Variable.Type(param_type), param_name, length)
+    def add_function_parameter(self, param_name: str, param_type: str, dimensions: Tuple[int, ...],
+                               direction: str, position=None) -> None:
+        scopes = {'in': Variable.Scope.INPUT, 'out': Variable.Scope.OUTPUT, 'inout': Variable.Scope.INOUT}
+        self.functions[-1].add_parameter(Variable.Type(param_type), param_name, element_count(dimensions),
+                                         scopes[direction], dimensions, position)
 
     def _has_deploy_function(self) -> bool:
         return self._accelerator_address is not None and self._accelerator_id is not None
 
+    def validate(self) -> List[Diagnostic]:
+        # checks everything the grammar cannot express, generate() reports the errors together with
+        # those found while parsing and while building the functions
+        self._check_identifier(self.stub_name, 'Stub name', self._name_position)
+        self._check_function_names()
+        for function in self.functions:
+            self._check_parameter_names(function)
+            self._check_skeleton_layout(function)
+        return self.diagnostics
+
+    def _check_identifier(self, name: str, what: str, position) -> bool:
+        if _C_IDENTIFIER.fullmatch(name) is None:
+            self.report_error(f"{what} '{name}' is not a valid C identifier.", position, len(name))
+            return False
+        return True
+
+    def _check_function_names(self) -> None:
+        owners = {name: None for name in self._system_function_names()}
+        for function in self.functions:
+            if not self._check_identifier(function.name, 'Function name', function.position):
+                continue
+            for name in _generated_names(function, bool(self._pipeline_bank_addresses)):
+                if name not in owners:
+                    owners[name] = function
+                    continue
+                owner = owners[name]
+                if owner is None:
+                    message = f"Function '{function.name}' clashes with the generated function " \
+                              f"'{self.stub_name}_{name}'."
+                elif owner.name == function.name:
+                    message = f"Function '{function.name}' is already defined{_at_line(owner.position)}."
+                else:
+                    message = f"Function '{function.name}' generates '{self.stub_name}_{name}', which is also " \
+                              f"generated for function '{owner.name}'{_at_line(owner.position)}."
+                self.report_error(message, function.position, len(function.name))
+                break
+
+    def _system_function_names(self) -> List[str]:
+        names = []
+        if len(self._accelerators) > 1:
+            names += ['select', 'is_resident']
+        elif self._has_deploy_function():
+            names.append('deploy')
+        if self._uses_sessions:
+            names += ['open', 'close']
+        if self._is_profiling:
+            names += ['profile', 'profile_reset']
+        return names
+
+    def _check_parameter_names(self, function: FunctionBuilder) -> None:
+        reserved = self._reserved_names(function)
+        seen: Set[str] = set()
+        for parameter, position in zip(function.parameters, function.parameter_positions):
+            name = parameter.identifier
+            if not self._check_identifier(name, 'Parameter name', position):
+                continue
+            if name in seen:
+                self.report_error(f"Parameter '{name}' of function '{function.name}' is declared twice.",
+                                  position, len(name))
+            elif name in _C_KEYWORDS:
+                self.report_error(f"Parameter '{name}' of function '{function.name}' is a reserved word in C.",
+                                  position, len(name))
+            elif name in reserved:
+                self.report_error(f"Parameter '{name}' of function '{function.name}' hides a name the generated "
+                                  f"code of the function uses.", position, len(name))
+            seen.add(name)
+
+    def _reserved_names(self, function: FunctionBuilder) -> Set[str]:
+        # names the generated function bodies use besides the parameters
+        names = set()
+        if function.return_elements > 1:
+            names.add('result')
+        if function.pattern == FunctionBuilder.CallPattern.ASYNC:
+            names.add('callback')
+        elif function.batch_size is not None or self._pipeline_bank_addresses:
+            names.update(('n', 'i', 'next', 'results'))
+        if self._uses_sessions:
+            names.add('session_is_open')
+        if self._pipeline_bank_addresses:
+            names.add('skeleton_banks')
+        if self._is_profiling:
+            names.add('profile_stats')
+        return names
+
+    def _check_skeleton_layout(self, function: FunctionBuilder) -> None:
+        memory = self._memory_map
+        result_length = function.returnType.get_length_in_byte() * function.return_elements
+        layout = ParameterLayout.of(function.parameters, result_length, self._bus_format.get_word_length_in_byte())
+        if layout.input_length > memory.inputs.size:
+            self._report_layout_error(function, f"The {layout.input_length} bytes of parameters of function "
+                                                f"'{function.name}' do not fit into the input region of "
+                                                f"{memory.inputs.size} bytes at address {memory.inputs.address}.")
+        outputs = memory.get_output_region()
+        if layout.output_length > outputs.size:
+            self._report_layout_error(function, f"The {layout.output_length} bytes of result and output parameters of "
+                                                f"function '{function.name}' do not fit into the "
+                                                f"{'output' if memory.has_output_region() else 'input'} region of "
+                                                f"{outputs.size} bytes at address {outputs.address}.")
+        if self._pipeline_bank_addresses:
+            self._check_pipeline_banks(function, layout)
+
+    def _check_pipeline_banks(self, function: FunctionBuilder, layout: ParameterLayout) -> None:
+        memory = self._memory_map
+        # without an output region, the outputs of a sample are read from its bank
+        length = layout.input_length if memory.has_output_region() else max(layout.input_length, layout.output_length)
+        for address in self._pipeline_bank_addresses:
+            bank = MemoryMap.Region(address, length)
+            if bank.contains(memory.control):
+                self._report_layout_error(function, f"The {length} bytes of function '{function.name}' in the pipeline "
+                                                    f"bank at address {address} overlap the control address "
+                                                    f"{memory.control}.")
+                return
+            if memory.has_output_region() and bank.overlaps(memory.outputs):
+                self._report_layout_error(function, f"The {length} bytes of function '{function.name}' in the pipeline "
+                                                    f"bank at address {address} overlap the output region.")
+                return
+        banks = sorted(self._pipeline_bank_addresses)
+        for bank, next_bank in zip(banks, banks[1:]):
+            if next_bank - bank < length:
+                self._report_layout_error(function, f"The {length} bytes of function '{function.name}' do not fit "
+                                                    f"into the pipeline bank at address {bank} before the next bank "
+                                                    f"at address {next_bank}.")
+                return
+
+    def _report_layout_error(self, function: FunctionBuilder, message: str) -> None:
+        self.report_error(message, function.position, len(function.name))
+
     def generate(self) -> Stub:
+        diagnostics = list(self.diagnostics)
         stub = Stub(self.stub_name, 'This is an autogenerated stub. \nDo not change it manually.')
-        if self._has_deploy_function():
-            stub.add_static_deploy_function(self._accelerator_address, self._accelerator_id)
+        session_var = stub.add_session_functions() if self._uses_sessions else None
+        if len(self._accelerators) > 1:
+            stub.add_accelerators(self._accelerators, session_var)
+        elif self._has_deploy_function():
+            stub.add_static_deploy_function(self._accelerator_address, self._accelerator_id, session_var)
         if self._middleware_path:
             stub.set_relative_path_to_middleware_header(self._middleware_path)
+        stub.set_memory_map(self._memory_map)
+        banks_var = None
+        if self._pipeline_bank_addresses:
+            banks_var = stub.add_pipeline_banks(self._pipeline_bank_addresses)
 
         for function in self.functions:
             function.set_name_prefix(self.stub_name)
-            stub.add_function(function.generate())
+            function.set_transfer_mode(self._transfer_mode)
+            function.set_read_mode(self._read_mode, self._read_width)
+            function.set_bus_format(self._bus_format)
+            function.set_dma_threshold(self._dma_threshold)
+            function.set_memory_map(self._memory_map)
+            function.set_session(session_var)
+            function.set_default_wait_strategy(self._wait_kind, self._wait_interval, self._timeout)
+            if function.pattern == FunctionBuilder.CallPattern.SYNC:
+                function.set_pipeline_banks(banks_var)
+                function.set_profiling(self.stub_name.upper() if self._is_profiling else None)
+            try:
+                stub.add_function(function.generate())
+            except ValueError as error:
+                diagnostics.append(Diagnostic.at(function.position, str(error), len(function.name)))
+        if self._is_profiling:
+            if any(function.pattern == FunctionBuilder.CallPattern.SYNC for function in self.functions):
+                stub.add_profiling()
+            else:
+                diagnostics.append(Diagnostic("Profiling needs at least one synchronous function."))
 
+        if diagnostics:
+            raise IdlError(diagnostics)
         return stub
 
     def set_middleware_path(self, path: str):
         self._middleware_path = path
+
+
+def _enum_value(enum: Type[Enum], value: str, what: str):
+    try:
+        return enum(value)
+    except ValueError:
+        raise ValueError(f"Unknown {what} '{value}', expected one of "
+                         f"{', '.join(member.value for member in enum)}.") from None
+
+
+def _generated_names(function: FunctionBuilder, is_pipelined: bool) -> List[str]:
+    # the names the function adds to the header, without the prefix of the stub
+    if function.pattern == FunctionBuilder.CallPattern.ASYNC:
+        return [f'{function.name}_start', f'{function.name}_poll', f'{function.name}_result']
+    names = [function.name]
+    if function.batch_size is not None:
+        names.append(f'{function.name}_batch')
+    if is_pipelined:
+        names.append(f'{function.name}_pipelined')
+    return names
+
+
+def _at_line(position) -> str:
+    return f' in line {position.lineno}' if position is not None else ''
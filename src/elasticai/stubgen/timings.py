@@ -0,0 +1,87 @@
+import io
+import json
+import os
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from rply import LexingError
+
+from elasticai.stubgen.diagnostics import IdlError, unexpected_character
+from elasticai.stubgen.incremental import stream_files_if_changed
+from elasticai.stubgen.lexer import Lexer
+from elasticai.stubgen.parser import Parser
+from elasticai.stubgen.stubbuilder import StubBuilder
+
+STAGES = ('lexer_build', 'tokenize', 'parser_build', 'parse', 'validate', 'generate', 'render', 'write')
+
+# runs one stage and returns its result together with what was measured
+Measure = Callable[[Callable], Tuple[object, float]]
+
+
+class StageTiming(NamedTuple):
+    stage: str
+    seconds: float
+    peak_bytes: int
+
+
+def time_stub_generation(idl_file: str) -> List[StageTiming]:
+    # memory is traced in a second run because tracing slows down every allocation, the second
+    # run writes the same files again
+    seconds = _generate_in_stages(idl_file, _timed)
+    peak_bytes = _generate_in_stages(idl_file, _memory_peak)
+    return [StageTiming(stage, seconds[stage], int(peak_bytes[stage])) for stage in STAGES]
+
+
+def _generate_in_stages(idl_file: str, measure: Measure) -> Dict[str, float]:
+    # the same steps as the stub generation, but lexer and parser are built from scratch instead of
+    # shared and the stub is rendered completely before it is written; the parser skips the table
+    # cache, which would turn parser_build into loading the cached tables after the first run
+    with open(idl_file, 'r') as reader:
+        idl_text = reader.read()
+    lexer, lexer_build = measure(lambda: Lexer().get_lexer())
+    parser, parser_build = measure(lambda: Parser(cache_id=None).get_parser())
+    builder = StubBuilder()
+    try:
+        tokens, tokenize = measure(lambda: list(lexer.lex(idl_text)))
+        _, parse = measure(lambda: parser.parse(iter(tokens), state=builder))
+        _, validate = measure(builder.validate)
+        stub, generate = measure(builder.generate)
+    except LexingError as error:
+        raise IdlError([unexpected_character(error.getsourcepos().idx, idl_text)], idl_file, idl_text) from None
+    except IdlError as error:
+        raise IdlError(error.diagnostics, idl_file, idl_text) from None
+    header, code = io.StringIO(), io.StringIO()
+    _, render = measure(lambda: stub.compile().write(header, code))
+    base_name = os.path.splitext(idl_file)[0]
+    output_files = [f'{base_name}.h', f'{base_name}.c']
+    _, write = measure(lambda: stream_files_if_changed(output_files, lambda header_sink, code_sink: (
+        header_sink.write(header.getvalue()), code_sink.write(code.getvalue()))))
+    return dict(zip(STAGES, (lexer_build, tokenize, parser_build, parse, validate, generate, render, write)))
+
+
+def _timed(action: Callable) -> Tuple[object, float]:
+    start = time.perf_counter()
+    result = action()
+    return result, time.perf_counter() - start
+
+
+def _memory_peak(action: Callable) -> Tuple[object, float]:
+    tracemalloc.start()
+    try:
+        result = action()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def print_timings(timings: List[StageTiming]) -> None:
+    for timing in timings:
+        print(f'{timing.stage:>14} {timing.seconds * 1000:9.2f} ms {timing.peak_bytes / 1024:10.1f} KiB peak')
+    print(f'{"total":>14} {sum(timing.seconds for timing in timings) * 1000:9.2f} ms')
+
+
+def write_timings_json(timings: List[StageTiming], idl_file: str, file_name: str) -> None:
+    report = {'idl_file': idl_file, 'stages': [timing._asdict() for timing in timings]}
+    with open(file_name, 'w') as writer:
+        json.dump(report, writer, indent=2)
@@ -1,15 +1,47 @@
+import sys
 from enum import Enum
+from typing import Dict, Optional, Tuple
+
+# IDL type: C type, size in byte, alignment in byte
+_TYPE_TABLE: Dict[str, Tuple[str, int, int]] = {
+    'bool': ('bool', 1, 1),
+    'uint8': ('uint8_t', 1, 1),
+    'int8': ('int8_t', 1, 1),
+    'uint16': ('uint16_t', 2, 2),
+    'uint32': ('uint32_t', 4, 4),
+    'uint64': ('uint64_t', 8, 8),
+    'int16': ('int16_t', 2, 2),
+    'int32': ('int32_t', 4, 4),
+    'int64': ('int64_t', 8, 8),
+    # signed fixed-point values with 7, 15 and 31 fraction bits, as in the CMSIS q7_t, q15_t and q31_t
+    'q7': ('int8_t', 1, 1),
+    'q15': ('int16_t', 2, 2),
+    'q31': ('int32_t', 4, 4),
+    'void': ('void', 0, 1),
+    'address': ('uint32_t', 4, 4),
+    'id': ('uint64_t', 8, 8),
+}
 
 
 class Variable:
+    # parsed IDLs can have tens of thousands of parameters, so variables are slotted and immutable
+    __slots__ = ('type', 'identifier', 'elements', 'scope', 'value')
+    # only arrays with several dimensions have a shape, see ShapedVariable
+    shape: Optional[Tuple[int, ...]] = None
 
     class Type(Enum):
         BOOL = 'bool'
         UINT8 = 'uint8'
         INT8 = 'int8'
+        UINT16 = 'uint16'
+        UINT32 = 'uint32'
+        UINT64 = 'uint64'
         INT16 = 'int16'
         INT32 = 'int32'
         INT64 = 'int64'
+        Q7 = 'q7'
+        Q15 = 'q15'
+        Q31 = 'q31'
         VOID = 'void'
         ADDRESS = 'address'
         ID = 'id'
@@ -19,38 +51,7 @@ class Variable:
             return Variable.Type(as_string)
 
         def __init__(self, as_string: str):
-            self.var_type: str = ''
-            self.length: int
-
-            if as_string == 'bool':
-                self.var_type = 'bool'
-                self.length = 1
-            elif as_string == 'uint8':
-                self.var_type = 'uint8_t'
-                self.length = 1
-            elif as_string == 'int8':
-                self.var_type = 'int8_t'
-                self.length = 1
-            elif as_string == 'int16':
-                self.var_type = 'int16_t'
-                self.length = 2
-            elif as_string == 'int32':
-                self.var_type = 'int32_t'
-                self.length = 4
-            elif as_string == 'int64':
-                self.var_type = 'int64_t'
-                self.length = 8
-            elif as_string == 'void':
-                self.var_type = 'void'
-                self.length = 0
-            elif as_string == 'address':
-                self.var_type = 'uint32_t'
-                self.length = 4
-            elif as_string == 'id':
-                self.var_type = 'uint64_t'
-                self.length = 8
-            else:
-                raise "UNKNOWN TYPE"
+            self.var_type, self.length, self.alignment = _TYPE_TABLE[as_string]
 
         def as_c_code(self):
             return self.var_type
@@ -58,51 +59,90 @@ class Variable:
         def get_length_in_byte(self) -> int:
             return self.length
 
+        def get_alignment_in_byte(self) -> int:
+            return self.alignment
+
     class Scope(Enum):
         INPUT = 1
         OUTPUT = 2
         LOCAL = 3
         STUB = 4
         RETURN = 5
+        INOUT = 6
 
     def __init__(self, v_type: Type, name: str, elements=1, scope=Scope.STUB, value=None) -> None:
-        self.type: Variable.Type = v_type
-        self.identifier: str = name
-        self.elements: int = elements
-        self.scope: Variable.Scope = scope
-        self.value = value
+        set_attribute = super().__setattr__
+        set_attribute('type', v_type)
+        set_attribute('identifier', sys.intern(name))
+        set_attribute('elements', elements)
+        set_attribute('scope', scope)
+        set_attribute('value', value)
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError(f'Variable is immutable, cannot set {name}')
 
     def get_length_in_byte(self) -> int:
         return self.elements * self.type.get_length_in_byte()
 
     def as_initialization(self) -> str:
         result = self._prefix()
-        result += f'{self._as_typed_var()} = {self.value};\n'
+        if self._is_array():
+            values = ', '.join(str(value) for value in self.value)
+            result += f'{self.type.as_c_code()} {self.identifier}[{self.elements}] = {{{values}}};\n'
+        else:
+            result += f'{self._as_typed_var()} = {self.value};\n'
         return result
 
     def as_definition(self) -> str:
         result = self._prefix()
-        result += f'{self._as_typed_var()};\n'
+        if self._is_array():
+            result += f'{self.type.as_c_code()} {self.identifier}[{self.elements}];\n'
+        else:
+            result += f'{self._as_typed_var()};\n'
         return result
 
     def as_parameter_in_signature(self) -> str:
         return self._as_typed_var()
 
     def as_pass_by_reference(self) -> str:
-        if self._is_array():
+        if self._is_array() or self.is_output():
             return self.identifier
         else:
             return f'&{self.identifier}'
 
+    def as_batch_parameter_in_signature(self) -> str:
+        # the values of all samples of a batch are passed one after another
+        return f'{self._const_prefix()}{self.type.as_c_code()} *{self.identifier}'
+
+    def is_input(self) -> bool:
+        return self.scope != Variable.Scope.OUTPUT
+
+    def is_output(self) -> bool:
+        # output parameters are written by the stub straight into the caller's memory
+        return self.scope in (Variable.Scope.OUTPUT, Variable.Scope.INOUT)
+
+    def as_sample_reference(self, index: str) -> str:
+        if self._is_array():
+            return f'{self.identifier}+{index}*{self.elements}'
+        else:
+            return f'{self.identifier}+{index}'
+
     def _is_array(self) -> bool:
-        return self.elements > 1
+        return self.elements > 1 or self.shape is not None
 
     def _as_typed_var(self) -> str:
-        if self._is_array():
-            return f'{self.type.as_c_code()} *{self.identifier}'
+        if self.shape is not None:
+            dimensions = ''.join(f'[{dimension}]' for dimension in self.shape)
+            return f'{self._const_prefix()}{self.type.as_c_code()} {self.identifier}{dimensions}'
+        elif self._is_array() or self.is_output():
+            return f'{self._const_prefix()}{self.type.as_c_code()} *{self.identifier}'
         else:
             return f'{self.type.as_c_code()} {self.identifier}'
 
+    def _const_prefix(self) -> str:
+        # input arrays are only read, so callers can pass read-only buffers
+        return '' if self.is_output() else 'const '
+
     def _prefix(self) -> str:
         if self.scope == Variable.Scope.STUB:
             return 'static '
@@ -110,3 +150,23 @@ class Variable:
             return '   '
         else:
             raise TypeError(self.scope.name)
+
+
+class ShapedVariable(Variable):
+    """A parameter array with several dimensions, its elements are stored row by row."""
+    # the other variables do without the additional slot
+    __slots__ = ('shape',)
+
+    def __init__(self, v_type: Variable.Type, name: str, shape: Tuple[int, ...],
+                 scope=Variable.Scope.INPUT) -> None:
+        super().__init__(v_type, name, element_count(shape), scope)
+        object.__setattr__(self, 'shape', tuple(shape))
+
+
+def element_count(shape: Tuple[int, ...]) -> int:
+    count = 1
+    for dimension in shape:
+        if dimension < 1:
+            raise ValueError(f"Array dimensions must be at least 1, got {list(shape)}.")
+        count *= dimension
+    return count
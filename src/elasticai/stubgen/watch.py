@@ -0,0 +1,170 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from elasticai.stubgen.batch import BatchResult, Generator, generate_batch, print_report
+from elasticai.stubgen.incremental import HashManifest
+
+
+def _find_idl_files(directories: Iterable[str]) -> Set[str]:
+    idl_files: Set[str] = set()
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            idl_files.update(os.path.join(root, name) for name in files if name.endswith('.idl'))
+    return idl_files
+
+
+class PollingWatcher:
+
+    def __init__(self, directories: List[str], interval: float = 0.2) -> None:
+        self._directories = directories
+        self._interval = interval
+        self._states = self._scan()
+
+    def wait_for_changes(self, timeout: Optional[float]) -> Set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changes = self._changes()
+            if changes:
+                return changes
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            remaining = self._interval if deadline is None else min(self._interval, deadline - time.monotonic())
+            time.sleep(max(remaining, 0.0))
+
+    def _changes(self) -> Set[str]:
+        states = self._scan()
+        changes = {idl_file for idl_file, state in states.items() if self._states.get(idl_file) != state}
+        self._states = states
+        return changes
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        states: Dict[str, Tuple[int, int]] = {}
+        for idl_file in _find_idl_files(self._directories):
+            try:
+                status = os.stat(idl_file)
+            except OSError:
+                continue
+            states[idl_file] = (status.st_mtime_ns, status.st_size)
+        return states
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+    _IN_Q_OVERFLOW = 0x00004000
+    _IN_ISDIR = 0x40000000
+    _MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+    _EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, directories: List[str]) -> None:
+        self._directories = directories
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watched_dirs: Dict[int, str] = {}
+        for directory in directories:
+            for root, _, _ in os.walk(directory):
+                self._add_watch(root)
+
+    def _watch_new_directory(self, directory: str) -> None:
+        # a directory moved into the tree brings its subdirectories along, and it may be gone again already
+        for root, _, _ in os.walk(directory):
+            try:
+                self._add_watch(root)
+            except OSError:
+                continue
+
+    def _add_watch(self, directory: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self._MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {directory}')
+        self._watched_dirs[wd] = directory
+
+    def wait_for_changes(self, timeout: Optional[float]) -> Set[str]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        return self._read_events()
+
+    def _read_events(self) -> Set[str]:
+        changes: Set[str] = set()
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changes
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, name_length = self._EVENT_HEADER.unpack_from(buffer, offset)
+            offset += self._EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+            if mask & self._IN_Q_OVERFLOW:
+                return _find_idl_files(self._directories)
+            path = os.path.join(self._watched_dirs.get(wd, ''), name)
+            if mask & self._IN_ISDIR:
+                if mask & (self._IN_CREATE | self._IN_MOVED_TO):
+                    self._watch_new_directory(path)
+                    changes.update(_find_idl_files([path]))
+            elif name.endswith('.idl') and mask & (self._IN_CLOSE_WRITE | self._IN_MOVED_TO):
+                changes.add(path)
+        return changes
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def create_watcher(directories: List[str], polling_interval: float = 0.2):
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directories, polling_interval)
+
+
+class StubWatcher:
+
+    def __init__(self, watcher, generate: Generator, debounce: float = 0.05,
+                 manifest: Optional[HashManifest] = None) -> None:
+        self._watcher = watcher
+        self._generate = generate
+        self._debounce = debounce
+        self._manifest = manifest
+
+    def run_forever(self) -> None:
+        try:
+            while True:
+                self.run_once(None)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._watcher.close()
+
+    def run_once(self, timeout: Optional[float]) -> List[BatchResult]:
+        changes = self._watcher.wait_for_changes(timeout)
+        if not changes:
+            return []
+        # editors often save in several steps, wait until the burst of events settles
+        while True:
+            more_changes = self._watcher.wait_for_changes(self._debounce)
+            if not more_changes:
+                break
+            changes |= more_changes
+        idl_files = sorted(idl_file for idl_file in changes if os.path.isfile(idl_file))
+        start = time.perf_counter()
+        results = generate_batch(idl_files, self._generate, manifest=self._manifest)
+        print_report(results, time.perf_counter() - start, 1)
+        sys.stdout.flush()
+        return results
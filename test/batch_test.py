@@ -0,0 +1,51 @@
+import os
+
+from elasticai.stubgen.batch import collect_idl_files, generate_batch
+from elasticai.stubgen.main import _generate_stub_files
+
+IDL_TEXT = """
+stub {name}
+sync predict ( int8[6] inputs, bool more_inputs ) : int8
+"""
+
+
+def write_idl(directory, name: str, text: str = IDL_TEXT) -> str:
+    directory.mkdir(parents=True, exist_ok=True)
+    idl_file = directory / f'{name}.idl'
+    idl_file.write_text(text.format(name=name))
+    return str(idl_file)
+
+
+def test_collects_idl_files_from_directories_recursively(tmp_path):
+    first = write_idl(tmp_path, 'first')
+    second = write_idl(tmp_path / 'sub', 'second')
+    (tmp_path / 'notes.txt').write_text('no idl')
+    assert collect_idl_files([str(tmp_path)]) == [first, second]
+
+
+def test_collects_idl_files_from_globs_and_manifest_without_duplicates(tmp_path):
+    first = write_idl(tmp_path, 'first')
+    second = write_idl(tmp_path / 'sub', 'second')
+    manifest = tmp_path / 'stubs.txt'
+    manifest.write_text('# accelerators\nsub/second.idl\nfirst.idl\n')
+    collected = collect_idl_files([os.path.join(str(tmp_path), '*.idl')], str(manifest))
+    assert collected == [first, second]
+
+
+def test_batch_generates_header_and_code_for_each_idl_file(tmp_path):
+    idl_files = [write_idl(tmp_path, f'accel{i}') for i in range(3)]
+    results = generate_batch(idl_files, _generate_stub_files, jobs=2)
+    assert [result.idl_file for result in results] == idl_files
+    assert all(result.succeeded for result in results)
+    for i in range(3):
+        assert (tmp_path / f'accel{i}.h').exists()
+        assert f'accel{i}_predict' in (tmp_path / f'accel{i}.c').read_text()
+
+
+def test_batch_reports_failing_files_and_continues(tmp_path):
+    broken = write_idl(tmp_path, 'broken', 'stub {name} sync ( : void')
+    valid = write_idl(tmp_path, 'valid')
+    results = generate_batch([broken, valid], _generate_stub_files, jobs=1)
+    assert not results[0].succeeded
+    assert results[1].succeeded
+    assert (tmp_path / 'valid.c').exists()
@@ -0,0 +1,123 @@
+import pytest
+
+from elasticai.stubgen.diagnostics import Diagnostic, IdlError
+from elasticai.stubgen.main import _build_stub_from_text
+
+
+def collect_errors(idl_text: str):
+    with pytest.raises(IdlError) as error:
+        _build_stub_from_text(idl_text, 'traffic.idl')
+    return error.value
+
+
+def test_all_errors_of_a_file_are_reported_in_one_run():
+    error = collect_errors('stub traffic transfer sideways deploy 300 4000\n'
+                           'sync predict ( int8 for, int8 x, int8 x ) : int8\n'
+                           'sync predict () : void\n')
+    assert [(d.line, d.column) for d in error.diagnostics] == [(1, 14), (1, 32), (2, 21), (2, 39), (3, 6)]
+    assert 'design id' in error.diagnostics[1].message
+    assert 'reserved word' in error.diagnostics[2].message
+    assert 'declared twice' in error.diagnostics[3].message
+    assert 'already defined in line 2' in error.diagnostics[4].message
+
+
+def test_errors_are_shown_with_file_position_and_span():
+    error = collect_errors('stub traffic\nsync predict ( int8 for ) : int8\n')
+    assert str(error) == "traffic.idl:2:21: error: Parameter 'for' of function 'predict' is a reserved word in C.\n" \
+                         "    sync predict ( int8 for ) : int8\n" \
+                         "                        ^~~"
+
+
+def test_syntax_error_is_reported_with_the_errors_found_before():
+    error = collect_errors('stub traffic pipeline 64\nsync predict ( int8 x ) int8\n')
+    assert [d.message for d in error.diagnostics] == ["A pipeline needs at least two input banks.",
+                                                      "Unexpected 'int8', which is a reserved IDL keyword."]
+    assert (error.diagnostics[1].line, error.diagnostics[1].column, error.diagnostics[1].length) == (2, 25, 4)
+
+
+def test_unknown_characters_and_incomplete_files_are_errors():
+    assert collect_errors('stub traffic\nsync predict ( int8 x ) : int8 ;').diagnostics[-1] == \
+        Diagnostic("Unexpected character ';'.", 2, 32)
+    assert collect_errors('stub traffic\nsync predict ( int8 x ) :').diagnostics[-1].line is None
+
+
+def test_parameters_must_fit_into_the_input_region():
+    _build_stub_from_text('stub traffic sync predict ( int8[96] window, int32 scale ) : void')
+    error = collect_errors('stub traffic sync predict ( int8[97] window, int32 scale ) : void')
+    assert 'do not fit into the input region of 100 bytes at address 0' in error.diagnostics[0].message
+    # the result is read back from the skeleton as well
+    assert collect_errors('stub traffic sync predict () : int32[26]').diagnostics
+
+
+def test_pipeline_banks_must_hold_a_whole_sample():
+    _build_stub_from_text('stub traffic pipeline 0 32 sync predict ( int8[32] window ) : void')
+    error = collect_errors('stub traffic pipeline 0 32 sync predict ( int8[33] window ) : void')
+    assert 'pipeline bank at address 0' in error.diagnostics[0].message
+    assert collect_errors('stub traffic pipeline 80 160 sync predict ( int8[24] window ) : void').diagnostics
+
+
+def test_generated_names_must_not_clash():
+    error = collect_errors('stub traffic session async train ( int8 x ) : void\n'
+                           'sync train_poll () : void\nsync open () : void\n')
+    assert "'traffic_train_poll'" in error.diagnostics[0].message
+    assert "generated function 'traffic_open'" in error.diagnostics[1].message
+
+
+def test_parameters_must_not_hide_names_of_the_generated_code():
+    error = collect_errors('stub traffic sync predict ( int8 n, int8 results ) : int8 batch 4')
+    assert len(error.diagnostics) == 2
+    _build_stub_from_text('stub traffic sync predict ( int8 n, int8 results ) : int8')
+
+
+def test_names_must_be_c_identifiers():
+    error = collect_errors('stub traffic sync prédict ( int8 x ) : int8')
+    assert error.diagnostics[0].message == "Function name 'prédict' is not a valid C identifier."
+
+
+def test_memory_map_moves_the_limits_of_the_regions():
+    _build_stub_from_text('stub traffic memory inputs 0 512 control 512 outputs 520 16\n'
+                          'sync predict ( int8[500] window ) : int32[4]')
+    error = collect_errors('stub traffic memory inputs 0 512 control 512 outputs 520 16\n'
+                           'sync predict ( int8[500] window ) : int32[5]')
+    assert 'do not fit into the output region of 16 bytes at address 520' in error.diagnostics[0].message
+
+
+def test_memory_regions_must_not_overlap():
+    assert 'contains the control address 50' in \
+        collect_errors('stub traffic memory control 50 sync predict () : void').diagnostics[0].message
+    assert collect_errors('stub traffic memory outputs 64 16 sync predict () : void').diagnostics[0].message == \
+        'The input and output regions overlap.'
+    assert 'Unknown memory region' in \
+        collect_errors('stub traffic memory status 200 sync predict () : void').diagnostics[0].message
+
+
+def test_pipeline_banks_must_not_overlap_the_output_region():
+    error = collect_errors('stub traffic memory outputs 200 16 pipeline 0 192 sync predict ( int8[16] x ) : int8')
+    assert 'overlap the output region' in error.diagnostics[0].message
+
+
+def test_array_dimensions_are_reported_at_the_dimension():
+    error = collect_errors('stub traffic\nsync predict ( int8[0] x ) : int8[4][00]')
+    assert [(d.line, d.column, d.length) for d in error.diagnostics] == [(2, 21, 1), (2, 38, 2)]
+    assert error.diagnostics[0].message == 'Array dimensions must be at least 1, got 0.'
+
+
+def test_unknown_attribute_values_list_the_accepted_ones():
+    error = collect_errors('stub traffic wait sideways bus 32 middle sync predict () : void wait later')
+    assert [d.message for d in error.diagnostics] == [
+        "Unknown wait strategy 'sideways', expected one of spin, poll, backoff, yield, interrupt.",
+        "Unknown byte order 'middle', expected one of little, big.",
+        "Unknown wait strategy 'later', expected one of spin, poll, backoff, yield, interrupt."]
+
+
+def test_idl_keywords_cannot_name_parameters():
+    error = collect_errors('stub traffic sync predict ( int8 wait ) : void')
+    assert error.diagnostics[0].message == "Unexpected 'wait', which is a reserved IDL keyword."
+
+
+def test_aligned_reads_need_a_width_and_bulk_reads_take_none():
+    error = collect_errors('stub traffic read aligned\nread aligned 1\nread bulk 4\nsync predict () : int8')
+    assert [(d.line, d.message) for d in error.diagnostics] == [
+        (1, "Aligned reads need a word width, e.g., 'read aligned 4'."),
+        (2, 'Aligned reads need a word width of at least two bytes, got 1.'),
+        (3, 'Bulk reads take no word width, got 4.')]
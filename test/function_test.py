@@ -1,11 +1,10 @@
-import pytest
-
+from elasticai.stubgen.function import BusFormat, SyncFunction
 from elasticai.stubgen.functionbuilder import FunctionBuilder
 from elasticai.stubgen.variable import Variable
 
 
 def test_generating_signature_for_sync_works():
-    expected = 'void FOO_bar(int16_t *a);\n'
+    expected = 'void FOO_bar(const int16_t *a);\n'
     builder = FunctionBuilder()
     builder.set_name('bar')
     builder.set_name_prefix('FOO')
@@ -18,7 +17,33 @@ def test_generating_syn_does_not_throw_exception():
     builder.generate()
 
 
-def test_generating_asyn_fails_with_exception():
+def test_generating_asyn_splits_function_into_start_poll_and_result():
+    expected = 'typedef void (*FOO_bar_callback_t)(int8_t result);\n' \
+               'bool FOO_bar_start(const int16_t *a, FOO_bar_callback_t callback);\n' \
+               'bool FOO_bar_poll(void);\n' \
+               'int8_t FOO_bar_result(void);\n'
     builder = FunctionBuilder()
-    with pytest.raises(ValueError):
-        builder.set_call_pattern(FunctionBuilder.CallPattern.ASYNC)
+    builder.set_call_pattern(FunctionBuilder.CallPattern.ASYNC)
+    builder.set_name('bar')
+    builder.set_name_prefix('FOO')
+    builder.set_return_type(Variable.Type('int8'))
+    builder.add_input_parameter(Variable.Type('int16'), 'a', 2)
+    assert builder.generate().as_c_prototype() == expected
+
+
+def test_parameter_layout_places_parameters_one_after_another():
+    parameters = [Variable(Variable.Type.INT8, 'a', 6), Variable(Variable.Type.INT32, 'b'),
+                  Variable(Variable.Type.BOOL, 'c')]
+    layout = SyncFunction('predict', Variable.Type.INT8, parameters).get_layout()
+    assert list(layout.offsets) == [0, 6, 10]
+    assert layout.input_length == 11
+
+
+def test_parameter_layout_aligns_parameters_up_to_the_bus_word():
+    parameters = [Variable(Variable.Type.INT8, 'a', 3), Variable(Variable.Type.INT16, 'b'),
+                  Variable(Variable.Type.INT64, 'c'), Variable(Variable.Type.INT32, 'd', scope=Variable.Scope.OUTPUT)]
+    layout = SyncFunction('predict', Variable.Type.INT8, parameters, bus_format=BusFormat(32)).get_layout()
+    assert list(layout.offsets) == [0, 4, 8, 16]
+    assert layout.input_length == 16
+    assert layout.output_offsets[3] == 4
+    assert layout.output_length == 8
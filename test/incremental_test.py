@@ -0,0 +1,63 @@
+import os
+
+from elasticai.stubgen.batch import generate_batch
+from elasticai.stubgen.incremental import HashManifest, stream_if_changed, write_if_changed
+from elasticai.stubgen.main import _generate_stub_files
+
+IDL_TEXT = """
+stub traffic
+sync predict ( int8[6] inputs, bool more_inputs ) : int8
+"""
+
+
+def test_write_if_changed_keeps_unchanged_files_untouched(tmp_path):
+    output = tmp_path / 'out.c'
+    write_if_changed(str(output), 'int x;\n')
+    os.utime(output, (0, 0))
+    write_if_changed(str(output), 'int x;\n')
+    assert output.stat().st_mtime == 0
+    write_if_changed(str(output), 'int y;\n')
+    assert output.read_text() == 'int y;\n'
+    assert output.stat().st_mtime > 0
+    assert [entry.name for entry in tmp_path.iterdir()] == ['out.c']
+
+
+def test_unchanged_idl_is_skipped_on_second_run(tmp_path):
+    idl_file = tmp_path / 'traffic.idl'
+    idl_file.write_text(IDL_TEXT)
+    manifest_file = str(tmp_path / 'manifest.json')
+    first = generate_batch([str(idl_file)], _generate_stub_files, manifest=HashManifest(manifest_file))
+    second = generate_batch([str(idl_file)], _generate_stub_files, manifest=HashManifest(manifest_file))
+    assert not first[0].skipped
+    assert second[0].skipped
+
+
+def test_changed_idl_or_modified_output_is_regenerated(tmp_path):
+    idl_file = tmp_path / 'traffic.idl'
+    idl_file.write_text(IDL_TEXT)
+    manifest_file = str(tmp_path / 'manifest.json')
+    generate_batch([str(idl_file)], _generate_stub_files, manifest=HashManifest(manifest_file))
+    idl_file.write_text(IDL_TEXT + 'sync reset () : void\n')
+    result = generate_batch([str(idl_file)], _generate_stub_files, manifest=HashManifest(manifest_file))[0]
+    assert not result.skipped
+    assert 'traffic_reset' in (tmp_path / 'traffic.h').read_text()
+    (tmp_path / 'traffic.c').write_text('edited by hand')
+    result = generate_batch([str(idl_file)], _generate_stub_files, manifest=HashManifest(manifest_file))[0]
+    assert not result.skipped
+    assert 'traffic_reset' in (tmp_path / 'traffic.c').read_text()
+
+
+def test_stream_if_changed_hashes_streamed_text_like_write_if_changed(tmp_path):
+    output = tmp_path / 'out.c'
+    expected_hash = write_if_changed(str(output), 'int x;\nint y;\n')
+    os.utime(output, (0, 0))
+
+    def emit(sink):
+        sink.write('int x;\n')
+        sink.write('int y;\n')
+
+    assert stream_if_changed(str(output), emit) == expected_hash
+    assert output.stat().st_mtime == 0
+    assert stream_if_changed(str(output), lambda sink: sink.write('int z;\n')) != expected_hash
+    assert output.read_text() == 'int z;\n'
+    assert [entry.name for entry in tmp_path.iterdir()] == ['out.c']
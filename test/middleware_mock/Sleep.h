@@ -0,0 +1,9 @@
+#ifndef SLEEP_MOCK_H
+#define SLEEP_MOCK_H
+
+#include <stdint.h>
+
+/* advances the modeled clock of the mock middleware instead of sleeping */
+void sleep_for_ms(uint32_t ms);
+
+#endif
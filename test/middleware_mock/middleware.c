@@ -0,0 +1,160 @@
+#include "middleware.h"
+#include "Sleep.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+static uint8_t skeleton[MOCK_SKELETON_SIZE];
+static mock_config_t config;
+static mock_statistics_t statistics;
+static uint64_t now_ns;
+static uint64_t done_ns;
+static struct {
+    uint32_t address;
+    uint8_t design_id;
+} bitstreams[MOCK_MAX_BITSTREAMS];
+static size_t bitstream_count;
+static uint8_t design_id;
+static uint8_t configured_design_id;
+static uint64_t configured_ns;
+static uint64_t dma_done_ns;
+
+static void checkRange(uint32_t address, size_t length)
+{
+    if (address + length > MOCK_SKELETON_SIZE) {
+        fprintf(stderr, "mock middleware: access to %u+%zu outside the skeleton\n", address, length);
+        exit(2);
+    }
+}
+
+static void advanceClock(uint64_t ns)
+{
+    now_ns += ns;
+    statistics.modeled_ns += ns;
+}
+
+static void chargeTransaction(size_t length)
+{
+    advanceClock(config.transaction_cost_ns + (uint64_t)config.byte_cost_ns * length);
+}
+
+static bool isBusy(void) { return now_ns < done_ns; }
+
+void middlewareInit(void) {}
+
+void middlewareDeinit(void) {}
+
+void middlewareConfigureFpga(uint32_t address)
+{
+    statistics.configurations++;
+    /* the FPGA answers with design id 0 until the new bitstream is loaded */
+    design_id = 0;
+    configured_design_id = 0;
+    for (size_t i = 0; i < bitstream_count; i++) {
+        if (bitstreams[i].address == address) {
+            configured_design_id = bitstreams[i].design_id;
+        }
+    }
+    configured_ns = now_ns + config.configure_latency_ns;
+}
+
+void middlewareUserlogicEnable(void) {}
+
+void middlewareUserlogicDisable(void) {}
+
+bool middlewareUserlogicGetBusyStatus(void)
+{
+    statistics.status_reads++;
+    chargeTransaction(1);
+    if (isBusy() && config.transaction_cost_ns == 0 && config.byte_cost_ns == 0) {
+        /* a free bus would never let the clock advance, the HWA finishes on the next read */
+        advanceClock(done_ns - now_ns);
+        return true;
+    }
+    return isBusy();
+}
+
+uint8_t middlewareGetDesignId(void)
+{
+    chargeTransaction(1);
+    if (now_ns >= configured_ns) {
+        design_id = configured_design_id;
+    }
+    return design_id;
+}
+
+void middlewareWriteBlocking(uint32_t address, uint8_t *data, size_t length)
+{
+    checkRange(address, length);
+    memcpy(skeleton + address, data, length);
+    statistics.write_transactions++;
+    statistics.bytes_written += length;
+    chargeTransaction(length);
+    if (address == MOCK_ADDR_COMPUTATION_ENABLE && length == 1 && data[0] != 0) {
+        statistics.computations++;
+        done_ns = now_ns + config.compute_latency_ns;
+    }
+}
+
+void middlewareReadBlocking(uint32_t address, uint8_t *data, size_t length)
+{
+    checkRange(address, length);
+    memcpy(data, skeleton + address, length);
+    statistics.read_transactions++;
+    statistics.bytes_read += length;
+    chargeTransaction(length);
+}
+
+void middlewareWriteDma(uint32_t address, uint8_t *data, size_t length)
+{
+    checkRange(address, length);
+    memcpy(skeleton + address, data, length);
+    statistics.dma_transfers++;
+    statistics.bytes_written += length;
+    /* the CPU only sets up the transfer, the channel moves the bytes after the previous transfer */
+    chargeTransaction(0);
+    uint64_t start_ns = dma_done_ns > now_ns ? dma_done_ns : now_ns;
+    dma_done_ns = start_ns + (uint64_t)config.byte_cost_ns * length;
+}
+
+void middlewareWaitForDma(void)
+{
+    if (dma_done_ns > now_ns) {
+        advanceClock(dma_done_ns - now_ns);
+    }
+}
+
+void sleep_for_ms(uint32_t ms) { advanceClock((uint64_t)ms * 1000000); }
+
+uint8_t *mockSkeletonMemory(void) { return skeleton; }
+
+void mockConfigure(mock_config_t new_config) { config = new_config; }
+
+void mockAddBitstream(uint32_t address, uint8_t id)
+{
+    if (bitstream_count == MOCK_MAX_BITSTREAMS) {
+        fprintf(stderr, "mock middleware: more than %d bitstreams\n", MOCK_MAX_BITSTREAMS);
+        exit(2);
+    }
+    bitstreams[bitstream_count].address = address;
+    bitstreams[bitstream_count].design_id = id;
+    bitstream_count++;
+}
+
+uint64_t mockNowNs(void) { return now_ns; }
+
+bool mockWaitForCompletion(uint32_t timeout_ms)
+{
+    uint64_t remaining_ns = isBusy() ? done_ns - now_ns : 0;
+    if (timeout_ms != UINT32_MAX && remaining_ns > (uint64_t)timeout_ms * 1000000) {
+        advanceClock((uint64_t)timeout_ms * 1000000);
+        return false;
+    }
+    advanceClock(remaining_ns);
+    return true;
+}
+
+mock_statistics_t mockStatistics(void) { return statistics; }
+
+void mockResetStatistics(void) { memset(&statistics, 0, sizeof(statistics)); }
@@ -0,0 +1,62 @@
+/*
+ * Mock of the elastic-ai.runtime middleware for running generated stubs on the host.
+ * The skeleton address space is simulated in memory and all bus transactions are counted.
+ * Every transaction advances a modeled clock by a configurable cost, a computation keeps
+ * the HWA busy for a configurable latency. Bitstreams registered with mockAddBitstream() can be
+ * configured, their design id answers after the configuration latency. DMA transfers run on a
+ * separate channel, the modeled clock only advances when the application waits for them.
+ */
+
+#ifndef MIDDLEWARE_MOCK_H
+#define MIDDLEWARE_MOCK_H
+
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
+
+#define MOCK_SKELETON_SIZE 1024
+#ifndef MOCK_ADDR_COMPUTATION_ENABLE
+#define MOCK_ADDR_COMPUTATION_ENABLE 100
+#endif
+#define MOCK_MAX_BITSTREAMS 8
+
+typedef struct {
+    uint32_t transaction_cost_ns;
+    uint32_t byte_cost_ns;
+    uint32_t compute_latency_ns;
+    uint32_t configure_latency_ns;
+} mock_config_t;
+
+typedef struct {
+    uint32_t write_transactions;
+    uint32_t read_transactions;
+    uint32_t status_reads;
+    uint32_t bytes_written;
+    uint32_t bytes_read;
+    uint32_t computations;
+    uint32_t configurations;
+    uint32_t dma_transfers;
+    uint64_t modeled_ns;
+} mock_statistics_t;
+
+void middlewareInit(void);
+void middlewareDeinit(void);
+void middlewareConfigureFpga(uint32_t address);
+void middlewareUserlogicEnable(void);
+void middlewareUserlogicDisable(void);
+bool middlewareUserlogicGetBusyStatus(void);
+uint8_t middlewareGetDesignId(void);
+void middlewareWriteBlocking(uint32_t address, uint8_t *data, size_t length);
+void middlewareReadBlocking(uint32_t address, uint8_t *data, size_t length);
+void middlewareWriteDma(uint32_t address, uint8_t *data, size_t length);
+void middlewareWaitForDma(void);
+
+uint8_t *mockSkeletonMemory(void);
+void mockConfigure(mock_config_t config);
+void mockAddBitstream(uint32_t address, uint8_t design_id);
+uint64_t mockNowNs(void);
+bool mockWaitForCompletion(uint32_t timeout_ms);
+mock_statistics_t mockStatistics(void);
+void mockResetStatistics(void);
+
+#endif
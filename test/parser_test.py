@@ -0,0 +1,49 @@
+from elasticai.stubgen.lexer import get_shared_lexer
+from elasticai.stubgen.parser import Parser, get_shared_parser
+from elasticai.stubgen.stubbuilder import StubBuilder
+
+
+def parse_into_new_builder(parser, input_text: str) -> StubBuilder:
+    builder = StubBuilder()
+    parser.parse(get_shared_lexer().lex(input_text), state=builder)
+    return builder
+
+
+def test_shared_parser_is_built_only_once():
+    assert get_shared_parser() is get_shared_parser()
+
+
+def test_shared_lexer_is_built_only_once():
+    assert get_shared_lexer() is get_shared_lexer()
+
+
+def test_one_parser_can_fill_several_builders():
+    parser = get_shared_parser()
+    first = parse_into_new_builder(parser, 'stub first sync foo () : void')
+    second = parse_into_new_builder(parser, 'stub second sync bar () : int8 sync baz () : void')
+    assert first.stub_name == 'first'
+    assert [f.name for f in first.functions] == ['foo']
+    assert second.stub_name == 'second'
+    assert [f.name for f in second.functions] == ['bar', 'baz']
+
+
+def test_parser_can_be_built_without_table_cache():
+    parser = Parser(cache_id=None).get_parser()
+    builder = parse_into_new_builder(parser, 'stub test sync foo () : void')
+    assert builder.stub_name == 'test'
+
+
+def test_arrays_can_have_several_dimensions():
+    idl_text = 'stub cnn sync classify ( int8[28][28] image, out int16[2][3][4] maps ) : int8[10]'
+    builder = parse_into_new_builder(get_shared_parser(), idl_text)
+    image, maps = builder.functions[0].parameters
+    assert (image.elements, image.shape) == (784, (28, 28))
+    assert (maps.elements, maps.shape, maps.get_length_in_byte()) == (24, (2, 3, 4), 48)
+    assert builder.functions[0].return_elements == 10
+
+
+def test_unsigned_and_fixed_point_types_can_be_parameters_and_results():
+    builder = parse_into_new_builder(get_shared_parser(), 'stub cnn sync scale ( uint16 a, q15[4] b ) : uint64')
+    function = builder.functions[0]
+    assert [parameter.type.as_c_code() for parameter in function.parameters] == ['uint16_t', 'int16_t']
+    assert function.returnType.as_c_code() == 'uint64_t'
@@ -0,0 +1,113 @@
+"""
+Host-side simulation of generated stubs.
+
+The stubs are compiled with the host gcc against the mock middleware in middleware_mock, which
+counts all bus transactions and models their latency. SimulationHarness.profile() calls every
+function declared in the stub header once and reports what each call cost.
+"""
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import List, NamedTuple, Sequence
+
+from elasticai.stubgen.main import _build_stub_from_text
+
+MOCK_DIR = os.path.join(os.path.dirname(__file__), 'middleware_mock')
+
+_PROTOTYPE = re.compile(r'^(?:\w+ )+\**(\w+)\((.*)\);$', re.MULTILINE)
+_SKIPPED_SUFFIXES = ('_deploy', '_select', '_is_resident', '_open', '_close', '_millis', '_yield',
+                     '_wait_for_completion', '_profile', '_profile_reset')
+
+_DRIVER_TEMPLATE = """
+#include <stdio.h>
+#include "middleware.h"
+#include "{name}.h"
+
+uint64_t buffer[MOCK_SKELETON_SIZE / sizeof(uint64_t)];
+
+uint32_t {name}_millis(void) {{ return (uint32_t)(mockNowNs() / 1000000); }}
+void {name}_yield(void) {{}}
+bool {name}_wait_for_completion(uint32_t timeout_ms) {{ return mockWaitForCompletion(timeout_ms); }}
+
+static void report(const char *function)
+{{
+    mock_statistics_t s = mockStatistics();
+    printf("%s %u %u %u %u %u %llu\\n", function, s.write_transactions, s.read_transactions, s.status_reads,
+           s.bytes_written, s.bytes_read, (unsigned long long)s.modeled_ns);
+    mockResetStatistics();
+}}
+
+int main(void)
+{{
+    mockConfigure((mock_config_t){{ {transaction_cost_ns}, {byte_cost_ns}, {compute_latency_ns} }});
+{calls}    return 0;
+}}
+"""
+
+
+class CallReport(NamedTuple):
+    function: str
+    write_transactions: int
+    read_transactions: int
+    status_reads: int
+    bytes_written: int
+    bytes_read: int
+    modeled_ns: int
+
+
+class SimulationHarness:
+
+    def __init__(self, work_dir: Path, transaction_cost_ns: int = 0, byte_cost_ns: int = 0,
+                 compute_latency_ns: int = 0) -> None:
+        self._work_dir = Path(work_dir)
+        self._costs = dict(transaction_cost_ns=transaction_cost_ns, byte_cost_ns=byte_cost_ns,
+                           compute_latency_ns=compute_latency_ns)
+
+    def compile_and_run(self, idl_text: str, main_code: str, defines: Sequence[str] = ()) -> str:
+        stub = _build_stub_from_text(idl_text)
+        name = stub.get_name()
+        (self._work_dir / f'{name}.h').write_text(stub.as_c_header())
+        (self._work_dir / f'{name}.c').write_text(stub.as_c_code())
+        (self._work_dir / 'main.c').write_text(main_code)
+        executable = str(self._work_dir / name)
+        subprocess.run(['gcc', '-std=c99', '-Wall', '-Werror', *(f'-D{define}' for define in defines),
+                        '-I', MOCK_DIR, '-I', str(self._work_dir),
+                        str(self._work_dir / f'{name}.c'), os.path.join(MOCK_DIR, 'middleware.c'),
+                        str(self._work_dir / 'main.c'), '-o', executable], check=True)
+        return subprocess.run([executable], check=True, capture_output=True, text=True).stdout
+
+    def profile(self, idl_text: str) -> List[CallReport]:
+        stub = _build_stub_from_text(idl_text)
+        name = stub.get_name()
+        header = stub.as_c_header()
+        calls = ''
+        if f'void {name}_open(void);' in header:
+            calls += f'    {name}_open();\n    mockResetStatistics();\n'
+        for function, parameters in _PROTOTYPE.findall(header):
+            if function.endswith(_SKIPPED_SUFFIXES):
+                continue
+            calls += f'    {function}({self._zeroed_arguments(parameters)});\n' \
+                     f'    report("{function}");\n'
+        main_code = _DRIVER_TEMPLATE.format(name=name, calls=calls, **self._costs)
+        output = self.compile_and_run(idl_text, main_code)
+        return [CallReport(line.split()[0], *(int(value) for value in line.split()[1:]))
+                for line in output.splitlines()]
+
+    @staticmethod
+    def _zeroed_arguments(parameters: str) -> str:
+        # pointers get a zeroed scratch buffer, batches a single sample and callbacks none at all
+        arguments = []
+        for parameter in parameters.split(', '):
+            if parameter == 'void':
+                continue
+            c_type = parameter.rsplit(' ', 1)[0].replace('const ', '')
+            if c_type.endswith('_callback_t'):
+                arguments.append('NULL')
+            elif c_type == 'size_t':
+                arguments.append('1')
+            elif '*' in parameter:
+                arguments.append(f'({c_type} *)buffer')
+            else:
+                arguments.append(f'({c_type})0')
+        return ', '.join(arguments)
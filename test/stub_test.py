@@ -27,3 +27,34 @@ static void modelCompute(bool enable)
 """
     the_stub = Stub("test")
     assert the_stub.as_c_code() == expected
+
+
+class RecordingSink:
+
+    def __init__(self) -> None:
+        self.fragments = []
+
+    def write(self, text: str) -> int:
+        self.fragments.append(text)
+        return len(text)
+
+
+def test_stub_is_written_to_sink_in_fragments():
+    the_stub = Stub("test")
+    the_stub.add_session_functions()
+    sink = RecordingSink()
+    the_stub.write_c_code(sink)
+    assert len(sink.fragments) > 1
+    assert ''.join(sink.fragments) == the_stub.as_c_code()
+    sink = RecordingSink()
+    the_stub.write_c_header(sink)
+    assert ''.join(sink.fragments) == the_stub.as_c_header()
+
+
+def test_compiled_stub_writes_header_and_code_in_one_pass():
+    the_stub = Stub("test")
+    the_stub.add_session_functions()
+    header_sink, code_sink = RecordingSink(), RecordingSink()
+    the_stub.compile().write(header_sink, code_sink)
+    assert ''.join(header_sink.fragments) == the_stub.as_c_header()
+    assert ''.join(code_sink.fragments) == the_stub.as_c_code()
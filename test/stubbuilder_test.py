@@ -1,5 +1,7 @@
 import string
 
+import pytest
+
 from elasticai.stubgen.lexer import Lexer
 from elasticai.stubgen.parser import Parser
 from elasticai.stubgen.stub import Stub
@@ -28,8 +30,8 @@ def build_stub_from_text(input_text: str) -> Stub:
     lexer = Lexer().get_lexer()
     tokens = lexer.lex(input_text)
     stub_builder = StubBuilder()
-    parser = Parser(stub_builder).get_parser()
-    parser.parse(tokens)
+    parser = Parser().get_parser()
+    parser.parse(tokens, state=stub_builder)
     return stub_builder.generate()
 
 
@@ -152,7 +154,7 @@ def test_can_generate_deployable_stub_code() -> None:
        middlewareDeinit();
     }
     
-    int8_t another_test_predict(int8_t *inputs, bool more_inputs)
+    int8_t another_test_predict(const int8_t *inputs, bool more_inputs)
     {
        int8_t _result;
     
@@ -164,10 +166,7 @@ def test_can_generate_deployable_stub_code() -> None:
        
        while( middlewareUserlogicGetBusyStatus() );
        modelCompute(false);
-       for(int i = 0; i < 1; i++){
-          middlewareReadBlocking(ADDR_SKELETON_INPUTS+0+i, (uint8_t *)(&_result)+i, 1);
-          middlewareReadBlocking(ADDR_SKELETON_INPUTS+0+i, (uint8_t *)(&_result)+i, 1); 
-       }
+       middlewareReadBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(&_result)+0, 1);
        modelCompute(false);
        middlewareUserlogicDisable();
        middlewareDeinit();
@@ -190,3 +189,348 @@ def test_can_generate_deployable_stub_code() -> None:
     """
     stub = build_stub_from_text(input_text)
     compare(stub.as_c_code(), expected)
+
+
+def test_several_deployed_accelerators_can_be_selected_by_id() -> None:
+    input_text = """
+    stub models
+    deploy 47 4000
+    deploy 48 8000
+    sync predict ( int8 x ) : int8
+    """
+    expected_select = """
+    bool models_select(uint64_t accelerator_id)
+    {
+       int16_t index = findAccelerator(accelerator_id);
+       if( index < 0 )
+          return false;
+       middlewareInit();
+       bool is_resident = (get_id() == accelerator_id);
+       if( !is_resident ){
+          middlewareConfigureFpga(accelerator_addrs[index]);
+          is_resident = waitForDesign(accelerator_id);
+       }
+       middlewareDeinit();
+       resident_accelerator = is_resident ? index : -1;
+       return is_resident;
+    }
+    """
+    stub = build_stub_from_text(input_text)
+    header = stub.as_c_header()
+    code = stub.as_c_code()
+    assert 'bool models_select(uint64_t accelerator_id);' in header
+    assert 'bool models_is_resident(uint64_t accelerator_id);' in header
+    assert 'models_deploy' not in header
+    assert 'static uint64_t accelerator_ids[2] = {47, 48};' in code
+    assert 'static uint32_t accelerator_addrs[2] = {4000, 8000};' in code
+    assert '#ifndef DEPLOY_TIMEOUT_MS' in code
+    assert 'sleep_for_ms(200)' not in code
+    assert _strip_indention(expected_select) in _strip_indention(code)
+
+
+def test_accelerator_cannot_be_deployed_twice() -> None:
+    with pytest.raises(ValueError):
+        build_stub_from_text('stub test deploy 47 4000 deploy 47 8000 sync foo () : void')
+
+
+def test_packed_transfer_writes_all_inputs_at_once() -> None:
+    input_text = """
+    stub packed
+    transfer packed
+    sync predict ( int8[6] inputs, int16 scale, bool more_inputs ) : void
+    """
+    expected_function = """
+    void packed_predict(const int8_t *inputs, int16_t scale, bool more_inputs)
+    {
+       uint8_t _inputs[9];
+
+       middlewareInit();
+       middlewareUserlogicEnable();
+       memcpy(_inputs+0, inputs, 6);
+       memcpy(_inputs+6, &scale, 2);
+       memcpy(_inputs+8, &more_inputs, 1);
+       middlewareWriteBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(_inputs), 9);
+       modelCompute(true);
+
+       while( middlewareUserlogicGetBusyStatus() );
+       modelCompute(false);
+       middlewareUserlogicDisable();
+       middlewareDeinit();
+    }
+    """
+    code = build_stub_from_text(input_text).as_c_code()
+    assert '#include <string.h>' in code
+    assert _strip_indention(expected_function) in _strip_indention(code)
+
+
+def test_packed_transfer_writes_single_parameter_directly() -> None:
+    input_text = """
+    stub packed
+    transfer packed
+    sync predict ( int8[6] inputs ) : void
+    """
+    code = build_stub_from_text(input_text).as_c_code()
+    assert 'memcpy' not in code
+    assert '#include <string.h>' not in code
+    assert 'middlewareWriteBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(inputs), 6);' in code
+
+
+def test_unknown_transfer_mode_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        build_stub_from_text('stub test transfer sideways sync foo () : void')
+
+
+def test_keywords_can_prefix_identifiers() -> None:
+    stub = build_stub_from_text('stub stub0 sync transfer_all ( int8 int8_value ) : void')
+    assert 'void stub0_transfer_all(int8_t int8_value);' in stub.as_c_header()
+
+
+def test_session_stub_initializes_middleware_only_in_open() -> None:
+    input_text = """
+    stub traffic
+    session
+    sync predict ( int8[6] inputs ) : int8
+    """
+    expected_code = """
+    static bool session_is_open = false;
+
+    void traffic_open(void)
+    {
+       middlewareInit();
+       middlewareUserlogicEnable();
+       session_is_open = true;
+    }
+
+    void traffic_close(void)
+    {
+       session_is_open = false;
+       middlewareUserlogicDisable();
+       middlewareDeinit();
+    }
+
+    int8_t traffic_predict(const int8_t *inputs)
+    {
+       int8_t _result;
+
+       assert(session_is_open);
+       middlewareWriteBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(inputs), 6);
+       modelCompute(true);
+
+       while( middlewareUserlogicGetBusyStatus() );
+       modelCompute(false);
+       middlewareReadBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(&_result)+0, 1);
+       return _result;
+    }
+    """
+    stub = build_stub_from_text(input_text)
+    assert '#include <assert.h>' in stub.as_c_code()
+    assert _strip_indention(expected_code) in _strip_indention(stub.as_c_code())
+    assert 'void traffic_open(void);\nvoid traffic_close(void);' in stub.as_c_header()
+
+
+def test_batch_modifier_generates_batch_variant() -> None:
+    input_text = """
+    stub traffic
+    sync predict ( int8[6] inputs, bool more_inputs ) : int8 batch 64
+    """
+    expected_function = """
+    void traffic_predict_batch(const int8_t *inputs, const bool *more_inputs, size_t n, int8_t *results)
+    {
+       assert(n <= TRAFFIC_PREDICT_MAX_BATCH);
+       middlewareInit();
+       middlewareUserlogicEnable();
+       for(size_t i = 0; i < n; i++){
+          middlewareWriteBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(inputs+i*6), 6);
+          middlewareWriteBlocking(ADDR_SKELETON_INPUTS+6, (uint8_t*)(more_inputs+i), 1);
+          modelCompute(true);
+          while( middlewareUserlogicGetBusyStatus() );
+          modelCompute(false);
+          middlewareReadBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(results+i)+0, 1);
+       }
+       middlewareUserlogicDisable();
+       middlewareDeinit();
+    }
+    """
+    expected_prototypes = """
+    int8_t traffic_predict(const int8_t *inputs, bool more_inputs);
+    #define TRAFFIC_PREDICT_MAX_BATCH 64
+    void traffic_predict_batch(const int8_t *inputs, const bool *more_inputs, size_t n, int8_t *results);
+    """
+    stub = build_stub_from_text(input_text)
+    assert _strip_indention(expected_function) in _strip_indention(stub.as_c_code())
+    assert _strip_indention(expected_prototypes) in _strip_indention(stub.as_c_header())
+    assert '#include <stddef.h>' in stub.as_c_header()
+
+
+def test_wait_strategy_with_timeout_reports_success_through_return_value() -> None:
+    input_text = """
+    stub traffic
+    wait poll 5
+    timeout 100
+    sync predict ( int8 speed ) : int8
+    sync ping () : void wait yield
+    """
+    expected_function = """
+    bool traffic_predict(int8_t speed, int8_t *result)
+    {
+       middlewareInit();
+       middlewareUserlogicEnable();
+       middlewareWriteBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(&speed), 1);
+       modelCompute(true);
+
+       if( !waitPoll(5, 100) ){
+          modelCompute(false);
+          middlewareUserlogicDisable();
+          middlewareDeinit();
+          return false;
+       }
+       modelCompute(false);
+       middlewareReadBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(result)+0, 1);
+    """
+    stub = build_stub_from_text(input_text)
+    assert _strip_indention(expected_function) in _strip_indention(stub.as_c_code())
+    assert 'static bool waitYieldTimeout(uint32_t timeout_ms);' in stub.as_c_code()
+    assert 'bool traffic_ping(void);' in stub.as_c_header()
+    assert 'uint32_t traffic_millis(void);\nvoid traffic_yield(void);' in stub.as_c_header()
+
+
+def test_wait_strategy_rejects_interval_for_spin() -> None:
+    with pytest.raises(ValueError):
+        build_stub_from_text('stub traffic wait spin 5 sync predict ( int8 speed ) : int8')
+
+
+def test_timeout_of_zero_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        build_stub_from_text('stub traffic wait poll 5 timeout 0 sync predict ( int8 speed ) : int8')
+
+
+def test_waiting_without_timeout_passes_wait_forever() -> None:
+    stub = build_stub_from_text('stub traffic wait interrupt sync predict ( int8 speed ) : int8')
+    assert '#define STUB_WAIT_FOREVER UINT32_MAX\n' in stub.as_c_header()
+    code = stub.as_c_code()
+    assert '   waitInterrupt(STUB_WAIT_FOREVER);\n' in code
+    assert '   while( !traffic_wait_for_completion(timeout_ms) ){\n' \
+           '      if( timeout_ms != STUB_WAIT_FOREVER )\n' \
+           '         return false;\n' \
+           '   }\n' in code
+
+
+def test_output_parameters_follow_the_result() -> None:
+    input_text = """
+    stub traffic
+    sync predict ( int8[6] inputs, out int16[2] scores, inout int32 state ) : int8
+    sync history () : int8[4]
+    """
+    expected_function = """
+    int8_t traffic_predict(const int8_t *inputs, int16_t *scores, int32_t *state)
+    {
+       int8_t _result;
+
+       middlewareInit();
+       middlewareUserlogicEnable();
+       middlewareWriteBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(inputs), 6);
+       middlewareWriteBlocking(ADDR_SKELETON_INPUTS+6, (uint8_t*)(state), 4);
+       modelCompute(true);
+
+       while( middlewareUserlogicGetBusyStatus() );
+       modelCompute(false);
+       middlewareReadBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(&_result)+0, 1);
+       middlewareReadBlocking(ADDR_SKELETON_INPUTS+1, (uint8_t*)(scores)+0, 4);
+       middlewareReadBlocking(ADDR_SKELETON_INPUTS+5, (uint8_t*)(state)+0, 4);
+    """
+    stub = build_stub_from_text(input_text)
+    assert _strip_indention(expected_function) in _strip_indention(stub.as_c_code())
+    assert 'void traffic_history(int8_t *result);' in stub.as_c_header()
+
+
+def test_async_function_rejects_output_parameters() -> None:
+    with pytest.raises(ValueError):
+        build_stub_from_text('stub traffic async predict ( out int8[2] scores ) : void')
+
+
+def test_profiled_stub_wraps_phases_in_macros() -> None:
+    stub = build_stub_from_text('stub prof profile sync predict ( int8 x ) : int8 async train ( int8 x ) : void')
+    header = stub.as_c_header()
+    code = stub.as_c_code()
+    assert 'PROF_PREDICT,\n   PROF_PROFILED_FUNCTIONS\n} prof_function_t;' in header
+    assert 'const prof_phase_stats_t *prof_profile(prof_function_t function, prof_phase_t phase);' in header
+    assert '   STUB_PROF_BEGIN(PROF_PREDICT, PROF_PHASE_WAIT);\n' \
+           '   while( middlewareUserlogicGetBusyStatus() );\n' \
+           '   STUB_PROF_END(PROF_PREDICT, PROF_PHASE_WAIT);\n' in code
+    assert 'PROF_TRAIN' not in code
+
+
+def test_profiling_needs_synchronous_function() -> None:
+    with pytest.raises(ValueError):
+        build_stub_from_text('stub prof profile async train ( int8 x ) : void')
+
+
+def test_bus_without_byte_order_only_aligns_parameters() -> None:
+    code = build_stub_from_text('stub wide bus 32 sync predict ( int8 a, int32 b ) : int32').as_c_code()
+    assert 'middlewareWriteBlocking(ADDR_SKELETON_INPUTS+4, (uint8_t*)(&b), 4);' in code
+    assert 'toSkeletonOrder' not in code and 'toHostOrder' not in code
+
+
+def test_byte_order_swaps_only_multi_byte_values() -> None:
+    code = build_stub_from_text('stub wide bus 16 little sync predict ( int8[3] a, int16 b ) : bool').as_c_code()
+    assert 'middlewareWriteBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(a), 3);' in code
+    assert '   toSkeletonOrder(_inputs+4, &b, 2, 1);\n' \
+           '   middlewareWriteBlocking(ADDR_SKELETON_INPUTS+4, (uint8_t*)(_inputs+4), 2);\n' in code
+    assert 'toHostOrder' not in code
+
+
+def test_unsupported_bus_width_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        build_stub_from_text('stub wide bus 24 sync predict () : void')
+
+
+def test_dma_transfers_are_started_before_blocking_writes() -> None:
+    code = build_stub_from_text('stub vision dma 1024 sync classify ( int8 mode, int8[4096] image ) : void')\
+        .as_c_code()
+    assert '   STUB_DMA_WRITE(ADDR_SKELETON_INPUTS+1, (uint8_t*)(image), 4096);\n' \
+           '   middlewareWriteBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(&mode), 1);\n' \
+           '   STUB_DMA_WAIT();\n' \
+           '   modelCompute(true);\n' in code
+    assert '#define STUB_DMA_WRITE(address, data, length) middlewareWriteDma(address, data, length)' in code
+
+
+def test_packed_inputs_above_dma_threshold_are_sent_by_dma() -> None:
+    code = build_stub_from_text('stub vision transfer packed dma 8 sync classify ( int8[4] a, int32 b ) : void')\
+        .as_c_code()
+    assert 'STUB_DMA_WRITE(ADDR_SKELETON_INPUTS+0, (uint8_t*)(_inputs), 8);' in code
+
+
+def test_stub_without_large_inputs_does_not_need_dma() -> None:
+    code = build_stub_from_text('stub vision dma 1024 sync classify ( int8[16] a ) : int8[2048]').as_c_code()
+    assert 'DMA' not in code
+
+
+def test_memory_map_places_inputs_outputs_and_control() -> None:
+    code = build_stub_from_text('stub vision memory inputs 0 4096 control 4096 outputs 8192 64\n'
+                                'sync classify ( int8[4096] image ) : int8[10]').as_c_code()
+    assert '#define ADDR_SKELETON_INPUTS 0\n' \
+           '#define ADDR_SKELETON_OUTPUTS 8192\n' \
+           '#define ADDR_COMPUTATION_ENABLE 4096\n' in code
+    assert 'middlewareReadBlocking(ADDR_SKELETON_OUTPUTS+0, (uint8_t*)(result)+0, 10);' in code
+
+
+def test_pipelined_results_are_read_from_the_output_region() -> None:
+    code = build_stub_from_text('stub vision memory outputs 200 8 pipeline 0 64 sync classify ( int8 x ) : int8')\
+        .as_c_code()
+    assert 'middlewareReadBlocking(ADDR_SKELETON_INPUTS+0' not in code
+    assert 'middlewareReadBlocking(skeleton_banks[i%2]+0' not in code
+    assert 'middlewareReadBlocking(ADDR_SKELETON_OUTPUTS+0, (uint8_t*)(results+i)+0, 1);' in code
+
+
+def test_stub_without_memory_map_reads_results_from_the_inputs() -> None:
+    code = build_stub_from_text('stub vision sync classify ( int8 x ) : int8').as_c_code()
+    assert 'ADDR_SKELETON_OUTPUTS' not in code
+    assert 'middlewareReadBlocking(ADDR_SKELETON_INPUTS+0, (uint8_t*)(&_result)+0, 1);' in code
+
+
+def test_deploy_asserts_that_no_session_is_open() -> None:
+    code = build_stub_from_text('stub test session deploy 47 4000 sync foo () : void').as_c_code()
+    assert 'bool test_deploy(void)\n{\n   assert(!session_is_open);\n   middlewareInit();\n' in code
+    code = build_stub_from_text('stub test session deploy 47 4000 deploy 48 8000 sync foo () : void').as_c_code()
+    assert 'bool test_select(uint64_t accelerator_id)\n{\n   assert(!session_is_open);\n' in code
+    assert 'assert' not in build_stub_from_text('stub test deploy 47 4000 sync foo () : void').as_c_code()
@@ -0,0 +1,76 @@
+import json
+import pstats
+
+import pytest
+
+from elasticai.stubgen import main, timings
+from elasticai.stubgen.parser import Parser
+from elasticai.stubgen.timings import STAGES, time_stub_generation, write_timings_json
+
+IDL_TEXT = """
+stub traffic
+sync predict ( int8[6] inputs, bool more_inputs ) : int8
+"""
+
+
+def test_every_stage_is_timed_and_the_stub_is_written(tmp_path):
+    idl_file = tmp_path / 'traffic.idl'
+    idl_file.write_text(IDL_TEXT)
+    timings = time_stub_generation(str(idl_file))
+    assert [timing.stage for timing in timings] == list(STAGES)
+    assert all(timing.seconds > 0 for timing in timings)
+    assert all(timing.peak_bytes > 0 for timing in timings)
+    assert 'int8_t traffic_predict(const int8_t *inputs, bool more_inputs)' in (tmp_path / 'traffic.c').read_text()
+    assert 'int8_t traffic_predict(const int8_t *inputs, bool more_inputs);' in (tmp_path / 'traffic.h').read_text()
+
+
+def test_timings_are_written_as_json(tmp_path):
+    idl_file = tmp_path / 'traffic.idl'
+    idl_file.write_text(IDL_TEXT)
+    report_file = tmp_path / 'timings.json'
+    write_timings_json(time_stub_generation(str(idl_file)), str(idl_file), str(report_file))
+    report = json.loads(report_file.read_text())
+    assert report['idl_file'] == str(idl_file)
+    assert [stage['stage'] for stage in report['stages']] == list(STAGES)
+    assert set(report['stages'][0]) == {'stage', 'seconds', 'peak_bytes'}
+
+
+def test_profile_dumps_statistics_of_the_generation(tmp_path, monkeypatch, capsys):
+    (tmp_path / 'traffic.idl').write_text(IDL_TEXT)
+    profile_file = tmp_path / 'generation.prof'
+    monkeypatch.setattr(main, 'argv', ['stubgen', str(tmp_path / 'traffic'), '--profile', str(profile_file)])
+    main._main()
+    assert 'Success' in capsys.readouterr().out
+    functions = [function for _, _, function in pstats.Stats(str(profile_file)).stats]
+    assert '_generate_stub_files' in functions
+
+
+def test_errors_of_the_idl_file_are_reported_with_file_and_source(tmp_path, monkeypatch, capsys):
+    (tmp_path / 'traffic.idl').write_text('stub traffic\nsync predict ( int8 for ) : int8\n')
+    monkeypatch.setattr(main, 'argv', ['stubgen', str(tmp_path / 'traffic'), '--timings'])
+    with pytest.raises(SystemExit):
+        main._main()
+    output = capsys.readouterr().out
+    assert f"{tmp_path / 'traffic.idl'}:2:21: error: Parameter 'for'" in output
+    assert 'sync predict ( int8 for ) : int8' in output
+
+
+def test_timings_cannot_be_combined_with_several_files(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        main._parse_arguments(['--timings-json', 'timings.json', '--batch', str(tmp_path)])
+    assert '--timings and --timings-json only work for a single IDL file' in capsys.readouterr().err
+
+
+def test_parser_build_generates_the_tables_instead_of_loading_the_cache(tmp_path, monkeypatch):
+    idl_file = tmp_path / 'traffic.idl'
+    idl_file.write_text(IDL_TEXT)
+    cache_ids = []
+
+    class RecordingParser(Parser):
+        def __init__(self, cache_id=Parser.CACHE_ID):
+            cache_ids.append(cache_id)
+            super().__init__(cache_id)
+
+    monkeypatch.setattr(timings, 'Parser', RecordingParser)
+    time_stub_generation(str(idl_file))
+    assert cache_ids == [None, None]
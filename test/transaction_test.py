@@ -0,0 +1,416 @@
+import shutil
+
+import pytest
+
+from simulation import SimulationHarness
+
+MAIN_CODE = """
+#include <stdio.h>
+#include "middleware.h"
+#include "echo.h"
+
+int main(void)
+{
+    mockResetStatistics();
+    int64_t result = echo_identity(0x0102030405060708LL);
+    mock_statistics_t statistics = mockStatistics();
+    printf("%lld %u %u\\n", (long long)result, statistics.read_transactions, statistics.bytes_read);
+    return 0;
+}
+"""
+
+pytestmark = [pytest.mark.simulation,
+              pytest.mark.skipif(shutil.which('gcc') is None, reason='needs gcc to compile the stubs')]
+
+
+def compile_and_run(tmp_path, idl_text: str, main_code: str, defines=()) -> str:
+    return SimulationHarness(tmp_path).compile_and_run(idl_text, main_code, defines)
+
+
+def run_against_mock_middleware(tmp_path, idl_text: str):
+    output = compile_and_run(tmp_path, idl_text, MAIN_CODE)
+    result, read_transactions, bytes_read = (int(value) for value in output.split())
+    return result, read_transactions, bytes_read
+
+
+def test_result_is_read_with_a_single_transaction(tmp_path):
+    idl_text = 'stub echo sync identity ( int64 value ) : int64'
+    assert run_against_mock_middleware(tmp_path, idl_text) == (0x0102030405060708, 1, 8)
+
+
+def test_aligned_reads_use_one_transaction_per_word(tmp_path):
+    idl_text = 'stub echo read aligned 4 sync identity ( int64 value ) : int64'
+    assert run_against_mock_middleware(tmp_path, idl_text) == (0x0102030405060708, 2, 8)
+
+
+ASYNC_MAIN_CODE = """
+#include <stdio.h>
+#include "echo.h"
+
+static int64_t reported = 0;
+
+static void on_done(int64_t result) { reported = result; }
+
+int main(void)
+{
+    bool started = echo_identity_start(42, on_done);
+    bool started_twice = echo_identity_start(7, NULL);
+    while (!echo_identity_poll());
+    printf("%d %d %lld %lld\\n", started, started_twice, (long long)echo_identity_result(), (long long)reported);
+    return 0;
+}
+"""
+
+
+def test_async_function_reports_result_through_poll_and_callback(tmp_path):
+    output = compile_and_run(tmp_path, 'stub echo async identity ( int64 value ) : int64', ASYNC_MAIN_CODE)
+    assert output.split() == ['1', '0', '42', '42']
+
+
+BATCH_MAIN_CODE = """
+#include <stdio.h>
+#include "middleware.h"
+#include "echo.h"
+
+int main(void)
+{
+    const int64_t values[3] = {3, -4, 5};
+    int64_t results[3] = {0};
+    mockResetStatistics();
+    echo_identity_batch(values, 3, results);
+    mock_statistics_t statistics = mockStatistics();
+    printf("%lld %lld %lld %u\\n", (long long)results[0], (long long)results[1], (long long)results[2],
+           statistics.read_transactions);
+    return 0;
+}
+"""
+
+
+def test_batch_variant_processes_all_samples(tmp_path):
+    output = compile_and_run(tmp_path, 'stub echo sync identity ( int64 value ) : int64 batch 8', BATCH_MAIN_CODE)
+    assert output.split() == ['3', '-4', '5', '3']
+
+
+PIPELINED_MAIN_CODE = BATCH_MAIN_CODE.replace('echo_identity_batch', 'echo_identity_pipelined')
+
+
+def test_pipelined_variant_returns_results_in_order(tmp_path):
+    idl_text = 'stub echo pipeline 0 64 sync identity ( int64 value ) : int64'
+    output = compile_and_run(tmp_path, idl_text, PIPELINED_MAIN_CODE)
+    assert output.split() == ['3', '-4', '5', '3']
+
+
+TIMEOUT_MAIN_CODE = """
+#include <stdio.h>
+#include "echo.h"
+
+static uint32_t now_ms = 0;
+
+uint32_t echo_millis(void) { return now_ms++; }
+void echo_yield(void) {}
+
+int main(void)
+{
+    int64_t polled = 0, yielded = 0;
+    bool polled_ok = echo_identity(42, &polled);
+    bool yielded_ok = echo_twice(7, &yielded);
+    printf("%d %lld %d %lld\\n", polled_ok, (long long)polled, yielded_ok, (long long)yielded);
+    return 0;
+}
+"""
+
+
+def test_wait_strategies_with_timeout_return_results_through_pointer(tmp_path):
+    idl_text = """stub echo wait backoff 8 timeout 50
+    sync identity ( int64 value ) : int64
+    sync twice ( int64 value ) : int64 wait yield"""
+    output = compile_and_run(tmp_path, idl_text, TIMEOUT_MAIN_CODE)
+    assert output.split() == ['1', '42', '1', '7']
+
+
+TIMED_OUT_MAIN_CODE = """
+#include <stdio.h>
+#include "middleware.h"
+#include "echo.h"
+
+int main(void)
+{
+    int64_t result = 0;
+    mockConfigure((mock_config_t){ 100, 0, 5000000 });
+    bool succeeded = echo_identity(42, &result);
+    printf("%d %d\\n", succeeded, middlewareUserlogicGetBusyStatus());
+    return 0;
+}
+"""
+
+
+def test_wait_gives_up_when_computation_exceeds_timeout(tmp_path):
+    idl_text = 'stub echo wait poll 1 timeout 2 sync identity ( int64 value ) : int64'
+    assert compile_and_run(tmp_path, idl_text, TIMED_OUT_MAIN_CODE).split() == ['0', '1']
+
+
+def test_profile_reports_transactions_and_modeled_latency_per_call(tmp_path):
+    harness = SimulationHarness(tmp_path, transaction_cost_ns=100, byte_cost_ns=10, compute_latency_ns=1000)
+    reports = harness.profile('stub echo sync identity ( int64 value ) : int64 sync ping () : void')
+    assert [report.function for report in reports] == ['echo_identity', 'echo_ping']
+    identity = reports[0]
+    assert (identity.write_transactions, identity.read_transactions) == (4, 1)
+    assert (identity.bytes_written, identity.bytes_read) == (11, 8)
+    assert identity.modeled_ns >= 1000 + 5 * 100 + 19 * 10
+
+
+def test_polling_trades_status_reads_for_latency(tmp_path):
+    idl_text = """stub echo
+    sync spinning () : void
+    sync polling () : void wait poll 1"""
+    harness = SimulationHarness(tmp_path, transaction_cost_ns=1000, compute_latency_ns=100000)
+    spinning, polling = harness.profile(idl_text)
+    assert spinning.status_reads > 50
+    assert polling.status_reads == 2
+    assert spinning.modeled_ns < polling.modeled_ns
+
+
+OUTPUT_PARAMETERS_MAIN_CODE = """
+#include <stdio.h>
+#include "echo.h"
+
+static const int16_t weights[4] = {1, -2, 3, -4};
+
+int main(void)
+{
+    int16_t copied[4] = {0}, returned[4] = {0};
+    int64_t state[2] = {5, 6};
+    echo_copy(weights, copied);
+    echo_identity(weights, returned);
+    echo_update(state);
+    printf("%d %d %d %d %lld %lld\\n", copied[1], copied[3], returned[0], returned[2],
+           (long long)state[0], (long long)state[1]);
+    return 0;
+}
+"""
+
+
+def test_outputs_are_read_straight_into_caller_memory(tmp_path):
+    idl_text = """stub echo
+    sync copy ( int16[4] x, out int16[4] y ) : void
+    sync identity ( int16[4] x ) : int16[4]
+    sync update ( inout int64[2] state ) : void"""
+    output = compile_and_run(tmp_path, idl_text, OUTPUT_PARAMETERS_MAIN_CODE)
+    assert output.split() == ['-2', '-4', '1', '3', '5', '6']
+
+
+SELECT_MAIN_CODE = """
+#include <stdio.h>
+#include "middleware.h"
+#include "models.h"
+
+int main(void)
+{
+    mockConfigure((mock_config_t){ 0, 0, 0, 12000000 });
+    mockAddBitstream(4000, 47);
+    mockAddBitstream(8000, 48);
+    bool first = models_select(47);
+    bool again = models_select(47);
+    uint32_t configurations = mockStatistics().configurations;
+    uint64_t switched_ns = mockNowNs();
+    bool other = models_select(48);
+    printf("%d %d %d %u %u %llu %d %d %d\\n", first, again, other, configurations,
+           mockStatistics().configurations, (unsigned long long)(mockNowNs() - switched_ns) / 1000000,
+           models_is_resident(47), models_is_resident(48), models_select(99));
+    return 0;
+}
+"""
+
+
+def test_select_reconfigures_only_if_another_design_is_loaded(tmp_path):
+    idl_text = """stub models
+    deploy 47 4000
+    deploy 48 8000
+    sync predict ( int8 x ) : int8"""
+    output = compile_and_run(tmp_path, idl_text, SELECT_MAIN_CODE)
+    # the second design answers after the first poll past the 12 ms configuration latency
+    assert output.split() == ['1', '1', '1', '1', '2', '15', '0', '1', '0']
+
+
+PROFILE_MAIN_CODE = """
+#include <stdio.h>
+#include "middleware.h"
+#include "echo.h"
+
+int main(void)
+{
+    mockConfigure((mock_config_t){ 1000, 0, 100000 });
+    echo_predict(1);
+    echo_predict(2);
+    for (int phase = 0; phase < ECHO_PHASES; phase++) {
+        const echo_phase_stats_t *stats = echo_profile(ECHO_PREDICT, phase);
+        printf("%u %llu %u\\n", stats->calls, (unsigned long long)stats->total_cycles, stats->max_cycles);
+    }
+    return 0;
+}
+"""
+
+
+def test_profiled_stub_records_cycles_per_phase(tmp_path):
+    idl_text = 'stub echo profile sync predict ( int8 x ) : int8'
+    output = compile_and_run(tmp_path, idl_text, PROFILE_MAIN_CODE,
+                             ['STUB_PROFILE', 'STUB_PROF_CYCLES()=((uint32_t)mockNowNs())'])
+    init, transfer, start, wait, read = (tuple(int(value) for value in line.split()) for line in output.splitlines())
+    assert init == (2, 0, 0)
+    assert transfer == (2, 2000, 1000)
+    assert start == (2, 2000, 1000)
+    assert wait[0] == 2 and wait[2] >= 100000
+    assert read == (2, 4000, 2000)
+
+
+def test_profiling_is_compiled_out_by_default(tmp_path):
+    idl_text = 'stub echo profile sync predict ( int8 x ) : int8'
+    output = compile_and_run(tmp_path, idl_text, PROFILE_MAIN_CODE)
+    assert output.split() == ['0'] * 15
+
+
+BYTE_ORDER_MAIN_CODE = """
+#include <stdio.h>
+#include "middleware.h"
+#include "echo.h"
+
+int main(void)
+{
+    int32_t result = echo_identity(1, 0x01020304);
+    uint8_t *skeleton = mockSkeletonMemory();
+    printf("%d %d %d %d %d %x\\n", skeleton[0], skeleton[4], skeleton[5], skeleton[6], skeleton[7], result);
+    return 0;
+}
+"""
+
+
+def test_values_are_aligned_and_sent_in_skeleton_byte_order(tmp_path):
+    idl_text = 'stub echo bus 32 big sync identity ( int8 flag, int32 value ) : int8'
+    output = compile_and_run(tmp_path, idl_text, BYTE_ORDER_MAIN_CODE)
+    assert output.split() == ['1', '1', '2', '3', '4', '1']
+
+
+RESULT_BYTE_ORDER_MAIN_CODE = """
+#include <stdio.h>
+#include <string.h>
+#include "middleware.h"
+#include "echo.h"
+
+int main(void)
+{
+    memcpy(mockSkeletonMemory() + 200, (const uint8_t[]){0x0a, 0x0b, 0x0c, 0x0d}, 4);
+    int32_t result = echo_identity(1, 0x01020304);
+    printf("%x\\n", result);
+    return 0;
+}
+"""
+
+
+def test_results_are_read_back_in_host_byte_order(tmp_path):
+    # the skeleton holds a big endian result in its output region, away from the parameters
+    idl_text = 'stub echo bus 32 big memory outputs 200 4 sync identity ( int32 flag, int32 value ) : int32'
+    output = compile_and_run(tmp_path, idl_text, RESULT_BYTE_ORDER_MAIN_CODE)
+    assert output.split() == ['a0b0c0d']
+
+
+DMA_MAIN_CODE = """
+#include <stdio.h>
+#include "middleware.h"
+#include "echo.h"
+
+int main(void)
+{
+    static int8_t image[96];
+    image[95] = 42;
+    mockConfigure((mock_config_t){ 100, 10, 0 });
+    echo_fill(image, 7);
+    mock_statistics_t s = mockStatistics();
+    printf("%u %u %d %llu\\n", s.dma_transfers, s.write_transactions, mockSkeletonMemory()[95],
+           (unsigned long long)s.modeled_ns);
+    return 0;
+}
+"""
+
+
+def test_large_arrays_are_sent_by_dma_while_scalars_are_written(tmp_path):
+    idl_text = 'sync fill ( int8[96] image, int32 scale ) : void'
+    blocking = compile_and_run(tmp_path, f'stub echo {idl_text}', DMA_MAIN_CODE).split()
+    dma = compile_and_run(tmp_path, f'stub echo dma 64 {idl_text}', DMA_MAIN_CODE).split()
+    assert blocking[:3] == ['0', '4', '42']
+    assert dma[:3] == ['1', '3', '42']
+    # the write of scale overlaps the transfer of the image
+    assert int(dma[3]) == int(blocking[3]) - 140
+
+
+TENSOR_MAIN_CODE = """
+#include <stdio.h>
+#include "echo.h"
+
+int main(void)
+{
+    uint8_t image[2][3] = {{1, 2, 3}, {4, 5, 200}};
+    uint8_t copy[2][3] = {{0}};
+    echo_copy(image, copy);
+    printf("%d %d %d\\n", copy[0][1], copy[1][0], copy[1][2]);
+    return 0;
+}
+"""
+
+
+def test_arrays_with_several_dimensions_are_transferred_row_by_row(tmp_path):
+    idl_text = 'stub echo sync copy ( uint8[2][3] image, out uint8[2][3] copy ) : void'
+    assert compile_and_run(tmp_path, idl_text, TENSOR_MAIN_CODE).split() == ['2', '4', '200']
+
+
+MEMORY_MAP_MAIN_CODE = """
+#include <stdio.h>
+#include "middleware.h"
+#include "echo.h"
+
+int main(void)
+{
+    static int8_t image[500];
+    image[499] = 42;
+    mockSkeletonMemory()[600] = 7;
+    int8_t label = echo_classify(image);
+    mock_statistics_t s = mockStatistics();
+    printf("%d %d %u\\n", label, mockSkeletonMemory()[499], s.computations);
+    return 0;
+}
+"""
+
+
+def test_results_are_read_from_the_output_region_of_the_memory_map(tmp_path):
+    idl_text = 'stub echo memory inputs 0 512 control 512 outputs 600 8 sync classify ( int8[500] image ) : int8'
+    output = compile_and_run(tmp_path, idl_text, MEMORY_MAP_MAIN_CODE, ['MOCK_ADDR_COMPUTATION_ENABLE=512'])
+    assert output.split() == ['7', '42', '1']
+
+
+INTERRUPT_MAIN_CODE = """
+#include <stdio.h>
+#include "middleware.h"
+#include "echo.h"
+
+static unsigned wake_ups = 0;
+
+bool echo_wait_for_completion(uint32_t timeout_ms)
+{
+    /* the first wake-up is spurious, the HWA is still busy */
+    if (wake_ups++ == 0)
+        return false;
+    return timeout_ms == STUB_WAIT_FOREVER && mockWaitForCompletion(timeout_ms);
+}
+
+int main(void)
+{
+    mockConfigure((mock_config_t){ 100, 0, 5000000 });
+    int64_t result = echo_identity(42);
+    printf("%u %d\\n", wake_ups, middlewareUserlogicGetBusyStatus());
+    return result == 42 ? 0 : 1;
+}
+"""
+
+
+def test_interrupt_without_timeout_waits_until_the_hook_reports_completion(tmp_path):
+    idl_text = 'stub echo wait interrupt sync identity ( int64 value ) : int64'
+    assert compile_and_run(tmp_path, idl_text, INTERRUPT_MAIN_CODE).split() == ['2', '0']
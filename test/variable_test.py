@@ -0,0 +1,33 @@
+import pytest
+
+from elasticai.stubgen.variable import ShapedVariable, Variable
+
+
+def test_type_table_provides_c_type_size_and_alignment():
+    int16 = Variable.Type('int16')
+    assert (int16.as_c_code(), int16.get_length_in_byte(), int16.get_alignment_in_byte()) == ('int16_t', 2, 2)
+
+
+def test_variable_is_immutable_and_has_no_instance_dict():
+    variable = Variable(Variable.Type.INT8, 'speed', 6)
+    with pytest.raises(AttributeError):
+        variable.elements = 7
+    assert not hasattr(variable, '__dict__')
+
+
+def test_identifiers_are_interned():
+    first = Variable(Variable.Type.INT8, ''.join(['spe', 'ed']))
+    second = Variable(Variable.Type.INT8, ''.join(['sp', 'eed']))
+    assert first.identifier is second.identifier
+
+
+def test_arrays_with_several_dimensions_keep_their_shape_in_signatures():
+    image = ShapedVariable(Variable.Type.INT8, 'image', (28, 28))
+    maps = ShapedVariable(Variable.Type.INT16, 'maps', (2, 3, 4), Variable.Scope.OUTPUT)
+    assert (image.elements, image.get_length_in_byte()) == (784, 784)
+    assert image.as_parameter_in_signature() == 'const int8_t image[28][28]'
+    assert image.as_batch_parameter_in_signature() == 'const int8_t *image'
+    assert maps.as_parameter_in_signature() == 'int16_t maps[2][3][4]'
+    with pytest.raises(AttributeError):
+        image.shape = (784,)
+    assert Variable(Variable.Type.INT8, 'logits', 10).shape is None
@@ -0,0 +1,90 @@
+import os
+import sys
+
+import pytest
+
+from elasticai.stubgen.main import _generate_stub_files
+from elasticai.stubgen.watch import InotifyWatcher, PollingWatcher, StubWatcher
+
+IDL_TEXT = """
+stub traffic
+sync predict ( int8[6] inputs, bool more_inputs ) : int8
+"""
+
+
+class FakeWatcher:
+
+    def __init__(self, *batches) -> None:
+        self.batches = list(batches)
+
+    def wait_for_changes(self, timeout):
+        return self.batches.pop(0) if self.batches else set()
+
+    def close(self) -> None:
+        pass
+
+
+def test_polling_watcher_reports_new_and_modified_idl_files(tmp_path):
+    existing = tmp_path / 'existing.idl'
+    existing.write_text(IDL_TEXT)
+    watcher = PollingWatcher([str(tmp_path)], interval=0.01)
+    assert watcher.wait_for_changes(0) == set()
+    added = tmp_path / 'added.idl'
+    added.write_text(IDL_TEXT)
+    os.utime(existing, (0, 0))
+    (tmp_path / 'notes.txt').write_text('ignored')
+    assert watcher.wait_for_changes(0) == {str(existing), str(added)}
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is only available on linux')
+def test_inotify_watcher_reports_written_idl_files(tmp_path):
+    watcher = InotifyWatcher([str(tmp_path)])
+    try:
+        (tmp_path / 'traffic.idl').write_text(IDL_TEXT)
+        (tmp_path / 'notes.txt').write_text('ignored')
+        assert watcher.wait_for_changes(1.0) == {str(tmp_path / 'traffic.idl')}
+    finally:
+        watcher.close()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is only available on linux')
+def test_inotify_watcher_follows_directories_moved_into_the_tree(tmp_path):
+    watched, outside = tmp_path / 'watched', tmp_path / 'outside'
+    (outside / 'models').mkdir(parents=True)
+    (outside / 'models' / 'traffic.idl').write_text(IDL_TEXT)
+    watched.mkdir()
+    watcher = InotifyWatcher([str(watched)])
+    try:
+        (watched / 'vanished').mkdir()
+        (watched / 'vanished').rmdir()
+        os.rename(outside, watched / 'moved')
+        assert watcher.wait_for_changes(1.0) == {str(watched / 'moved' / 'models' / 'traffic.idl')}
+        (watched / 'moved' / 'models' / 'signs.idl').write_text(IDL_TEXT)
+        assert watcher.wait_for_changes(1.0) == {str(watched / 'moved' / 'models' / 'signs.idl')}
+    finally:
+        watcher.close()
+
+
+def test_bursts_of_changes_are_regenerated_once(tmp_path):
+    idl_file = str(tmp_path / 'traffic.idl')
+    (tmp_path / 'traffic.idl').write_text(IDL_TEXT)
+    calls = []
+
+    def generate(name: str):
+        calls.append(name)
+        return _generate_stub_files(name)
+
+    stub_watcher = StubWatcher(FakeWatcher({idl_file}, {idl_file}, {idl_file}), generate, debounce=0)
+    results = stub_watcher.run_once(0)
+    assert calls == [idl_file]
+    assert results[0].succeeded
+    assert (tmp_path / 'traffic.c').exists()
+
+
+def test_parse_errors_are_reported_without_stopping(tmp_path):
+    broken = tmp_path / 'broken.idl'
+    broken.write_text('stub broken sync ( : void')
+    stub_watcher = StubWatcher(FakeWatcher({str(broken)}), _generate_stub_files, debounce=0)
+    results = stub_watcher.run_once(0)
+    assert not results[0].succeeded
+    assert stub_watcher.run_once(0) == []